@@ -0,0 +1,169 @@
+import os
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+# 图片文件名要么由内容哈希得到，要么是上传时生成的 UUID，同一 URL 的内容不会改变
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ETagCache:
+    """按 (路径, 修改时间, 大小) 缓存文件内容的 sha256，同一文件只读取计算一次"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, stat: os.stat_result) -> str:
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                digest.update(block)
+        etag = f'"{digest.hexdigest()[:32]}"'
+
+        with self._lock:
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+
+etag_cache = ETagCache()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较"""
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP 日期只精确到秒
+    return int(mtime) <= since
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围
+
+    Returns:
+        (起始, 结束) 闭区间；不支持的格式（如多段范围）返回 None，按完整响应处理
+
+    Raises:
+        ValueError: 范围无法满足
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    start_text, sep, end_text = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_text == "":
+            # 后缀范围：最后 N 个字节
+            length = int(end_text)
+            # 空文件没有可返回的字节
+            if length <= 0 or size == 0:
+                raise ValueError("无法满足的范围")
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        if start_text.isdigit() or end_text.isdigit():
+            raise
+        return None
+
+    if start >= size or end < start:
+        raise ValueError("无法满足的范围")
+    return start, min(end, size - 1)
+
+
+def _read_range(path: Path, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+async def cached_file_response(request: Request,
+                               path: Path,
+                               media_type: Optional[str] = None) -> Response:
+    """
+    返回带缓存头的文件响应
+    支持强 ETag、Last-Modified、If-None-Match / If-Modified-Since 返回 304，
+    以及单段 Range / If-Range 请求返回 206
+
+    Args:
+        request: 当前请求
+        path: 文件路径（调用方已确认存在）
+        media_type: 响应类型，默认按扩展名推断
+    """
+    stat = path.stat()
+    etag = await run_in_threadpool(etag_cache.get, path, stat)
+    media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and _not_modified_since(if_modified_since, stat.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range 只接受强 ETag；日期形式按不匹配处理，直接返回完整内容
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{stat.st_size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            content = await run_in_threadpool(_read_range, path, start, end)
+            return Response(
+                content=content,
+                status_code=206,
+                media_type=media_type,
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{stat.st_size}"}
+            )
+
+    return FileResponse(
+        path=str(path),
+        media_type=media_type,
+        filename=path.name,
+        headers=headers,
+        stat_result=stat
+    )
@@ -1,11 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 class QueryRequest(BaseModel):
     """查询请求模型"""
     input: str = Field(..., description="用户输入的文本", min_length=1, max_length=2000)
     userid: str = Field(default="123", description="用户ID")
     img_url: Optional[str] = Field(default="", description="图片URL，用于多模态对话")
+    conversation_id: Optional[str] = Field(default=None, description="对话ID，提供时带上该对话最近的历史消息")
 
 class PlantUMLResult(BaseModel):
     """PlantUML 处理结果模型"""
@@ -14,6 +15,8 @@ class PlantUMLResult(BaseModel):
     image_url: Optional[str] = Field(default=None, description="图片访问URL")
     success: bool = Field(default=False, description="处理是否成功")
     error: Optional[str] = Field(default=None, description="错误信息")
+    diagram_type: Optional[str] = Field(default=None, description="图表类型")
+    index: Optional[int] = Field(default=None, description="图在回复中的序号（从 0 开始）")
 
 class QueryResponse(BaseModel):
     """查询响应模型"""
@@ -21,7 +24,8 @@ class QueryResponse(BaseModel):
     userid: str = Field(..., description="用户ID")
     success: bool = Field(..., description="请求是否成功")
     error: Optional[str] = Field(default=None, description="错误信息")
-    plantuml_result: Optional[PlantUMLResult] = Field(default=None, description="PlantUML 处理结果")
+    plantuml_result: Optional[PlantUMLResult] = Field(default=None, description="第一张成功生成的图的处理结果（都失败时为第一张图的结果）")
+    plantuml_results: List[PlantUMLResult] = Field(default_factory=list, description="所有图的 PlantUML 处理结果")
 
 class HealthResponse(BaseModel):
     """健康检查响应模型"""
@@ -32,5 +36,6 @@ class HealthResponse(BaseModel):
 class ImageListResponse(BaseModel):
     """图片列表响应模型"""
     images: list = Field(..., description="图片文件列表")
-    total: int = Field(..., description="图片总数")
+    total: int = Field(..., description="满足过滤条件的图片总数")
+    next_cursor: Optional[str] = Field(default=None, description="下一页游标，没有更多数据时为空")
     success: bool = Field(..., description="请求是否成功") 
\ No newline at end of file
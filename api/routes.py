@@ -1,47 +1,121 @@
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Depends
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Depends, Query
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from .models import QueryRequest, QueryResponse, HealthResponse, PlantUMLResult, ImageListResponse
-from llm.doubao_flash import DOUBAO_SEED_1_6_FLASH
-from llm.deepseekv3 import DeepSeekV3Client
-from llm.ollama_client import OllamaClient
+from llm.clients import get_deepseek_client
+from llm.response_cache import response_cache
+from llm.semantic_cache import semantic_cache, make_namespace
+from llm.single_flight import single_flight
+from llm.router import model_router, TEXT, MULTIMODAL
+from llm.hedging import hedged_streamer
+from llm.rate_limiter import rate_limiter
+from llm.tokens import estimate_tokens
+from llm.context import conversation_context
 from llm.system_prompts import MAIN, MAIN_IMG
-from util.plantuml_service import plantuml_service
+from util.plantuml_service import plantuml_service, RenderPriority, RenderQueueFullError
+from util.plantuml_validator import format_validation_errors
+from util.retention import retention_service
 from database.services import DatabaseService
 from database.connection import get_db
 from .logger import conversation_logger
-import json
+from .streaming import sse_event, stream_with_renders
+from .http_cache import cached_file_response
+from .warmup import readiness
 import time
 import uuid
 import shutil
-from typing import Generator, List, Dict, Any
+from typing import AsyncGenerator, List, Dict, Any, Optional
+from datetime import datetime
 from pathlib import Path
 from sqlalchemy.orm import Session
 
 router = APIRouter()
 
-# 初始化模型客户端
-doubao_client = DOUBAO_SEED_1_6_FLASH()
-deepseek_client = DeepSeekV3Client()
+# 直接返回图片字节时支持的输出格式
+IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
 
-# 初始化Ollama客户端 (可选)
-try:
-    from config import OLLAMA_BASE_URL, OLLAMA_MODEL_NAME
-    ollama_client = OllamaClient(OLLAMA_BASE_URL, OLLAMA_MODEL_NAME)
-    OLLAMA_AVAILABLE = True
-except Exception as e:
-    print(f"Ollama客户端初始化失败: {e}")
-    ollama_client = None
-    OLLAMA_AVAILABLE = False
+def render_queue_full(error: RenderQueueFullError) -> HTTPException:
+    """渲染队列已满时返回 503，并通过 Retry-After 告知客户端重试时间"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def get_cached_reply(model: str, system_prompt: str, user_input: str):
+    """
+    查找可复用的回复：先精确匹配，未命中再查相似请求索引
+
+    Returns:
+        (本次请求的缓存键, 命中的回复片段或 None)
+    """
+    cache_key = response_cache.make_key(model, system_prompt, user_input)
+    cached_chunks = await response_cache.get(cache_key)
+    if cached_chunks is not None:
+        return cache_key, cached_chunks
+
+    similar_key = semantic_cache.lookup(make_namespace(model, system_prompt), user_input)
+    if similar_key is not None:
+        cached_chunks = await response_cache.get(similar_key)
+        if cached_chunks is None:
+            # 精确缓存中的条目已过期或被淘汰
+            semantic_cache.remove(similar_key)
+    return cache_key, cached_chunks
+
+def index_cached_reply(model: str, system_prompt: str, user_input: str, cache_key: str):
+    """回复写入缓存后登记到相似请求索引"""
+    semantic_cache.add(make_namespace(model, system_prompt), user_input, cache_key)
+
+async def stream_text_reply(system_prompt: str, user_input: str) -> AsyncGenerator[str, None]:
+    """
+    文本模型的单轮回复：相同或相似的请求回放缓存，同时到达的相同请求共用一次模型调用
+    提供方在真正调用模型时才通过熔断器选择，命中缓存或跟随其他请求时不占用探测名额；
+    回复按实际回复的模型写入缓存（对冲或失败切换后可能不是查找时首选的模型）
+    """
+    _, client = model_router.preferred(TEXT)
+    cache_key, cached_chunks = await get_cached_reply(client.model, system_prompt, user_input)
+    if cached_chunks is not None:
+        async for chunk in response_cache.replay(cached_chunks):
+            yield chunk
+        return
+
+    served = {}
+
+    def served_key() -> Optional[str]:
+        if "model" not in served:
+            return None
+        return response_cache.make_key(served["model"], system_prompt, user_input)
+
+    chunks = single_flight.stream(cache_key, lambda: response_cache.record(
+        served_key,
+        hedged_streamer.select_and_stream(TEXT, lambda c: c.chat_stream_async(
+            user_input=user_input,
+            system_prompt=system_prompt
+        ), prompt_tokens=estimate_tokens(system_prompt, user_input),
+            on_served=lambda provider, c: served.update(model=c.model)),
+        on_stored=lambda key: index_cached_reply(served["model"], system_prompt, user_input, key)
+    ))
+    async for chunk in chunks:
+        yield chunk
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口（存活检测，不依赖外部服务）"""
     return HealthResponse(
         status="healthy",
         message="服务运行正常",
         timestamp=time.strftime("%Y-%m-%d %H:%M:%S")
     )
 
+@router.get("/ready")
+async def readiness_check():
+    """就绪检测：启动预热完成且必需依赖（PlantUML、模型客户端）可用时返回 200，否则返回 503"""
+    status = readiness.get_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 @router.post("/query")
 async def query_stream(request: QueryRequest):
     """流式查询接口"""
@@ -68,63 +142,59 @@ async def query_stream(request: QueryRequest):
     
     # 根据是否有图片URL选择模型和调用方式
     if request.img_url and request.img_url.strip():
-        # 有图片时，优先尝试多模态对话（豆包模型），如果失败则降级为DeepSeek
-        def generate_response() -> Generator[str, None, None]:
+        # 有图片时，优先尝试多模态对话（由路由器选择支持图片的模型），如果失败则降级为文本模型
+        async def generate_response() -> AsyncGenerator[str, None]:
+            # 带 conversation_id 时附上该对话最近的历史
+            history = await conversation_context.build(request.userid, request.conversation_id)
+            history_texts = [message["content"] for message in history]
             try:
-                # 先尝试豆包多模态
-                full_response = ""
-                for chunk in doubao_client.chat_multimodal_stream(
+                # 先尝试多模态，PlantUML 代码块一完整就开始渲染
+                chunks = hedged_streamer.select_and_stream(MULTIMODAL, lambda c: c.chat_multimodal_stream_async(
                     text=request.input,
                     image_url=request.img_url,  # 现在已经是完整URL
-                    system_prompt=system_prompt
-                ):
-                    full_response += chunk
-                    yield f"data: {json.dumps({'chunk': chunk, 'userid': request.userid})}\n\n"
-                
-                # 处理完整的响应，提取 PlantUML 代码并转换为图片
-                plantuml_result = plantuml_service.process_llm_response(full_response, request.userid)
-                if plantuml_result["success"]:
-                    yield f"data: {json.dumps({'plantuml_result': plantuml_result, 'userid': request.userid})}\n\n"
+                    system_prompt=system_prompt,
+                    history=history
+                ), prompt_tokens=estimate_tokens(system_prompt, request.input, *history_texts))
+                chunks = conversation_context.remember(request.userid, request.conversation_id, request.input, chunks, request.img_url)
+                async for event in stream_with_renders(chunks, request.userid):
+                    yield sse_event({**event, 'userid': request.userid})
                     
             except Exception as e:
-                # 如果豆包失败，降级为DeepSeek处理
+                # 如果多模态失败（报错、超时或全部熔断），降级为文本模型处理
                 try:
                     enhanced_input = f"{request.input}\n\n(用户上传了图片: {request.img_url}，请根据图片内容和用户需求生成相应的UML图表)"
-                    full_response = ""
-                    for chunk in deepseek_client.chat_stream(
+                    chunks = hedged_streamer.select_and_stream(TEXT, lambda c: c.chat_stream_async(
                         user_input=enhanced_input,
-                        system_prompt=system_prompt
-                    ):
-                        full_response += chunk
-                        yield f"data: {json.dumps({'chunk': chunk, 'userid': request.userid})}\n\n"
-                    
-                    plantuml_result = plantuml_service.process_llm_response(full_response, request.userid)
-                    if plantuml_result["success"]:
-                        yield f"data: {json.dumps({'plantuml_result': plantuml_result, 'userid': request.userid})}\n\n"
+                        system_prompt=system_prompt,
+                        history=history
+                    ), prompt_tokens=estimate_tokens(system_prompt, enhanced_input, *history_texts))
+                    chunks = conversation_context.remember(request.userid, request.conversation_id, request.input, chunks, request.img_url)
+                    async for event in stream_with_renders(chunks, request.userid):
+                        yield sse_event({**event, 'userid': request.userid})
                         
                 except Exception as fallback_error:
-                    error_data = json.dumps({'error': f"多模态处理失败，降级处理也失败: {str(fallback_error)}", 'userid': request.userid})
-                    yield f"data: {error_data}\n\n"
+                    yield sse_event({'error': f"多模态处理失败，降级处理也失败: {str(fallback_error)}", 'userid': request.userid})
     else:
-        # 文本对话，使用DeepSeek模型
-        def generate_response() -> Generator[str, None, None]:
+        # 文本对话，默认使用DeepSeek模型，开启路由后选择当前最快的模型
+        async def generate_response() -> AsyncGenerator[str, None]:
             try:
-                full_response = ""
-                for chunk in deepseek_client.chat_stream(
-                    user_input=request.input,
-                    system_prompt=system_prompt
-                ):
-                    full_response += chunk
-                    yield f"data: {json.dumps({'chunk': chunk, 'userid': request.userid})}\n\n"
-                
-                # 处理完整的响应，提取 PlantUML 代码并转换为图片
-                plantuml_result = plantuml_service.process_llm_response(full_response, request.userid)
-                if plantuml_result["success"]:
-                    yield f"data: {json.dumps({'plantuml_result': plantuml_result, 'userid': request.userid})}\n\n"
+                history = await conversation_context.build(request.userid, request.conversation_id)
+                if history:
+                    # 带历史的请求几乎不会重复，不经过回复缓存和请求合并
+                    chunks = hedged_streamer.select_and_stream(TEXT, lambda c: c.chat_stream_async(
+                        user_input=request.input,
+                        system_prompt=system_prompt,
+                        history=history
+                    ), prompt_tokens=estimate_tokens(system_prompt, request.input, *[message["content"] for message in history]))
+                else:
+                    # 相同或相似的请求直接回放缓存的回复，图片同样命中渲染缓存
+                    chunks = stream_text_reply(system_prompt, request.input)
+                chunks = conversation_context.remember(request.userid, request.conversation_id, request.input, chunks)
+                async for event in stream_with_renders(chunks, request.userid):
+                    yield sse_event({**event, 'userid': request.userid})
                     
             except Exception as e:
-                error_data = json.dumps({'error': str(e), 'userid': request.userid})
-                yield f"data: {error_data}\n\n"
+                yield sse_event({'error': str(e), 'userid': request.userid})
     
     return StreamingResponse(
         generate_response(),
@@ -149,42 +219,67 @@ async def query_sync(request: QueryRequest):
         # 选择系统提示词
         system_prompt = MAIN_IMG if request.img_url else MAIN
         
+        # 带 conversation_id 时附上该对话最近的历史
+        history = await conversation_context.build(request.userid, request.conversation_id)
+        history_texts = [message["content"] for message in history]
+        
         # 根据是否有图片URL选择模型和调用方式
         if request.img_url:
-            # 多模态对话，使用豆包模型
-            response = doubao_client.chat_multimodal(
+            # 多模态对话，默认使用豆包模型
+            chunks = hedged_streamer.select_and_stream(MULTIMODAL, lambda c: c.chat_multimodal_stream_async(
                 text=request.input,
                 image_url=request.img_url,
-                system_prompt=system_prompt
-            )
-        else:
-            # 文本对话，使用DeepSeek模型
-            response = deepseek_client.chat(
+                system_prompt=system_prompt,
+                history=history
+            ), prompt_tokens=estimate_tokens(system_prompt, request.input, *history_texts))
+            response = "".join([chunk async for chunk in chunks])
+        elif history:
+            # 带历史的请求不经过回复缓存和请求合并
+            chunks = hedged_streamer.select_and_stream(TEXT, lambda c: c.chat_stream_async(
                 user_input=request.input,
-                system_prompt=system_prompt
-            )
+                system_prompt=system_prompt,
+                history=history
+            ), prompt_tokens=estimate_tokens(system_prompt, request.input, *history_texts))
+            response = "".join([chunk async for chunk in chunks])
+        else:
+            # 文本对话，默认使用DeepSeek模型；与流式接口共用回复缓存和请求合并
+            response = "".join([chunk async for chunk in stream_text_reply(system_prompt, request.input)])
+        
+        if request.conversation_id and response:
+            await conversation_context.add_turn(request.userid, request.conversation_id, request.input, response, request.img_url)
         
-        # 处理响应，提取 PlantUML 代码并转换为图片
-        plantuml_result = plantuml_service.process_llm_response(response, request.userid)
+        # 处理响应，提取所有 PlantUML 代码并在一次渲染调用中转换为图片
+        plantuml_results = await plantuml_service.process_llm_response_all_async(response, request.userid)
         
-        # 构建 PlantUML 结果对象
-        plantuml_result_obj = None
-        if plantuml_result["success"]:
-            plantuml_result_obj = PlantUMLResult(
+        # 构建 PlantUML 结果对象；失败的图也返回，带上错误信息（如校验出的错误行）
+        plantuml_result_objs = [
+            PlantUMLResult(
                 plantuml_code=plantuml_result["plantuml_code"],
                 image_path=plantuml_result["image_path"],
                 image_url=plantuml_result["image_url"],
                 success=plantuml_result["success"],
-                error=plantuml_result["error"]
+                error=plantuml_result["error"],
+                diagram_type=plantuml_result["diagram_type"],
+                index=index
             )
+            for index, plantuml_result in enumerate(plantuml_results)
+            # 回复中没有图表代码时不算失败
+            if plantuml_result["plantuml_code"]
+        ]
         
         return QueryResponse(
             response=response,
             userid=request.userid,
             success=True,
-            plantuml_result=plantuml_result_obj
+            plantuml_result=next(
+                (result for result in plantuml_result_objs if result.success),
+                plantuml_result_objs[0] if plantuml_result_objs else None
+            ),
+            plantuml_results=plantuml_result_objs
         )
         
+    except RenderQueueFullError as e:
+        raise render_queue_full(e)
     except Exception as e:
         return QueryResponse(
             response="",
@@ -194,32 +289,141 @@ async def query_sync(request: QueryRequest):
         )
 
 @router.get("/images/{filename}")
-async def get_image(filename: str):
-    """获取生成的图片"""
+async def get_image(
+    filename: str,
+    request: Request,
+    size: str = Query(default="full", pattern="^(thumb|medium|full|svg)$")
+):
+    """获取生成的图片（支持 ETag / 304 / Range），size 可选 thumb、medium、full、svg"""
     image_path = Path("workspace/img") / filename
     
     if not image_path.exists():
         raise HTTPException(status_code=404, detail="图片不存在")
     
-    return FileResponse(
-        path=str(image_path),
-        media_type="image/png",
-        filename=filename
-    )
+    retention_service.touch(str(image_path))
+    if size != "full":
+        try:
+            variant_path = await plantuml_service.get_image_variant_async(filename, size)
+        except RenderQueueFullError as e:
+            raise render_queue_full(e)
+        if variant_path is None:
+            raise HTTPException(status_code=404, detail="该图片没有可用的 SVG 版本")
+        image_path = Path(variant_path)
+    
+    return await cached_file_response(request, image_path)
 
 @router.get("/images", response_model=ImageListResponse)
-async def list_images():
-    """列出所有生成的图片"""
+async def list_images(
+    userid: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=200)
+):
+    """分页列出生成的图片，可按用户和生成时间范围过滤"""
     try:
-        images = plantuml_service.list_generated_images()
+        page = plantuml_service.list_generated_images(
+            userid=userid,
+            start_time=start.timestamp() if start else None,
+            end_time=end.timestamp() if end else None,
+            cursor=cursor,
+            limit=limit
+        )
         return ImageListResponse(
-            images=images,
-            total=len(images),
+            images=page["images"],
+            total=page["total"],
+            next_cursor=page["next_cursor"],
             success=True
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取图片列表失败: {str(e)}")
 
+@router.get("/plantuml/stats")
+async def plantuml_stats():
+    """获取 PlantUML 渲染缓存与渲染后端的统计信息"""
+    return plantuml_service.get_stats()
+
+@router.get("/llm/cache/stats")
+async def llm_cache_stats():
+    """获取模型回复缓存的命中率等统计信息"""
+    return response_cache.get_stats()
+
+@router.delete("/llm/cache")
+async def clear_llm_cache():
+    """清空模型回复缓存"""
+    try:
+        removed = await response_cache.clear()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"清空缓存失败: {str(e)}")
+    # 相似请求索引指向的条目已不存在
+    semantic_cache.flush()
+    return {"success": True, "removed": removed}
+
+@router.get("/llm/single-flight/stats")
+async def single_flight_stats():
+    """获取相同请求并发合并的统计信息"""
+    return single_flight.get_stats()
+
+@router.get("/llm/router/stats")
+async def model_router_stats():
+    """获取各模型提供方的延迟、速度、错误率指标和当前选择顺序"""
+    return model_router.get_stats()
+
+@router.get("/llm/hedging/stats")
+async def hedging_stats():
+    """获取首个片段延迟对冲的统计信息（各提供方当前的对冲延迟、剩余预算）"""
+    return hedged_streamer.get_stats()
+
+@router.get("/llm/limits/stats")
+async def rate_limit_stats():
+    """获取各模型提供方的并发、排队和等待时间统计"""
+    return rate_limiter.get_stats()
+
+@router.get("/llm/context/stats")
+async def conversation_context_stats():
+    """多轮对话上下文构建统计"""
+    return conversation_context.get_stats()
+
+@router.get("/llm/semantic-cache")
+async def inspect_semantic_cache(
+    q: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=500)
+):
+    """查看相似请求索引；传入 q 时返回与之最相似的已缓存请求及相似度"""
+    result = {"stats": semantic_cache.get_stats()}
+    if q:
+        namespace = make_namespace(get_deepseek_client().model, MAIN)
+        result["matches"] = semantic_cache.search(namespace, q, limit=limit)
+    else:
+        result["entries"] = semantic_cache.list_entries(limit=limit)
+    return result
+
+@router.delete("/llm/semantic-cache")
+async def flush_semantic_cache():
+    """清空相似请求索引（不影响精确缓存）"""
+    return {"success": True, "removed": semantic_cache.flush()}
+
+@router.get("/retention/report")
+async def retention_report():
+    """演练一轮图片清理，返回将被删除的文件而不实际删除"""
+    try:
+        report = await run_in_threadpool(retention_service.plan)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"无法生成清理报告: {str(e)}")
+    report["dry_run"] = True
+    report["stats"] = retention_service.get_stats()
+    return report
+
+@router.post("/retention/run")
+async def run_retention():
+    """立即执行一轮图片清理（RETENTION_DRY_RUN 开启时只生成报告）"""
+    try:
+        return await run_in_threadpool(retention_service.run_once)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"图片清理失败: {str(e)}")
+
 @router.post("/plantuml/convert")
 async def convert_plantuml(request: dict):
     """直接转换 PlantUML 代码为图片"""
@@ -230,9 +434,10 @@ async def convert_plantuml(request: dict):
         raise HTTPException(status_code=400, detail="PlantUML 代码不能为空")
     
     try:
-        result = plantuml_service.process_llm_response(
+        result = await plantuml_service.process_llm_response_async(
             f"@startuml\n{plantuml_code}\n@enduml", 
-            userid
+            userid,
+            priority=RenderPriority.BULK
         )
         
         return {
@@ -242,9 +447,43 @@ async def convert_plantuml(request: dict):
             "error": result["error"]
         }
         
+    except RenderQueueFullError as e:
+        raise render_queue_full(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"转换失败: {str(e)}")
 
+@router.post("/plantuml/render")
+async def render_plantuml(request: dict):
+    """直接渲染 PlantUML 代码并在响应体中返回图片"""
+    plantuml_code = request.get("plantuml_code", "")
+    format = request.get("format", "png")
+    
+    if not plantuml_code.strip():
+        raise HTTPException(status_code=400, detail="PlantUML 代码不能为空")
+    if format not in IMAGE_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+    
+    if not plantuml_code.lstrip().lower().startswith("@startuml"):
+        plantuml_code = f"@startuml\n{plantuml_code}\n@enduml"
+    
+    validation = plantuml_service.validate_plantuml_code(plantuml_code)
+    if not validation["valid"]:
+        raise HTTPException(
+            status_code=422,
+            detail=f"PlantUML 语法错误: {format_validation_errors(validation['errors'])}"
+        )
+    
+    try:
+        image = await plantuml_service.render_image_bytes_async(
+            plantuml_code, format, priority=RenderPriority.BULK
+        )
+    except RenderQueueFullError as e:
+        raise render_queue_full(e)
+    if image is None:
+        raise HTTPException(status_code=422, detail="图片转换失败")
+    
+    return Response(content=image, media_type=IMAGE_MEDIA_TYPES[format])
+
 @router.post("/upload")
 async def upload_image(file: UploadFile = File(...)):
     """上传图片"""
@@ -286,18 +525,15 @@ async def upload_image(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 @router.get("/upload_images/{filename}")
-async def get_upload_image(filename: str):
-    """获取上传的图片"""
+async def get_upload_image(filename: str, request: Request):
+    """获取上传的图片（支持 ETag / 304 / Range）"""
     image_path = Path("workspace/upload_img") / filename
     
     if not image_path.exists():
         raise HTTPException(status_code=404, detail="图片不存在")
     
-    return FileResponse(
-        path=str(image_path),
-        media_type="image/*",
-        filename=filename
-    )
+    retention_service.touch(str(image_path))
+    return await cached_file_response(request, image_path)
 
 # 对话历史相关API
 @router.post("/conversations")
@@ -331,6 +567,7 @@ async def save_conversation(
                     "timestamp": message.get("timestamp"),
                     "image_file": message.get("imageFile"),
                     "plantuml_result": message.get("plantumlResult"),
+                    "plantuml_results": message.get("plantumlResults"),
                     "has_error": message.get("hasError", False),
                     "is_streaming": message.get("isStreaming", False)
                 }
@@ -369,6 +606,7 @@ async def get_conversations(db: Session = Depends(get_db)):
                     formatted_msg.update({
                         "imageFile": msg.meta_data.get("image_file"),
                         "plantumlResult": msg.meta_data.get("plantuml_result"),
+                        "plantumlResults": msg.meta_data.get("plantuml_results"),
                         "hasError": msg.meta_data.get("has_error", False),
                         "isStreaming": msg.meta_data.get("is_streaming", False)
                     })
@@ -0,0 +1,81 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Any, List, Optional, Set, Tuple
+from util.plantuml_service import plantuml_service, PlantUMLStreamExtractor, RenderPriority, RenderQueueFullError
+
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    """格式化一条 SSE 消息"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def stream_with_renders(chunks: AsyncIterator[str], userid: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    转发模型输出的同时增量提取 PlantUML 代码
+    每个代码块的 @enduml 一到达就开始渲染，多个代码块并行渲染，
+    且与剩余的输出（如总结段落）同时进行；每张图片就绪后立即产出
+    plantuml_result 事件，全部结束后再产出按顺序排列的 plantuml_results 事件。
+    校验或渲染失败的图同样产出（success 为 False，带 error、diagram_type 和 index），
+    前端据此提示具体的错误行
+
+    Args:
+        chunks: 模型输出的文本片段
+        userid: 用户ID
+
+    Yields:
+        {'chunk': ...}、{'plantuml_result': ...} 或 {'plantuml_results': [...]} 事件
+    """
+    extractor = PlantUMLStreamExtractor()
+    chunk_iter = chunks.__aiter__()
+    next_chunk: Optional[asyncio.Future] = asyncio.ensure_future(chunk_iter.__anext__())
+    render_tasks: Dict[asyncio.Future, Tuple[int, List[str]]] = {}
+    results: List[Optional[Dict[str, Any]]] = []
+
+    try:
+        while next_chunk is not None or render_tasks:
+            pending: Set[asyncio.Future] = set(render_tasks)
+            if next_chunk is not None:
+                pending.add(next_chunk)
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in [task for task in done if task in render_tasks]:
+                first_index, blocks = render_tasks.pop(task)
+                try:
+                    plantuml_results = task.result()
+                except RenderQueueFullError as e:
+                    # 渲染队列满时不中断文本输出，只把这些图标记为失败
+                    plantuml_results = [
+                        {'plantuml_code': block, 'success': False, 'diagram_type': None, 'error': str(e)}
+                        for block in blocks
+                    ]
+                for offset, plantuml_result in enumerate(plantuml_results):
+                    plantuml_result["index"] = first_index + offset
+                    results[first_index + offset] = plantuml_result
+                    yield {'plantuml_result': plantuml_result}
+
+            if next_chunk is not None and next_chunk in done:
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    next_chunk = None
+                    continue
+
+                next_chunk = asyncio.ensure_future(chunk_iter.__anext__())
+                yield {'chunk': chunk}
+
+                # 同一片段中完成的多个代码块合并为一次渲染调用
+                blocks = extractor.feed(chunk)
+                if blocks:
+                    task = asyncio.ensure_future(plantuml_service.render_plantuml_codes_async(
+                        blocks, userid, priority=RenderPriority.INTERACTIVE
+                    ))
+                    render_tasks[task] = (len(results), blocks)
+                    results.extend([None] * len(blocks))
+
+        finished = [result for result in results if result is not None]
+        if finished:
+            yield {'plantuml_results': finished}
+    finally:
+        for task in [next_chunk, *render_tasks]:
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import text
+from llm.clients import get_doubao_client, get_deepseek_client, get_ollama_client
+from llm.tokens import load_tokenizer
+from util.plantuml_service import plantuml_service
+from database.connection import SessionLocal
+from database.redis_client import redis_session_manager
+
+# 单个依赖检测的超时时间（秒）
+CHECK_TIMEOUT = 15
+
+
+class Readiness:
+    """
+    启动预热状态
+    进程启动后立即接收请求（存活），依赖在后台并行检测，全部必需依赖就绪后才算就绪
+    """
+
+    def __init__(self):
+        self.checks: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable[[], Any], required: bool = True):
+        """
+        注册一个依赖检测
+
+        Args:
+            name: 依赖名称
+            check: 阻塞的检测函数，返回 False 或抛出异常表示不可用，其他返回值作为详情
+            required: 是否为就绪的必要条件；可选依赖失败时服务降级运行
+        """
+        self.checks[name] = {
+            "check": check,
+            "required": required,
+            "status": "pending",
+            "detail": None,
+            "duration_ms": None,
+        }
+
+    async def _run_check(self, name: str):
+        entry = self.checks[name]
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.to_thread(entry["check"]), timeout=CHECK_TIMEOUT)
+            entry["status"] = "failed" if result is False else "ok"
+            entry["detail"] = None if isinstance(result, bool) else result
+        except asyncio.TimeoutError:
+            entry["status"] = "failed"
+            entry["detail"] = f"检测超时（{CHECK_TIMEOUT} 秒）"
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["detail"] = str(e)
+        entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        icon = "✓" if entry["status"] == "ok" else "⚠"
+        print(f"{icon} 预热 {name}: {entry['status']} ({entry['duration_ms']} ms)")
+
+    async def _run(self):
+        self.started_at = time.time()
+        await asyncio.gather(*(self._run_check(name) for name in self.checks))
+        self.finished_at = time.time()
+
+    def start(self):
+        """在后台启动所有检测，不等待结果"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def is_ready(self) -> bool:
+        """所有必需依赖都已检测通过"""
+        return all(
+            entry["status"] == "ok"
+            for entry in self.checks.values()
+            if entry["required"]
+        )
+
+    def get_status(self) -> Dict[str, Any]:
+        """就绪状态详情"""
+        return {
+            "ready": self.is_ready(),
+            "warming_up": self.finished_at is None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "checks": {
+                name: {key: value for key, value in entry.items() if key != "check"}
+                for name, entry in self.checks.items()
+            },
+        }
+
+
+def _check_plantuml():
+    result = plantuml_service.warm_up()
+    return result if result["installed"] else False
+
+
+def _create_llm_clients():
+    get_doubao_client()
+    get_deepseek_client()
+    return True
+
+
+def _check_database():
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        return True
+    finally:
+        db.close()
+
+
+def _load_tokenizer():
+    # 首次加载编码可能需要下载 BPE 文件，放在预热中完成，避免阻塞第一个请求
+    name = load_tokenizer()
+    if name == "estimate":
+        raise RuntimeError("tiktoken 编码不可用，按估算计数")
+    return name
+
+
+readiness = Readiness()
+readiness.register("plantuml", _check_plantuml)
+readiness.register("llm_clients", _create_llm_clients)
+readiness.register("database", _check_database, required=False)
+readiness.register("redis", redis_session_manager.ping, required=False)
+readiness.register("tokenizer", _load_tokenizer, required=False)
+readiness.register("ollama", lambda: get_ollama_client()._test_connection(), required=False)
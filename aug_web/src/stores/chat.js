@@ -121,8 +121,9 @@ export const useChatStore = defineStore('chat', () => {
       
       const requestData = {
         input: content,
-        userid: 'web_user_' + Date.now(),
-        img_url: imgUrl
+        userid: 'web_user',
+        img_url: imgUrl,
+        conversation_id: currentConversationId.value
       }
 
       // 发送流式请求
@@ -141,6 +142,18 @@ export const useChatStore = defineStore('chat', () => {
       const reader = response.body.getReader()
       const decoder = new TextDecoder()
       let fullResponse = ''
+      // 按图表序号保存渲染结果：多张图并行渲染，完成顺序不一定和代码块顺序一致
+      const plantumlResults = []
+      const applyPlantumlResults = (results) => {
+        for (const result of results) {
+          plantumlResults[result.index ?? plantumlResults.length] = result
+        }
+        updateMessage(aiMessage.id, {
+          plantumlResults: [...plantumlResults],
+          // 卡片展示第一张成功生成的图，失败的图在消息中单独提示
+          plantumlResult: plantumlResults.find(result => result?.success)
+        })
+      }
 
       while (true) {
         const { done, value } = await reader.read()
@@ -161,9 +174,12 @@ export const useChatStore = defineStore('chat', () => {
               }
               
               if (data.plantuml_result) {
-                updateMessage(aiMessage.id, {
-                  plantumlResult: data.plantuml_result
-                })
+                applyPlantumlResults([data.plantuml_result])
+              }
+
+              // 全部渲染结束后的汇总事件（包括失败的图），补齐单张结果事件中漏掉的图
+              if (data.plantuml_results) {
+                applyPlantumlResults(data.plantuml_results)
               }
               
               if (data.error) {
@@ -18,6 +18,7 @@ DATABASE_URL = os.getenv(
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 
 # API配置
 ARK_BASE_URL = os.getenv("ARK_BASE_URL")
@@ -26,4 +27,136 @@ DOUBAO_SEED_1_6_FLASH = os.getenv("DOUBAO_SEED_1_6_FLASH")
 
 # Ollama本地模型配置
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-OLLAMA_MODEL_NAME = os.getenv("OLLAMA_MODEL_NAME", "llama3.2") 
\ No newline at end of file
+OLLAMA_MODEL_NAME = os.getenv("OLLAMA_MODEL_NAME", "llama3.2") 
+# Ollama 连接池：每个主机保持的最大长连接数、连接超时（秒）、空闲连接保持时间（秒）
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", 10))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 3))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", 60))
+# 本地模型是否支持图片输入（需使用 llava 等视觉模型）
+OLLAMA_MULTIMODAL = os.getenv("OLLAMA_MULTIMODAL", "false").lower() == "true"
+
+# PlantUML 渲染配置
+# daemon: 使用常驻 PlantUML 进程池，失败时回退到子进程；subprocess: 每次渲染启动一个 PlantUML 进程
+PLANTUML_RENDER_BACKEND = os.getenv("PLANTUML_RENDER_BACKEND", "daemon")
+PLANTUML_DAEMON_WORKERS = int(os.getenv("PLANTUML_DAEMON_WORKERS", 2))
+PLANTUML_DAEMON_MAX_RENDERS = int(os.getenv("PLANTUML_DAEMON_MAX_RENDERS", 500))
+PLANTUML_RENDER_TIMEOUT = float(os.getenv("PLANTUML_RENDER_TIMEOUT", 30))
+# 异步接口同时进行的最大渲染数
+PLANTUML_RENDER_CONCURRENCY = int(os.getenv("PLANTUML_RENDER_CONCURRENCY", 4))
+# 排队等待渲染的任务上限，超出后返回 503 并带 Retry-After
+PLANTUML_RENDER_QUEUE_SIZE = int(os.getenv("PLANTUML_RENDER_QUEUE_SIZE", 64))
+
+# 渲染前是否用纯 Python 预校验 PlantUML 代码，跳过注定失败的渲染
+PLANTUML_VALIDATION_ENABLED = os.getenv("PLANTUML_VALIDATION_ENABLED", "true").lower() == "true"
+# 渲染缓存索引的图片总大小上限（字节），超出后按最近访问时间淘汰索引记录；图片文件只由图片清理服务删除
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+# 渲染完成后在后台对 PNG 做无损压缩（有 oxipng/optipng 时优先使用）
+PNG_OPTIMIZE_ENABLED = os.getenv("PNG_OPTIMIZE_ENABLED", "false").lower() == "true"
+PNG_OPTIMIZE_WORKERS = int(os.getenv("PNG_OPTIMIZE_WORKERS", 1))
+
+# 图片保留策略：workspace/img 与 workspace/upload_img 的后台清理，会删除文件，默认关闭
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+# 只输出清理报告，不删除文件；默认开启，确认 /retention/report 的结果后再设为 false
+RETENTION_DRY_RUN = os.getenv("RETENTION_DRY_RUN", "true").lower() == "true"
+# 两个目录合计的大小上限（字节），0 表示不限制
+RETENTION_MAX_BYTES = int(os.getenv("RETENTION_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+# 超过多少天未被访问的图片会被清理，0 表示不限制
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", 30))
+# 新文件的保护期（秒），对话可能还没来得及保存
+RETENTION_GRACE_SECONDS = float(os.getenv("RETENTION_GRACE_SECONDS", 3600))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", 600))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 100))
+
+# 模型回复精确匹配缓存（Redis），默认关闭
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+# 每条缓存的过期时间（秒）
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 86400))
+# 缓存内容的总大小上限（字节），超出后淘汰最久未命中的条目
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# 是否启用相似请求缓存（需同时开启 LLM_CACHE_ENABLED，命中后复用相似请求缓存的回复）
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# 相似度阈值（0~1 之间的余弦相似度），越高越保守
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.88))
+# 相似请求索引保留的最近请求条数
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 2000))
+
+# 相同请求并发合并：同时到达的相同请求只调用一次模型
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# 是否通过 Redis 发布订阅在多个 worker 之间合并
+SINGLE_FLIGHT_REDIS_ENABLED = os.getenv("SINGLE_FLIGHT_REDIS_ENABLED", "false").lower() == "true"
+# 等待其他 worker 输出时，多久没有新片段就放弃（秒）
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", 60))
+
+# 模型路由：按首个片段延迟、输出速度和错误率在 DeepSeek、豆包、Ollama 之间选择，关闭时使用固定模型
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "false").lower() == "true"
+# 指标滑动平均中新样本的权重
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", 0.3))
+# 得分权重（得分以秒计，越低越好）：首个片段延迟、输出耗时、错误率（每 100% 折合的秒数）、价格
+ROUTER_WEIGHT_TTFT = float(os.getenv("ROUTER_WEIGHT_TTFT", 1.0))
+ROUTER_WEIGHT_TPS = float(os.getenv("ROUTER_WEIGHT_TPS", 1.0))
+ROUTER_WEIGHT_ERROR = float(os.getenv("ROUTER_WEIGHT_ERROR", 30.0))
+ROUTER_WEIGHT_COST = float(os.getenv("ROUTER_WEIGHT_COST", 0.0))
+# 估算输出耗时时假定的回复长度（token）
+ROUTER_EXPECTED_TOKENS = int(os.getenv("ROUTER_EXPECTED_TOKENS", 400))
+# 随机尝试其他健康提供方的概率，用于刷新指标
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", 0.05))
+# 各提供方每千 token 的价格，如 "deepseek:0.002,doubao:0.0015,ollama:0"
+ROUTER_COSTS = os.getenv("ROUTER_COSTS", "")
+# 每千 token 的价格上限，超出的提供方不参与选择；0 表示不限制
+ROUTER_MAX_COST = float(os.getenv("ROUTER_MAX_COST", 0))
+
+# 模型提供方熔断器：连续失败（错误或超时）多少次后打开，打开后冷却多少秒进入半开状态
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_COOL_DOWN = float(os.getenv("BREAKER_COOL_DOWN", 30))
+# 半开状态下同时放行的探测请求数
+BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv("BREAKER_HALF_OPEN_MAX_CALLS", 1))
+# 模型流式输出多久没有新片段视为超时（秒）
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", 30))
+
+# 模型调用限流：按提供方限制并发数和每分钟 token 数（估算），超出时排队等待而不是被上游 429 拒绝
+LIMITER_ENABLED = os.getenv("LIMITER_ENABLED", "true").lower() == "true"
+# 是否通过 Redis 在多个 worker 之间共享限制
+LIMITER_REDIS_ENABLED = os.getenv("LIMITER_REDIS_ENABLED", "false").lower() == "true"
+# 各提供方的最大并发数，未列出的不限制
+LIMITER_CONCURRENCY = os.getenv("LIMITER_CONCURRENCY", "deepseek:16,doubao:16,ollama:2")
+# 各提供方的每分钟 token 预算，如 "deepseek:60000,doubao:60000"，未列出的不限制
+LIMITER_TPM = os.getenv("LIMITER_TPM", "")
+# 最长排队时间（秒），超时后切换到其他提供方或返回错误
+LIMITER_QUEUE_TIMEOUT = float(os.getenv("LIMITER_QUEUE_TIMEOUT", 20))
+
+# 首个片段延迟对冲：主请求超过延迟阈值仍无输出时再发一路请求，采用先输出的一路
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+# 对冲延迟取主提供方首个片段延迟的该分位数，并限制在上下限之间（秒）；样本不足时使用默认值
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.5))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", 10))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 3))
+# 每分钟最多发起的对冲请求数，限制重复调用的费用
+HEDGE_BUDGET_PER_MINUTE = int(os.getenv("HEDGE_BUDGET_PER_MINUTE", 20))
+# 是否总是对冲到同一提供方（默认优先选择其他可用的提供方）
+HEDGE_SAME_PROVIDER = os.getenv("HEDGE_SAME_PROVIDER", "false").lower() == "true"
+
+# 多轮对话上下文：请求带 conversation_id 时，从 Redis 会话记忆中取最近的对话一起发给模型
+CONTEXT_ENABLED = os.getenv("CONTEXT_ENABLED", "true").lower() == "true"
+# 历史消息的 token 预算，从最新一轮开始放入，放不下为止
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 2000))
+# 最多读取的历史消息条数
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", 20))
+# 计算 token 的 tiktoken 编码（未安装 tiktoken 时按中日韩字符估算）
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# 对话滚动摘要：对话较长时在后台用低成本模型把较早的轮次压缩为摘要，并保留最新的图表代码
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+# 生成摘要的提供方（默认本地 Ollama）
+SUMMARY_PROVIDER = os.getenv("SUMMARY_PROVIDER", "ollama")
+# 该提供方不可用时是否改用当前路由选择的文本模型（会产生费用）
+SUMMARY_FALLBACK_ENABLED = os.getenv("SUMMARY_FALLBACK_ENABLED", "false").lower() == "true"
+# 未压缩的消息超过多少条，或估算 token 数超过多少时开始压缩
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", 12))
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", 3000))
+# 压缩后保留原文的最近消息条数
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", 4))
+# 摘要的 token 上限
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 400))
+# 生成摘要时每条消息最多使用的字符数
+SUMMARY_MESSAGE_MAX_CHARS = int(os.getenv("SUMMARY_MESSAGE_MAX_CHARS", 800))
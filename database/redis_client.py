@@ -1,6 +1,8 @@
 import os
 import json
 import redis
+import redis.asyncio as aioredis
+import threading
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
@@ -13,23 +15,64 @@ class RedisSessionManager:
         self.redis_db = int(os.getenv("REDIS_DB", 0))
         self.redis_password = os.getenv("REDIS_PASSWORD", None)
         
-        # 创建Redis连接
-        self.redis_client = redis.Redis(
-            host=self.redis_host,
-            port=self.redis_port,
-            db=self.redis_db,
-            password=self.redis_password,
-            decode_responses=True
-        )
+        # Redis连接在第一次使用时创建
+        self._redis_client: Optional[redis.Redis] = None
+        self._async_redis_client: Optional[aioredis.Redis] = None
+        self._client_lock = threading.Lock()
         
         # 配置
         self.session_ttl = 86400 * 7  # 7天过期
         self.max_messages_per_session = 50  # 每个会话最多保存50条消息
     
+    @property
+    def redis_client(self) -> redis.Redis:
+        """Redis连接（延迟创建）"""
+        if self._redis_client is None:
+            with self._client_lock:
+                if self._redis_client is None:
+                    self._redis_client = redis.Redis(
+                        host=self.redis_host,
+                        port=self.redis_port,
+                        db=self.redis_db,
+                        password=self.redis_password,
+                        decode_responses=True,
+                        socket_connect_timeout=5
+                    )
+        return self._redis_client
+    
+    @property
+    def async_redis_client(self) -> aioredis.Redis:
+        """Redis异步连接（延迟创建），供事件循环中的缓存、协调等功能共用"""
+        if self._async_redis_client is None:
+            with self._client_lock:
+                if self._async_redis_client is None:
+                    self._async_redis_client = aioredis.Redis(
+                        host=self.redis_host,
+                        port=self.redis_port,
+                        db=self.redis_db,
+                        password=self.redis_password,
+                        decode_responses=True,
+                        socket_connect_timeout=2,
+                        socket_timeout=2
+                    )
+        return self._async_redis_client
+    
+    def ping(self) -> bool:
+        """检查Redis是否可用（阻塞调用）"""
+        return bool(self.redis_client.ping())
+    
     def _get_session_key(self, user_id: str, conversation_id: str) -> str:
         """生成会话键"""
         return f"session:{user_id}:{conversation_id}"
     
+    def _get_session_tokens_key(self, user_id: str, conversation_id: str) -> str:
+        """生成会话消息 token 数缓存键"""
+        return f"session_tokens:{user_id}:{conversation_id}"
+    
+    def _get_session_summary_key(self, user_id: str, conversation_id: str) -> str:
+        """生成会话摘要键"""
+        return f"session_summary:{user_id}:{conversation_id}"
+    
     def _get_user_conversations_key(self, user_id: str) -> str:
         """生成用户对话列表键"""
         return f"user_conversations:{user_id}"
@@ -63,6 +106,33 @@ class RedisSessionManager:
         )
         self.redis_client.expire(user_conversations_key, self.session_ttl)
     
+    async def add_messages_async(self, user_id: str, conversation_id: str, messages: List[Dict[str, Any]]):
+        """
+        添加一组消息到会话记忆（异步，供事件循环中使用，写入方式与 add_message 相同）
+        使用带读写超时的异步连接，Redis 不可用时很快失败，不会拖住流式响应或占用线程池
+        """
+        session_key = self._get_session_key(user_id, conversation_id)
+        user_conversations_key = self._get_user_conversations_key(user_id)
+        
+        async with self.async_redis_client.pipeline(transaction=False) as pipe:
+            previous = None
+            for message in messages:
+                # 同一轮的消息时间戳严格递增，摘要按时间戳区分已压缩的消息
+                timestamp = datetime.utcnow()
+                if previous is not None and timestamp <= previous:
+                    timestamp = previous + timedelta(microseconds=1)
+                previous = timestamp
+                message["timestamp"] = timestamp.isoformat()
+                pipe.lpush(session_key, json.dumps(message, ensure_ascii=False))
+            pipe.ltrim(session_key, 0, self.max_messages_per_session - 1)
+            pipe.expire(session_key, self.session_ttl)
+            pipe.hset(user_conversations_key, conversation_id, json.dumps({
+                "conversation_id": conversation_id,
+                "last_activity": datetime.utcnow().isoformat()
+            }, ensure_ascii=False))
+            pipe.expire(user_conversations_key, self.session_ttl)
+            await pipe.execute()
+    
     def get_conversation_history(self, user_id: str, conversation_id: str, limit: int = 20) -> List[Dict[str, Any]]:
         """获取对话历史"""
         session_key = self._get_session_key(user_id, conversation_id)
@@ -80,32 +150,14 @@ class RedisSessionManager:
         
         return parsed_messages
     
-    def get_context_for_llm(self, user_id: str, conversation_id: str, max_tokens: int = 2000) -> List[Dict[str, str]]:
-        """获取适合LLM的对话上下文"""
-        history = self.get_conversation_history(user_id, conversation_id, limit=10)
-        
-        context = []
-        total_chars = 0
-        
-        for msg in history:
-            # 估算token数（简单按字符数/4估算）
-            msg_chars = len(msg.get("content", ""))
-            if total_chars + msg_chars > max_tokens * 4:
-                break
-            
-            role = "user" if msg.get("type") == "user" else "assistant"
-            context.append({
-                "role": role,
-                "content": msg.get("content", "")
-            })
-            total_chars += msg_chars
-        
-        return context
-    
     def clear_conversation(self, user_id: str, conversation_id: str):
         """清除对话记忆"""
         session_key = self._get_session_key(user_id, conversation_id)
-        self.redis_client.delete(session_key)
+        self.redis_client.delete(
+            session_key,
+            self._get_session_tokens_key(user_id, conversation_id),
+            self._get_session_summary_key(user_id, conversation_id)
+        )
         
         # 从用户对话列表中移除
         user_conversations_key = self._get_user_conversations_key(user_id)
@@ -1,11 +1,16 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from datetime import datetime
+import json
+import re
 import uuid
 
 from .models import User, Conversation, Message
 from .redis_client import redis_session_manager
 
+# 消息中引用的生成图片或上传图片
+IMAGE_REFERENCE_PATTERN = re.compile(r'/api/v1/(?:images|upload_images)/([^"\'\s?#/\\]+)')
+
 class DatabaseService:
     """数据库服务层"""
     
@@ -182,24 +187,18 @@ class DatabaseService:
                      .limit(limit)\
                      .all()
     
-    def get_conversation_with_context(self, conversation_id: str, user_id: str = None) -> Optional[Dict[str, Any]]:
-        """获取对话及其上下文（包括Redis中的记忆）"""
-        conversation = self.get_conversation(conversation_id, user_id)
-        
-        if not conversation:
-            return None
-        
-        # 获取Redis中的对话上下文
-        context = redis_session_manager.get_context_for_llm(
-            conversation.user_id, 
-            str(conversation.id)
-        )
-        
-        return {
-            "conversation": conversation,
-            "context": context,
-            "recent_messages": self.get_conversation_messages(conversation_id, limit=10)
-        }
+    def get_referenced_image_files(self, batch_size: int = 1000) -> Set[str]:
+        """获取所有消息仍在引用的图片文件名，图片清理时这些文件会被保留"""
+        filenames: Set[str] = set()
+        rows = self.db.query(Message.image_url, Message.plantuml_image_url, Message.meta_data)\
+                      .yield_per(batch_size)
+        for image_url, plantuml_image_url, meta_data in rows:
+            for value in (image_url, plantuml_image_url):
+                if value:
+                    filenames.update(IMAGE_REFERENCE_PATTERN.findall(value))
+            if meta_data:
+                filenames.update(IMAGE_REFERENCE_PATTERN.findall(json.dumps(meta_data, ensure_ascii=False)))
+        return filenames
 
 # 辅助函数
 def get_database_service(db: Session) -> DatabaseService:
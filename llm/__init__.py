@@ -1,5 +1,9 @@
 from .doubao_flash import DOUBAO_SEED_1_6_FLASH
 from .deepseekv3 import DeepSeekV3Client
 from .ollama_client import OllamaClient
+from .clients import get_doubao_client, get_deepseek_client, get_ollama_client
 
-__all__ = ['DOUBAO_SEED_1_6_FLASH', 'DeepSeekV3Client', 'OllamaClient'] 
\ No newline at end of file
+__all__ = [
+    'DOUBAO_SEED_1_6_FLASH', 'DeepSeekV3Client', 'OllamaClient',
+    'get_doubao_client', 'get_deepseek_client', 'get_ollama_client'
+] 
\ No newline at end of file
@@ -0,0 +1,135 @@
+import logging
+from typing import AsyncGenerator, Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """模型提供方调用失败"""
+
+    def __init__(self, provider: str, message: str):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+
+class ProviderTimeoutError(ProviderError):
+    """模型提供方响应超时"""
+
+
+class CircuitOpenError(ProviderError):
+    """提供方的熔断器处于打开状态，请求未发出"""
+
+
+class RateLimitTimeoutError(ProviderError):
+    """排队等待提供方的调用名额超时，请求未发出"""
+
+
+def parse_provider_values(value: str) -> Dict[str, float]:
+    """解析 "deepseek:2,doubao:1.5" 形式的按提供方配置"""
+    values = {}
+    for item in (value or "").split(","):
+        if ":" not in item:
+            continue
+        name, number = item.split(":", 1)
+        try:
+            values[name.strip()] = float(number)
+        except ValueError:
+            logger.warning(f"忽略无效的配置项: {item}")
+    return values
+
+
+def provider_error(provider: str, error: Exception) -> ProviderError:
+    """
+    把客户端库抛出的异常转换为 ProviderError
+    httpx、openai 和 asyncio 的超时异常类名都包含 Timeout，统一转换为 ProviderTimeoutError
+    """
+    if isinstance(error, ProviderError):
+        return error
+    if "Timeout" in type(error).__name__:
+        return ProviderTimeoutError(provider, f"请求超时: {error}")
+    return ProviderError(provider, str(error) or type(error).__name__)
+
+
+class AsyncChatProvider:
+    """
+    模型客户端的异步接口
+    所有方法都在事件循环上执行网络 I/O，不占用线程池；流式方法返回异步生成器
+    调用失败时抛出 ProviderError（超时为 ProviderTimeoutError），不把错误信息当作回复内容返回
+    """
+
+    # 提供方名称，用于日志和统计
+    provider_name = "unknown"
+
+    async def chat_async(self, user_input: str, system_prompt: str = None) -> str:
+        """
+        非流式对话
+
+        Args:
+            user_input: 用户输入
+            system_prompt: 系统提示词
+
+        Returns:
+            完整的回复文本
+        """
+        chunks = []
+        async for chunk in self.chat_stream_async(user_input, system_prompt):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def chat_stream_async(self, user_input: str, system_prompt: str = None,
+                                history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """
+        流式对话
+
+        Args:
+            user_input: 用户输入
+            system_prompt: 系统提示词
+            history: 之前的对话消息（{"role", "content"}，按时间正序），放在系统提示词和本次输入之间
+
+        Yields:
+            回复的文本片段
+        """
+        raise NotImplementedError(f"{self.provider_name} 不支持流式对话")
+        yield  # 使该方法成为异步生成器
+
+    async def chat_multimodal_async(self, text: str, image_url: str, system_prompt: str = None) -> str:
+        """多模态对话（非流式）"""
+        chunks = []
+        async for chunk in self.chat_multimodal_stream_async(text, image_url, system_prompt):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def chat_multimodal_stream_async(self, text: str, image_url: str, system_prompt: str = None,
+                                           history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """多模态流式对话，history 同 chat_stream_async"""
+        raise NotImplementedError(f"{self.provider_name} 不支持多模态对话")
+        yield  # 使该方法成为异步生成器
+
+
+async def stream_openai_chat(client, model: str, messages: List[Dict[str, Any]]) -> AsyncGenerator[str, None]:
+    """
+    通过 AsyncOpenAI 兼容接口流式获取回复
+
+    Args:
+        client: AsyncOpenAI 实例
+        model: 模型名称
+        messages: 消息列表
+
+    Yields:
+        回复的文本片段
+    """
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+    )
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+    finally:
+        # 调用方提前结束（如客户端断开）时及时释放连接
+        await stream.response.aclose()
@@ -0,0 +1,124 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    单个模型提供方的熔断器
+    关闭状态下连续失败（错误或超时）达到阈值后打开，打开期间请求直接跳过该提供方；
+    冷却时间过后进入半开状态，只放行少量探测请求，探测成功则关闭，失败则重新打开；
+    探测请求超过冷却时间仍没有结果（名额未归还）时，放行新的探测，避免一直停在半开状态
+    """
+
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 cool_down: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        初始化熔断器
+
+        Args:
+            name: 提供方名称
+            failure_threshold: 连续失败多少次后打开
+            cool_down: 打开后多久进入半开状态（秒）
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cool_down = cool_down
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_calls = 0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _refresh_locked(self):
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self.cool_down:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        elif (self._state == HALF_OPEN and self._half_open_calls
+              and now - self._probe_started_at >= self.cool_down):
+            logger.warning(f"熔断器探测请求没有结果，重新放行探测: {self.name}")
+            self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_locked()
+            return self._state
+
+    def is_available(self) -> bool:
+        """是否可能放行请求（不占用半开状态的探测名额）"""
+        with self._lock:
+            self._refresh_locked()
+            if self._state == OPEN:
+                return False
+            return self._state == CLOSED or self._half_open_calls < self.half_open_max_calls
+
+    def allow_request(self) -> bool:
+        """请求发出前调用；半开状态下占用一个探测名额"""
+        with self._lock:
+            self._refresh_locked()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                self._probe_started_at = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"熔断器关闭: {self.name}")
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.times_opened += 1
+                    logger.warning(f"熔断器打开: {self.name}（连续失败 {self._consecutive_failures} 次）")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+    def release(self):
+        """请求未产生结果就结束（如客户端断开）时归还半开状态的探测名额"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_locked()
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = round(max(0.0, self.cool_down - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_in_seconds": retry_in,
+            }
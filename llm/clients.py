@@ -0,0 +1,52 @@
+import threading
+from typing import Any, Callable, Dict
+import logging
+from config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL_NAME,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_KEEPALIVE_EXPIRY,
+)
+from .doubao_flash import DOUBAO_SEED_1_6_FLASH
+from .deepseekv3 import DeepSeekV3Client
+from .ollama_client import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+# 已创建的客户端实例，第一次使用时才创建
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+                logger.info(f"模型客户端已创建: {name}")
+    return client
+
+
+def get_doubao_client() -> DOUBAO_SEED_1_6_FLASH:
+    """豆包多模态客户端"""
+    return _get_or_create("doubao", DOUBAO_SEED_1_6_FLASH)
+
+
+def get_deepseek_client() -> DeepSeekV3Client:
+    """DeepSeek V3 客户端"""
+    return _get_or_create("deepseek", DeepSeekV3Client)
+
+
+def get_ollama_client() -> OllamaClient:
+    """Ollama 本地模型客户端（构造时不连接服务）"""
+    return _get_or_create("ollama", lambda: OllamaClient(
+        OLLAMA_BASE_URL,
+        OLLAMA_MODEL_NAME,
+        pool_size=OLLAMA_POOL_SIZE,
+        connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+        keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY
+    ))
@@ -0,0 +1,250 @@
+import hashlib
+import logging
+from typing import Any, AsyncIterator, AsyncGenerator, Dict, List, Optional, Tuple
+from config import CONTEXT_ENABLED, CONTEXT_MAX_TOKENS, CONTEXT_MAX_MESSAGES
+from database.redis_client import redis_session_manager
+from .tokens import count_tokens, tokenizer_name, truncate_tokens, MESSAGE_OVERHEAD_TOKENS
+from .summarizer import ConversationSummarizer, conversation_summarizer, parse_session_messages
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationContext:
+    """
+    多轮对话上下文
+    从 Redis 会话记忆中按从新到旧的顺序取消息，放入 token 预算为止；
+    每条消息的 token 数缓存在 Redis 中，构建上下文时不需要重新计数。
+    对话已有滚动摘要时，先放入摘要（和最新的图表代码），再放入摘要之后的消息
+    """
+
+    def __init__(self,
+                 summarizer: Optional[ConversationSummarizer] = None,
+                 enabled: bool = True,
+                 max_tokens: int = 2000,
+                 max_messages: int = 20):
+        """
+        初始化
+
+        Args:
+            summarizer: 对话摘要，保存一轮对话后由它在后台决定是否压缩
+            enabled: 是否启用
+            max_tokens: 历史消息的 token 预算（包括摘要）
+            max_messages: 最多读取的历史消息条数
+        """
+        self.summarizer = summarizer
+        self.enabled = enabled
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+
+        self.builds = 0
+        self.messages_counted = 0
+        self.messages_cached = 0
+        self.truncated = 0
+        self.with_summary = 0
+        self.errors = 0
+
+    @staticmethod
+    def _field(role: str, content: str) -> str:
+        """消息 token 数缓存的字段名，包含计数方式，切换编码后不会用到旧的结果"""
+        digest = hashlib.sha1(f"{role}\n{content}".encode("utf-8")).hexdigest()[:16]
+        return f"{tokenizer_name()}:{digest}"
+
+    @staticmethod
+    def _message_tokens(content: str) -> int:
+        return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    async def build(self, user_id: str, conversation_id: Optional[str]) -> List[Dict[str, str]]:
+        """
+        构建发给模型的历史消息
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 对话ID，为空时不带历史
+
+        Returns:
+            按时间正序的消息列表（{"role", "content"}），总 token 数不超过预算；
+            未启用、没有历史或 Redis 不可用时返回空列表
+        """
+        if not self.enabled or not conversation_id or self.max_tokens <= 0:
+            return []
+        try:
+            return await self._build(user_id, conversation_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"读取对话上下文失败，按单轮对话处理: {e}")
+            return []
+
+    async def _build(self, user_id: str, conversation_id: str) -> List[Dict[str, str]]:
+        redis = redis_session_manager.async_redis_client
+        # 会话列表从新到旧存放
+        raw_messages = await redis.lrange(
+            redis_session_manager._get_session_key(user_id, conversation_id), 0, self.max_messages - 1
+        )
+        if not raw_messages:
+            return []
+        self.builds += 1
+
+        messages = parse_session_messages(raw_messages)
+        summary = await self.summarizer.get_summary(user_id, conversation_id) if self.summarizer else None
+        if summary is not None:
+            # 已合并进摘要的消息不再发送
+            messages = [message for message in messages if message["timestamp"] > summary["covered_until"]]
+        if not messages and summary is None:
+            return []
+
+        tokens_key = redis_session_manager._get_session_tokens_key(user_id, conversation_id)
+        fields = [self._field(message["role"], message["content"]) for message in messages]
+        cached = await redis.hmget(tokens_key, fields) if fields else []
+
+        counts = []
+        missing = {}
+        for message, field, value in zip(messages, fields, cached):
+            if value is not None:
+                counts.append(int(value))
+                self.messages_cached += 1
+            else:
+                count = self._message_tokens(message["content"])
+                counts.append(count)
+                missing[field] = count
+                self.messages_counted += 1
+        if missing:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(tokens_key, mapping=missing)
+                pipe.expire(tokens_key, redis_session_manager.session_ttl)
+                await pipe.execute()
+
+        summary_message = None
+        used = 0
+        if summary is not None:
+            summary_message, used = self._summary_message(summary)
+            self.with_summary += 1
+
+        # 从最新一条开始放入，放不下就停止，保证历史是连续的最近几轮
+        context = []
+        for message, count in zip(messages, counts):
+            if used + count > self.max_tokens:
+                self.truncated += 1
+                if not context:
+                    # 最新一条本身就超出预算（如带长图表代码的回复），用户多半正在追问它，截断后保留
+                    content = truncate_tokens(message["content"], self.max_tokens - used - MESSAGE_OVERHEAD_TOKENS)
+                    if content:
+                        context.append({"role": message["role"], "content": content})
+                break
+            context.append({"role": message["role"], "content": message["content"]})
+            used += count
+        context.reverse()
+
+        # 除了唯一的一条外，不以模型的回复开头
+        while len(context) > 1 and context[0]["role"] == "assistant":
+            context.pop(0)
+        if summary_message is not None:
+            context.insert(0, summary_message)
+        return context
+
+    def _summary_message(self, summary: Dict[str, Any]) -> Tuple[Dict[str, str], int]:
+        """
+        把摘要转换为一条系统消息；摘要加图表代码超出预算时只放摘要
+
+        Returns:
+            (消息, token 数)
+        """
+        content = f"之前对话的摘要：\n{summary['summary']}"
+        tokens = summary["summary_tokens"] + MESSAGE_OVERHEAD_TOKENS
+        if summary["diagram"] and tokens + summary["diagram_tokens"] <= self.max_tokens:
+            content += f"\n\n当前图表的 PlantUML 代码：\n```plantuml\n{summary['diagram']}\n```"
+            tokens += summary["diagram_tokens"]
+        return {"role": "system", "content": content}, tokens
+
+    async def add_turn(self, user_id: str, conversation_id: str, user_input: str, reply: str,
+                       image_url: Optional[str] = None):
+        """
+        把一轮问答写入会话记忆，并缓存两条消息的 token 数
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 对话ID
+            user_input: 用户输入
+            reply: 模型的完整回复
+            image_url: 用户上传的图片URL
+        """
+        try:
+            await redis_session_manager.add_messages_async(user_id, conversation_id, [
+                {"type": "user", "content": user_input, "image_url": image_url or None},
+                {"type": "ai", "content": reply},
+            ])
+
+            redis = redis_session_manager.async_redis_client
+            tokens_key = redis_session_manager._get_session_tokens_key(user_id, conversation_id)
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(tokens_key, mapping={
+                    self._field("user", user_input): self._message_tokens(user_input),
+                    self._field("assistant", reply): self._message_tokens(reply),
+                })
+                pipe.expire(tokens_key, redis_session_manager.session_ttl)
+                pipe.lrange(redis_session_manager._get_session_key(user_id, conversation_id), 0, -1)
+                pipe.hkeys(tokens_key)
+                _, _, raw_messages, fields = await pipe.execute()
+
+            # 会话列表裁剪掉的消息（以及切换编码前的计数）不再需要缓存
+            live = {self._field(message["role"], message["content"]) for message in parse_session_messages(raw_messages)}
+            stale = [field for field in fields if field not in live]
+            if stale:
+                await redis.hdel(tokens_key, *stale)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"保存对话上下文失败: {e}")
+            return
+        if self.summarizer is not None:
+            self.summarizer.schedule(user_id, conversation_id)
+
+    async def remember(self,
+                       user_id: str,
+                       conversation_id: Optional[str],
+                       user_input: str,
+                       chunks: AsyncIterator[str],
+                       image_url: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        透传回复片段，回复完整结束后写入会话记忆；中途失败或客户端断开时不保存
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 对话ID，为空时只透传
+            user_input: 用户输入
+            chunks: 回复片段
+            image_url: 用户上传的图片URL
+
+        Yields:
+            原样的回复片段
+        """
+        collected = []
+        async for chunk in chunks:
+            collected.append(chunk)
+            yield chunk
+        reply = "".join(collected)
+        if self.enabled and conversation_id and reply:
+            await self.add_turn(user_id, conversation_id, user_input, reply, image_url)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """上下文构建统计（当前进程）"""
+        return {
+            "enabled": self.enabled,
+            "max_tokens": self.max_tokens,
+            "max_messages": self.max_messages,
+            "tokenizer": tokenizer_name(),
+            "builds": self.builds,
+            "messages_counted": self.messages_counted,
+            "messages_cached": self.messages_cached,
+            "truncated": self.truncated,
+            "with_summary": self.with_summary,
+            "errors": self.errors,
+            "summary": self.summarizer.get_stats() if self.summarizer else None,
+        }
+
+
+# 全局对话上下文实例
+conversation_context = ConversationContext(
+    conversation_summarizer,
+    enabled=CONTEXT_ENABLED,
+    max_tokens=CONTEXT_MAX_TOKENS,
+    max_messages=CONTEXT_MAX_MESSAGES,
+)
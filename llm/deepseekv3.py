@@ -1,15 +1,18 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import dotenv
 from llm.system_prompts import MAIN
-from typing import AsyncGenerator, Generator
+from llm.base import AsyncChatProvider, stream_openai_chat, provider_error
+from typing import AsyncGenerator, Generator, List, Dict, Optional
 
 dotenv.load_dotenv()
 
 
-class DeepSeekV3Client:
+class DeepSeekV3Client(AsyncChatProvider):
     """DeepSeek V3 客户端类，支持流式响应"""
     
+    provider_name = "deepseek"
+    
     def __init__(self):
         """初始化客户端"""
         # 获取环境变量
@@ -22,7 +25,101 @@ class DeepSeekV3Client:
             base_url=self.base_url,
             api_key=self.api_key,
         )
-
+        # 异步客户端，供事件循环上的接口使用
+        self.async_client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+        )
+    
+    def chat(self, user_input: str, system_prompt: str = None) -> str:
+        """
+        非流式聊天方法
+        
+        Args:
+            user_input: 用户输入的消息
+            system_prompt: 系统提示词，默认为MAIN_PROMPT
+            
+        Returns:
+            str: 完整的响应文本
+        """
+        if system_prompt is None:
+            system_prompt = MAIN
+            
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input},
+                ],
+                stream=False,
+            )
+            return response.choices[0].message.content
+                    
+        except Exception as e:
+            return f"错误: {str(e)}"
+    
+    async def chat_async(self, user_input: str, system_prompt: str = None) -> str:
+        """
+        非流式聊天方法（异步）
+        
+        Args:
+            user_input: 用户输入的消息
+            system_prompt: 系统提示词，默认为MAIN_PROMPT
+            
+        Returns:
+            str: 完整的响应文本
+            
+        Raises:
+            ProviderError: 调用失败
+        """
+        if system_prompt is None:
+            system_prompt = MAIN
+            
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input},
+                ],
+                stream=False,
+            )
+            return response.choices[0].message.content
+                    
+        except Exception as e:
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_stream_async(self, user_input: str, system_prompt: str = None,
+                                history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """
+        流式聊天方法（异步生成器）
+        
+        Args:
+            user_input: 用户输入的消息
+            system_prompt: 系统提示词，默认为MAIN_PROMPT
+            history: 之前的对话消息（按时间正序）
+            
+        Yields:
+            str: 流式响应的文本片段
+            
+        Raises:
+            ProviderError: 调用失败
+        """
+        if system_prompt is None:
+            system_prompt = MAIN
+            
+        try:
+            messages = [
+                {"role": "system", "content": system_prompt},
+                *(history or []),
+                {"role": "user", "content": user_input},
+            ]
+            async for content in stream_openai_chat(self.async_client, self.model, messages):
+                yield content
+                    
+        except Exception as e:
+            raise provider_error(self.provider_name, e) from e
     
     def chat_stream(self, user_input: str, system_prompt: str = None) -> Generator[str, None, None]:
         """
@@ -1,14 +1,17 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import dotenv
 from llm.system_prompts import MAIN_IMG
-from typing import AsyncGenerator, Generator
+from llm.base import AsyncChatProvider, stream_openai_chat, provider_error
+from typing import AsyncGenerator, Generator, List, Dict, Any, Optional
 
 dotenv.load_dotenv()
 
-class DOUBAO_SEED_1_6_FLASH:
+class DOUBAO_SEED_1_6_FLASH(AsyncChatProvider):
     """豆包 SEED 1.6 客户端类，支持非流式响应"""
     
+    provider_name = "doubao"
+    
     def __init__(self):
         """初始化客户端"""
         # 获取环境变量
@@ -21,6 +24,146 @@ class DOUBAO_SEED_1_6_FLASH:
             base_url=self.base_url,
             api_key=self.api_key,
         )
+        # 异步客户端，供事件循环上的接口使用
+        self.async_client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+        )
+    
+    @staticmethod
+    def _multimodal_messages(text: str, image_url: str, system_prompt: str,
+                             history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, Any]]:
+        """构建多模态消息"""
+        return [
+            {"role": "system", "content": system_prompt},
+            *(history or []),
+            {
+                "role": "user", 
+                "content": [
+                    {"type": "text", "text": text},
+                    {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}}
+                ]
+            }
+        ]
+    
+    async def chat_async(self, user_input: str, system_prompt: str = None) -> str:
+        """
+        非流式聊天方法（异步）
+        
+        Args:
+            user_input: 用户输入的消息
+            system_prompt: 系统提示词，默认为MAIN_PROMPT
+            
+        Returns:
+            str: 完整的响应文本
+            
+        Raises:
+            ProviderError: 调用失败
+        """
+        if system_prompt is None:
+            system_prompt = MAIN_IMG
+            
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input},
+                ],
+                stream=False,
+            )
+            return response.choices[0].message.content
+                    
+        except Exception as e:
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_stream_async(self, user_input: str, system_prompt: str = None,
+                                history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """
+        流式聊天方法（异步生成器）
+        
+        Args:
+            user_input: 用户输入的消息
+            system_prompt: 系统提示词，默认为MAIN_PROMPT
+            history: 之前的对话消息（按时间正序）
+            
+        Yields:
+            str: 流式响应片段
+            
+        Raises:
+            ProviderError: 调用失败
+        """
+        if system_prompt is None:
+            system_prompt = MAIN_IMG
+            
+        try:
+            messages = [
+                {"role": "system", "content": system_prompt},
+                *(history or []),
+                {"role": "user", "content": user_input},
+            ]
+            async for content in stream_openai_chat(self.async_client, self.model, messages):
+                yield content
+                    
+        except Exception as e:
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_multimodal_async(self, text: str, image_url: str, system_prompt: str = None) -> str:
+        """
+        多模态聊天方法（异步，非流式）
+        
+        Args:
+            text: 文本输入
+            image_url: 图片URL
+            system_prompt: 系统提示词
+            
+        Returns:
+            str: 完整的响应文本
+            
+        Raises:
+            ProviderError: 调用失败
+        """
+        if system_prompt is None:
+            system_prompt = MAIN_IMG
+            
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self._multimodal_messages(text, image_url, system_prompt),
+                stream=False,
+            )
+            return response.choices[0].message.content
+                    
+        except Exception as e:
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_multimodal_stream_async(self, text: str, image_url: str, system_prompt: str = None,
+                                           history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """
+        多模态聊天方法（异步生成器）
+        
+        Args:
+            text: 文本输入
+            image_url: 图片URL
+            system_prompt: 系统提示词
+            history: 之前的对话消息（按时间正序）
+            
+        Yields:
+            str: 流式响应片段
+            
+        Raises:
+            ProviderError: 调用失败
+        """
+        if system_prompt is None:
+            system_prompt = MAIN_IMG
+            
+        try:
+            messages = self._multimodal_messages(text, image_url, system_prompt, history)
+            async for content in stream_openai_chat(self.async_client, self.model, messages):
+                yield content
+                    
+        except Exception as e:
+            raise provider_error(self.provider_name, e) from e
     
     def chat(self, user_input: str, system_prompt: str = None) -> str:
         """
@@ -0,0 +1,289 @@
+import asyncio
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from config import (
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_DELAY,
+    HEDGE_MAX_DELAY,
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_BUDGET_PER_MINUTE,
+    HEDGE_SAME_PROVIDER,
+)
+from .base import ProviderError, CircuitOpenError
+from .router import ModelRouter, model_router
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeBudget:
+    """每分钟允许发起的对冲请求数（滑动窗口）"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._issued: deque = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._issued and now - self._issued[0] >= 60:
+                self._issued.popleft()
+            if len(self._issued) >= self.per_minute:
+                return False
+            self._issued.append(now)
+            return True
+
+    def remaining(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return max(0, self.per_minute - sum(1 for issued in self._issued if now - issued < 60))
+
+
+class _Attempt:
+    """一路请求：输出迭代器和正在等待的下一个片段"""
+
+    def __init__(self, provider: str, client: Any, chunks: AsyncIterator[str]):
+        self.provider = provider
+        self.client = client
+        self.chunks = chunks
+        self.next = asyncio.ensure_future(chunks.__anext__())
+
+    async def close(self):
+        if not self.next.done():
+            self.next.cancel()
+            try:
+                await self.next
+            except BaseException:
+                pass
+        if hasattr(self.chunks, "aclose"):
+            await self.chunks.aclose()
+
+
+class HedgedStreamer:
+    """
+    首个片段延迟的对冲与失败切换
+    主请求在延迟阈值（该提供方首个片段延迟的分位数）内还没有输出时，再向备用提供方
+    （或同一提供方）发起一次相同的请求，采用先输出内容的一路并取消另一路；
+    对冲次数受每分钟预算限制。还没有输出任何内容就失败时，切换到下一个可用的提供方
+    """
+
+    def __init__(self,
+                 router: ModelRouter,
+                 enabled: bool = False,
+                 percentile: float = 95,
+                 min_delay: float = 0.5,
+                 max_delay: float = 10.0,
+                 default_delay: float = 3.0,
+                 budget_per_minute: int = 20,
+                 same_provider: bool = False):
+        """
+        初始化
+
+        Args:
+            router: 模型路由器，提供延迟样本并记录每一路的指标
+            enabled: 是否启用对冲
+            percentile: 用主提供方首个片段延迟的哪个分位数作为对冲延迟
+            min_delay: 对冲延迟下限（秒）
+            max_delay: 对冲延迟上限（秒）
+            default_delay: 延迟样本不足时使用的对冲延迟（秒）
+            budget_per_minute: 每分钟最多发起的对冲请求数
+            same_provider: 是否总是向同一提供方对冲（否则优先选择其他可用的提供方）
+        """
+        self.router = router
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.budget = HedgeBudget(budget_per_minute)
+        self.same_provider = same_provider
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+        self.failovers = 0
+
+    def hedge_delay(self, provider: str) -> float:
+        """主提供方的对冲延迟（秒）"""
+        delay = self.router.stats[provider].ttft_percentile(self.percentile)
+        if delay is None:
+            delay = self.default_delay
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _backup_provider(self, capability: str, provider: str, tried: List[str]) -> Optional[Tuple[str, Any]]:
+        """选择对冲的提供方，熔断中的跳过；没有可用的返回 None"""
+        if not self.same_provider:
+            try:
+                return self.router.select(capability, exclude=tried)
+            except CircuitOpenError:
+                pass
+        try:
+            return provider, self.router.acquire(provider)
+        except CircuitOpenError:
+            return None
+
+    @staticmethod
+    def _succeeded(attempt: _Attempt) -> bool:
+        """该路的第一个结果是否为有效内容"""
+        return not attempt.next.cancelled() and attempt.next.exception() is None
+
+    async def select_and_stream(self,
+                                capability: str,
+                                call: Callable[[Any], AsyncIterator[str]],
+                                prompt_tokens: int = 0,
+                                on_served: Optional[Callable[[str, Any], None]] = None) -> AsyncGenerator[str, None]:
+        """
+        开始迭代时才通过熔断器选择提供方，再调用 stream；
+        生成器没有被迭代（如命中缓存、跟随其他相同请求）时不会占用半开状态的探测名额
+
+        Raises:
+            CircuitOpenError: 没有可用的提供方
+            ProviderError: 同 stream
+        """
+        provider, client = self.router.select(capability)
+        async for chunk in self.stream(capability, provider, client, call, prompt_tokens, on_served):
+            yield chunk
+
+    async def stream(self,
+                     capability: str,
+                     provider: str,
+                     client: Any,
+                     call: Callable[[Any], AsyncIterator[str]],
+                     prompt_tokens: int = 0,
+                     on_served: Optional[Callable[[str, Any], None]] = None) -> AsyncGenerator[str, None]:
+        """
+        流式调用，必要时对冲或切换提供方
+
+        Args:
+            capability: 所需能力（text、multimodal），用于选择备用提供方
+            provider: 主提供方名称
+            client: 主提供方客户端（已通过熔断器）
+            call: 以客户端为参数发起流式请求的函数
+            prompt_tokens: 输入的估算 token 数，用于限流
+            on_served: 产出第一个片段前以 (提供方名称, 客户端) 调用，告知实际回复的提供方
+                （对冲或切换后可能不是主提供方）
+
+        Yields:
+            胜出一路的文本片段
+
+        Raises:
+            ProviderError: 所有可用的提供方都失败，或输出中途失败
+        """
+        tried = [provider]
+        while True:
+            started = False
+            try:
+                async for chunk in self._stream_once(capability, provider, client, call, tried, prompt_tokens, on_served):
+                    started = True
+                    yield chunk
+                return
+            except ProviderError as e:
+                if started:
+                    raise
+                try:
+                    provider, client = self.router.select(capability, exclude=tried)
+                except CircuitOpenError:
+                    raise e
+                logger.warning(f"{e}，切换到 {provider}")
+                tried.append(provider)
+                self.failovers += 1
+
+    async def _stream_once(self,
+                           capability: str,
+                           provider: str,
+                           client: Any,
+                           call: Callable[[Any], AsyncIterator[str]],
+                           tried: List[str],
+                           prompt_tokens: int,
+                           on_served: Optional[Callable[[str, Any], None]]) -> AsyncGenerator[str, None]:
+        """向一个提供方发起请求，超过对冲延迟时再发一路"""
+        if not self.enabled:
+            served = False
+            async for chunk in self.router.track(provider, call(client), prompt_tokens):
+                if not served and on_served is not None:
+                    on_served(provider, client)
+                served = True
+                yield chunk
+            return
+
+        self.requests += 1
+        attempts = [_Attempt(provider, client, self.router.track(provider, call(client), prompt_tokens))]
+        winner: Optional[_Attempt] = None
+        try:
+            done, _ = await asyncio.wait({attempts[0].next}, timeout=self.hedge_delay(provider))
+            if not done:
+                if not self.budget.try_acquire():
+                    self.budget_exhausted += 1
+                else:
+                    backup = self._backup_provider(capability, provider, tried)
+                    if backup is not None:
+                        backup_name, backup_client = backup
+                        if backup_name not in tried:
+                            tried.append(backup_name)
+                        attempts.append(_Attempt(backup_name, backup_client, self.router.track(backup_name, call(backup_client), prompt_tokens)))
+                        self.hedged += 1
+                        logger.info(f"{provider} 首个片段超时，对冲到 {backup_name}")
+
+            # 采用先产出有效内容的一路；都失败时采用最后结束的一路，把它的错误交给调用方
+            pending = list(attempts)
+            while pending:
+                done, _ = await asyncio.wait({attempt.next for attempt in pending}, return_when=asyncio.FIRST_COMPLETED)
+                finished = [attempt for attempt in pending if attempt.next in done]
+                winner = next((attempt for attempt in finished if self._succeeded(attempt)), None)
+                if winner is not None:
+                    break
+                pending = [attempt for attempt in pending if attempt not in finished]
+                if not pending:
+                    winner = finished[-1]
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.close()
+            if winner is not attempts[0]:
+                self.hedge_wins += 1
+
+            try:
+                chunk = winner.next.result()
+            except StopAsyncIteration:
+                return
+            if on_served is not None:
+                on_served(winner.provider, winner.client)
+            yield chunk
+            async for chunk in winner.chunks:
+                yield chunk
+        finally:
+            for attempt in attempts:
+                await attempt.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """对冲统计（当前进程）"""
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "delays": {provider: round(self.hedge_delay(provider), 3) for provider in self.router.providers},
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_per_minute": self.budget.per_minute,
+            "budget_remaining": self.budget.remaining(),
+            "budget_exhausted": self.budget_exhausted,
+            "failovers": self.failovers,
+        }
+
+
+# 全局对冲实例，与模型路由器共用指标
+hedged_streamer = HedgedStreamer(
+    model_router,
+    enabled=HEDGE_ENABLED,
+    percentile=HEDGE_PERCENTILE,
+    min_delay=HEDGE_MIN_DELAY,
+    max_delay=HEDGE_MAX_DELAY,
+    default_delay=HEDGE_DEFAULT_DELAY,
+    budget_per_minute=HEDGE_BUDGET_PER_MINUTE,
+    same_provider=HEDGE_SAME_PROVIDER,
+)
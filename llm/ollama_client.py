@@ -1,33 +1,74 @@
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 import json
 import time
-from typing import Generator, Optional
+import base64
+import asyncio
+from pathlib import Path
+from typing import AsyncGenerator, Generator, Optional, List, Dict, Any
 import logging
+from .base import AsyncChatProvider, ProviderError, provider_error
 
 logger = logging.getLogger(__name__)
 
-class OllamaClient:
+class OllamaClient(AsyncChatProvider):
     """Ollama本地模型客户端"""
     
-    def __init__(self, base_url: str = "http://localhost:11434", model_name: str = "llama3.2"):
+    provider_name = "ollama"
+    
+    def __init__(self,
+                 base_url: str = "http://localhost:11434",
+                 model_name: str = "llama3.2",
+                 pool_size: int = 10,
+                 connect_timeout: float = 3.0,
+                 keepalive_expiry: float = 60.0):
         """
         初始化Ollama客户端
         
         Args:
             base_url: Ollama服务地址，默认localhost:11434
             model_name: 模型名称，默认llama3.2
+            pool_size: 每个主机保持的最大连接数
+            connect_timeout: 建立连接的超时时间（秒），读取超时按接口分别设置
+            keepalive_expiry: 异步客户端空闲连接的保持时间（秒）
         """
         self.base_url = base_url.rstrip('/')
         self.model_name = model_name
         self.api_url = f"{self.base_url}/api"
+        self.pool_size = max(1, pool_size)
+        self.connect_timeout = connect_timeout
+        self.keepalive_expiry = keepalive_expiry
+        
+        # 同步请求复用同一个会话，保持长连接，避免每次调用都重新握手
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         
-        # 测试连接
-        self._test_connection()
+        # 连接状态，None 表示尚未检测；检测在启动预热阶段进行，不阻塞构造
+        self.available: Optional[bool] = None
+        # 异步 HTTP 客户端，第一次异步调用时创建
+        self._async_client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def model(self) -> str:
+        """模型名称（与其他客户端的 model 属性一致）"""
+        return self.model_name
     
-    def _test_connection(self):
-        """测试与Ollama服务的连接"""
+    def _timeout(self, read_timeout: float):
+        """同步请求的 (连接超时, 读取超时)"""
+        return (self.connect_timeout, read_timeout)
+    
+    def _test_connection(self) -> bool:
+        """
+        测试与Ollama服务的连接（阻塞调用）
+        
+        Returns:
+            服务是否可用
+        """
         try:
-            response = requests.get(f"{self.api_url}/tags", timeout=5)
+            response = self.session.get(f"{self.api_url}/tags", timeout=self._timeout(5))
             if response.status_code == 200:
                 logger.info(f"Ollama连接成功: {self.base_url}")
                 # 检查模型是否可用
@@ -35,10 +76,14 @@ class OllamaClient:
                 available_models = [model['name'] for model in models]
                 if self.model_name not in available_models:
                     logger.warning(f"模型 {self.model_name} 不可用，可用模型: {available_models}")
+                self.available = True
             else:
                 logger.error(f"Ollama连接失败: {response.status_code}")
+                self.available = False
         except Exception as e:
             logger.error(f"无法连接到Ollama服务: {e}")
+            self.available = False
+        return self.available
     
     def chat(self, user_input: str, system_prompt: str = None) -> str:
         """
@@ -68,10 +113,10 @@ class OllamaClient:
                 }
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}/chat",
                 json=payload,
-                timeout=60
+                timeout=self._timeout(60)
             )
             
             if response.status_code == 200:
@@ -113,26 +158,26 @@ class OllamaClient:
                 }
             }
             
-            response = requests.post(
+            # 流读取完毕或提前结束时关闭响应，连接回到连接池
+            with self.session.post(
                 f"{self.api_url}/chat",
                 json=payload,
                 stream=True,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line.decode('utf-8'))
-                            if 'message' in data and 'content' in data['message']:
-                                yield data['message']['content']
-                        except json.JSONDecodeError:
-                            continue
-            else:
-                error_msg = f"错误: API调用失败 ({response.status_code})"
-                logger.error(f"Ollama流式API调用失败: {response.status_code} - {response.text}")
-                yield error_msg
+                timeout=self._timeout(60)
+            ) as response:
+                if response.status_code == 200:
+                    for line in response.iter_lines():
+                        if line:
+                            try:
+                                data = json.loads(line.decode('utf-8'))
+                                if 'message' in data and 'content' in data['message']:
+                                    yield data['message']['content']
+                            except json.JSONDecodeError:
+                                continue
+                else:
+                    error_msg = f"错误: API调用失败 ({response.status_code})"
+                    logger.error(f"Ollama流式API调用失败: {response.status_code} - {response.text}")
+                    yield error_msg
                 
         except Exception as e:
             logger.error(f"Ollama流式对话失败: {e}")
@@ -178,10 +223,10 @@ class OllamaClient:
                 }
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}/chat",
                 json=payload,
-                timeout=120  # 多模态需要更长时间
+                timeout=self._timeout(120)  # 多模态需要更长时间
             )
             
             if response.status_code == 200:
@@ -236,26 +281,26 @@ class OllamaClient:
                 }
             }
             
-            response = requests.post(
+            # 流读取完毕或提前结束时关闭响应，连接回到连接池
+            with self.session.post(
                 f"{self.api_url}/chat",
                 json=payload,
                 stream=True,
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line.decode('utf-8'))
-                            if 'message' in data and 'content' in data['message']:
-                                yield data['message']['content']
-                        except json.JSONDecodeError:
-                            continue
-            else:
-                error_msg = f"错误: 多模态API调用失败 ({response.status_code})"
-                logger.error(f"Ollama多模态流式API调用失败: {response.status_code} - {response.text}")
-                yield error_msg
+                timeout=self._timeout(120)
+            ) as response:
+                if response.status_code == 200:
+                    for line in response.iter_lines():
+                        if line:
+                            try:
+                                data = json.loads(line.decode('utf-8'))
+                                if 'message' in data and 'content' in data['message']:
+                                    yield data['message']['content']
+                            except json.JSONDecodeError:
+                                continue
+                else:
+                    error_msg = f"错误: 多模态API调用失败 ({response.status_code})"
+                    logger.error(f"Ollama多模态流式API调用失败: {response.status_code} - {response.text}")
+                    yield error_msg
                 
         except Exception as e:
             logger.error(f"Ollama多模态流式对话失败: {e}")
@@ -283,7 +328,7 @@ class OllamaClient:
             
             # 如果是HTTP URL
             elif image_url.startswith('http'):
-                response = requests.get(image_url, timeout=10)
+                response = self.session.get(image_url, timeout=self._timeout(10))
                 if response.status_code == 200:
                     image_data = base64.b64encode(response.content).decode('utf-8')
                     return image_data
@@ -307,7 +352,7 @@ class OllamaClient:
             模型列表
         """
         try:
-            response = requests.get(f"{self.api_url}/tags", timeout=5)
+            response = self.session.get(f"{self.api_url}/tags", timeout=self._timeout(5))
             if response.status_code == 200:
                 result = response.json()
                 return result.get('models', [])
@@ -330,7 +375,7 @@ class OllamaClient:
         """
         try:
             payload = {"name": model_name}
-            response = requests.post(f"{self.api_url}/pull", json=payload, timeout=300)
+            response = self.session.post(f"{self.api_url}/pull", json=payload, timeout=self._timeout(300))
             
             if response.status_code == 200:
                 logger.info(f"模型 {model_name} 拉取成功")
@@ -341,4 +386,157 @@ class OllamaClient:
                 
         except Exception as e:
             logger.error(f"模型拉取异常: {e}")
-            return False 
\ No newline at end of file
+            return False
+    
+    # 异步接口：在事件循环上完成所有网络 I/O
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+        return self._async_client
+    
+    def _async_timeout(self, read_timeout: float) -> httpx.Timeout:
+        """异步请求的超时设置，连接超时与读取超时分开"""
+        return httpx.Timeout(read_timeout, connect=self.connect_timeout)
+    
+    def _build_payload(self, messages: List[Dict[str, Any]], stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "max_tokens": 2048
+            }
+        }
+    
+    @staticmethod
+    def _build_messages(content: Any, system_prompt: str = None,
+                        history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, Any]]:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.extend(history or [])
+        messages.append({"role": "user", "content": content})
+        return messages
+    
+    async def _post_chat_async(self, messages: List[Dict[str, Any]], timeout: float) -> str:
+        response = await self._get_async_client().post(
+            f"{self.api_url}/chat",
+            json=self._build_payload(messages, stream=False),
+            timeout=self._async_timeout(timeout)
+        )
+        if response.status_code == 200:
+            return response.json().get('message', {}).get('content', '')
+        logger.error(f"Ollama API调用失败: {response.status_code} - {response.text}")
+        raise ProviderError(self.provider_name, f"API调用失败 ({response.status_code})")
+    
+    async def _stream_chat_async(self, messages: List[Dict[str, Any]], timeout: float) -> AsyncGenerator[str, None]:
+        async with self._get_async_client().stream(
+            "POST",
+            f"{self.api_url}/chat",
+            json=self._build_payload(messages, stream=True),
+            timeout=self._async_timeout(timeout)
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                logger.error(f"Ollama流式API调用失败: {response.status_code} - {body.decode('utf-8', errors='replace')}")
+                raise ProviderError(self.provider_name, f"API调用失败 ({response.status_code})")
+            
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'message' in data and 'content' in data['message']:
+                    yield data['message']['content']
+    
+    async def chat_async(self, user_input: str, system_prompt: str = None) -> str:
+        """非流式对话（异步），失败时抛出 ProviderError"""
+        try:
+            return await self._post_chat_async(self._build_messages(user_input, system_prompt), timeout=60)
+        except Exception as e:
+            logger.error(f"Ollama对话失败: {e}")
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_stream_async(self, user_input: str, system_prompt: str = None,
+                                history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """流式对话（异步生成器），history 为之前的对话消息，失败时抛出 ProviderError"""
+        try:
+            async for content in self._stream_chat_async(self._build_messages(user_input, system_prompt, history), timeout=60):
+                yield content
+        except Exception as e:
+            logger.error(f"Ollama流式对话失败: {e}")
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_multimodal_async(self, text: str, image_url: str, system_prompt: str = None) -> str:
+        """多模态对话（异步，非流式），失败时抛出 ProviderError"""
+        try:
+            image_data = await self._load_image_async(image_url)
+            if not image_data:
+                raise ProviderError(self.provider_name, "无法加载图片")
+            content = [
+                {"type": "text", "text": text},
+                {"type": "image", "image": image_data}
+            ]
+            return await self._post_chat_async(self._build_messages(content, system_prompt), timeout=120)
+        except Exception as e:
+            logger.error(f"Ollama多模态对话失败: {e}")
+            raise provider_error(self.provider_name, e) from e
+    
+    async def chat_multimodal_stream_async(self, text: str, image_url: str, system_prompt: str = None,
+                                           history: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+        """多模态流式对话（异步生成器），history 为之前的对话消息，失败时抛出 ProviderError"""
+        try:
+            image_data = await self._load_image_async(image_url)
+            if not image_data:
+                raise ProviderError(self.provider_name, "无法加载图片")
+            content = [
+                {"type": "text", "text": text},
+                {"type": "image", "image": image_data}
+            ]
+            async for chunk in self._stream_chat_async(self._build_messages(content, system_prompt, history), timeout=120):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Ollama多模态流式对话失败: {e}")
+            raise provider_error(self.provider_name, e) from e
+    
+    async def _load_image_async(self, image_url: str) -> Optional[str]:
+        """_load_image 的异步版本，本地文件在线程中读取，远程图片通过异步 HTTP 下载"""
+        try:
+            if Path(image_url).exists():
+                data = await asyncio.to_thread(Path(image_url).read_bytes)
+                return base64.b64encode(data).decode('utf-8')
+            
+            if image_url.startswith('http'):
+                response = await self._get_async_client().get(image_url, timeout=self._async_timeout(10))
+                if response.status_code == 200:
+                    return base64.b64encode(response.content).decode('utf-8')
+                logger.error(f"无法下载图片: {response.status_code}")
+                return None
+            
+            logger.error(f"不支持的图片URL格式: {image_url}")
+            return None
+        except Exception as e:
+            logger.error(f"加载图片失败: {e}")
+            return None
+    
+    def close(self):
+        """关闭同步会话中的连接"""
+        self.session.close()
+    
+    async def aclose(self):
+        """关闭异步 HTTP 客户端"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
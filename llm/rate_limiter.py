@@ -0,0 +1,315 @@
+import asyncio
+import time
+import uuid
+import logging
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+from config import (
+    LIMITER_ENABLED,
+    LIMITER_REDIS_ENABLED,
+    LIMITER_CONCURRENCY,
+    LIMITER_TPM,
+    LIMITER_QUEUE_TIMEOUT,
+)
+from database.redis_client import redis_session_manager
+from .base import RateLimitTimeoutError, parse_provider_values
+
+logger = logging.getLogger(__name__)
+
+# 分布式模式下的占用记录：清理过期占用 -> 检查并发数 -> 检查本分钟 token 用量 -> 占用
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local max_concurrency = tonumber(ARGV[4])
+if max_concurrency > 0 and redis.call('ZCARD', KEYS[1]) >= max_concurrency then
+    return 0
+end
+local tpm = tonumber(ARGV[6])
+if tpm > 0 then
+    local used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if used > 0 and used + tonumber(ARGV[5]) > tpm then
+        return -1
+    end
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[3]), ARGV[2])
+redis.call('INCRBY', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[2], 120)
+return 1
+"""
+
+
+class Lease:
+    """一次调用占用的名额"""
+
+    def __init__(self, name: str, tokens: int, lease_id: Optional[str] = None, window_key: Optional[str] = None):
+        self.name = name
+        self.tokens = tokens
+        self.lease_id = lease_id
+        self.window_key = window_key
+
+
+class ProviderLimiter:
+    """
+    单个模型提供方的并发与每分钟 token 限制
+    等待的请求按到达顺序排队，只有队首可以占用名额；超过截止时间仍未轮到时放弃
+    """
+
+    PREFIX = "llmlimit"
+    # 分布式占用的最长保留时间（秒），防止进程退出后名额无法归还
+    LEASE_TTL = 300
+    # 分布式模式下队首轮询 Redis 的间隔（秒）
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, name: str, max_concurrency: int = 0, tpm: int = 0, use_redis: bool = False):
+        """
+        初始化
+
+        Args:
+            name: 提供方名称
+            max_concurrency: 同时进行的最大调用数，0 表示不限制
+            tpm: 每分钟 token 预算（估算值），0 表示不限制
+            use_redis: 是否通过 Redis 在多个 worker 之间共享限制
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.tpm = tpm
+        self.use_redis = use_redis
+
+        self.in_flight = 0
+        # 本地令牌桶，容量为每分钟预算，按秒匀速补充
+        self._tokens = float(tpm)
+        self._refilled_at = time.monotonic()
+        self._queue: deque = deque()
+        self._changed = asyncio.Event()
+
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_times: deque = deque(maxlen=500)
+        self.redis_errors = 0
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.tpm), self._tokens + (now - self._refilled_at) * self.tpm / 60)
+        self._refilled_at = now
+
+    def _try_take_local(self, tokens: int) -> Tuple[bool, Optional[float]]:
+        """
+        Returns:
+            (是否占用成功, 预计多少秒后 token 足够；因并发数受限时为 None，等待释放通知)
+        """
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return False, None
+        if self.tpm:
+            self._refill()
+            # 单次估算超过整个预算时，等令牌桶满了再放行，避免永远等不到
+            needed = min(tokens, self.tpm)
+            if self._tokens < needed:
+                return False, (needed - self._tokens) * 60 / self.tpm
+            self._tokens -= tokens
+        return True, None
+
+    async def _try_take_redis(self, lease: Lease) -> Tuple[bool, Optional[float]]:
+        redis = redis_session_manager.async_redis_client
+        minute = int(time.time() // 60)
+        lease.lease_id = uuid.uuid4().hex
+        lease.window_key = f"{self.PREFIX}:{self.name}:tokens:{minute}"
+        result = await redis.eval(
+            ACQUIRE_SCRIPT,
+            2,
+            f"{self.PREFIX}:{self.name}:leases",
+            lease.window_key,
+            time.time(),
+            lease.lease_id,
+            self.LEASE_TTL,
+            self.max_concurrency,
+            lease.tokens,
+            self.tpm,
+        )
+        if int(result) == 1:
+            return True, None
+        if int(result) == -1:
+            # 本分钟预算已用完，等到下一分钟
+            return False, max(self.POLL_INTERVAL, (minute + 1) * 60 - time.time())
+        return False, self.POLL_INTERVAL
+
+    async def _try_take(self, lease: Lease) -> Tuple[bool, Optional[float]]:
+        if self.use_redis:
+            try:
+                taken, retry_after = await self._try_take_redis(lease)
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"限流无法访问 Redis，改用本地限制: {e}")
+                lease.lease_id = None
+                taken, retry_after = self._try_take_local(lease.tokens)
+        else:
+            taken, retry_after = self._try_take_local(lease.tokens)
+        if taken:
+            self.in_flight += 1
+        return taken, retry_after
+
+    async def acquire(self, tokens: int, timeout: float) -> Lease:
+        """
+        排队等待调用名额
+
+        Args:
+            tokens: 本次调用估算的 token 数（输入加预期输出）
+            timeout: 最长排队时间（秒）
+
+        Returns:
+            占用的名额，调用结束后交给 release
+
+        Raises:
+            RateLimitTimeoutError: 排队超时
+        """
+        loop = asyncio.get_running_loop()
+        enqueued_at = loop.time()
+        deadline = enqueued_at + timeout
+        lease = Lease(self.name, tokens)
+        ticket = object()
+        self._queue.append(ticket)
+        try:
+            while True:
+                retry_after = None
+                if self._queue[0] is ticket:
+                    taken, retry_after = await self._try_take(lease)
+                    if taken:
+                        break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise RateLimitTimeoutError(self.name, f"排队等待超过 {timeout:g} 秒")
+                wait = remaining if retry_after is None else min(remaining, retry_after)
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._queue.remove(ticket)
+            # 队首已离开，唤醒下一个
+            self._notify()
+
+        self.acquired += 1
+        self.wait_times.append(loop.time() - enqueued_at)
+        return lease
+
+    async def release(self, lease: Lease, actual_tokens: Optional[int] = None):
+        """
+        归还名额，并按实际 token 数修正预算
+
+        Args:
+            lease: acquire 返回的名额
+            actual_tokens: 实际消耗的 token 数，为空时不修正
+        """
+        self.in_flight -= 1
+        correction = actual_tokens - lease.tokens if actual_tokens is not None else 0
+        if lease.lease_id is not None:
+            try:
+                redis = redis_session_manager.async_redis_client
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.zrem(f"{self.PREFIX}:{self.name}:leases", lease.lease_id)
+                    if correction:
+                        pipe.incrby(lease.window_key, correction)
+                    await pipe.execute()
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"归还限流名额失败: {e}")
+        elif self.tpm and correction:
+            self._refill()
+            self._tokens = min(float(self.tpm), self._tokens - correction)
+        self._notify()
+
+    def get_stats(self) -> Dict[str, Any]:
+        wait_times = sorted(self.wait_times)
+
+        def percentile(p: float) -> float:
+            if not wait_times:
+                return 0.0
+            return round(wait_times[min(len(wait_times) - 1, int(len(wait_times) * p / 100))] * 1000, 1)
+
+        if self.tpm and not self.use_redis:
+            self._refill()
+        return {
+            "max_concurrency": self.max_concurrency,
+            "tpm": self.tpm,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "tokens_available": round(self._tokens) if self.tpm and not self.use_redis else None,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "wait_ms_avg": round(sum(wait_times) / len(wait_times) * 1000, 1) if wait_times else 0.0,
+            "wait_ms_p50": percentile(50),
+            "wait_ms_p95": percentile(95),
+            "wait_ms_max": round(wait_times[-1] * 1000, 1) if wait_times else 0.0,
+            "redis_errors": self.redis_errors,
+        }
+
+
+class RateLimiter:
+    """各模型提供方的限流器集合"""
+
+    def __init__(self,
+                 enabled: bool = True,
+                 use_redis: bool = False,
+                 concurrency: Optional[Dict[str, float]] = None,
+                 tpm: Optional[Dict[str, float]] = None,
+                 queue_timeout: float = 20.0):
+        """
+        初始化
+
+        Args:
+            enabled: 是否启用
+            use_redis: 是否通过 Redis 在多个 worker 之间共享限制
+            concurrency: 各提供方的最大并发数
+            tpm: 各提供方的每分钟 token 预算
+            queue_timeout: 默认最长排队时间（秒）
+        """
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.concurrency = concurrency or {}
+        self.tpm = tpm or {}
+        self.queue_timeout = queue_timeout
+        self.limiters: Dict[str, ProviderLimiter] = {}
+
+    def get(self, name: str) -> ProviderLimiter:
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            limiter = ProviderLimiter(
+                name,
+                max_concurrency=int(self.concurrency.get(name, 0)),
+                tpm=int(self.tpm.get(name, 0)),
+                use_redis=self.use_redis,
+            )
+            self.limiters[name] = limiter
+        return limiter
+
+    async def acquire(self, name: str, tokens: int, timeout: Optional[float] = None) -> Optional[Lease]:
+        """排队等待提供方的调用名额，未启用时返回 None"""
+        if not self.enabled:
+            return None
+        return await self.get(name).acquire(tokens, self.queue_timeout if timeout is None else timeout)
+
+    async def release(self, lease: Optional[Lease], actual_tokens: Optional[int] = None):
+        if lease is not None:
+            await self.get(lease.name).release(lease, actual_tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各提供方的排队和等待时间统计（当前进程）"""
+        return {
+            "enabled": self.enabled,
+            "redis": self.use_redis,
+            "queue_timeout": self.queue_timeout,
+            "providers": {name: limiter.get_stats() for name, limiter in self.limiters.items()},
+        }
+
+
+# 全局限流器，由模型路由器在每次调用前使用
+rate_limiter = RateLimiter(
+    enabled=LIMITER_ENABLED,
+    use_redis=LIMITER_REDIS_ENABLED,
+    concurrency=parse_provider_values(LIMITER_CONCURRENCY),
+    tpm=parse_provider_values(LIMITER_TPM),
+    queue_timeout=LIMITER_QUEUE_TIMEOUT,
+)
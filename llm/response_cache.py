@@ -0,0 +1,260 @@
+import json
+import time
+import hashlib
+import unicodedata
+import re
+import logging
+from typing import AsyncGenerator, AsyncIterator, Callable, List, Optional, Dict, Any, Union
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+from config import LLM_CACHE_ENABLED, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES
+from database.redis_client import redis_session_manager
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class LLMResponseCache:
+    """
+    精确匹配的模型回复缓存（Redis）
+    以 (模型, 系统提示词, 规范化后的输入) 的哈希为键保存完整的流式片段，
+    命中时直接回放，不再调用付费接口
+    """
+
+    PREFIX = "llmcache"
+    # 条目被并发修改时事务的最多重试次数
+    WATCH_RETRIES = 5
+
+    def __init__(self,
+                 enabled: bool = False,
+                 ttl: int = 86400,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 redis_client: Optional[aioredis.Redis] = None):
+        """
+        初始化缓存
+
+        Args:
+            enabled: 是否启用（默认关闭，需要显式开启）
+            ttl: 每条缓存最后一次写入或命中之后的过期时间（秒）
+            max_bytes: 缓存内容占用的总字节上限，超出后淘汰最久未命中的条目
+            redis_client: Redis 异步客户端，默认在第一次使用时取共用连接
+        """
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._redis = redis_client
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = redis_session_manager.async_redis_client
+        return self._redis
+
+    @staticmethod
+    def normalize_input(user_input: str) -> str:
+        """统一全角/半角等兼容字符、合并空白，不改变大小写"""
+        text = unicodedata.normalize("NFKC", user_input)
+        return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+    def make_key(self, model: str, system_prompt: str, user_input: str) -> str:
+        """计算缓存键"""
+        payload = json.dumps({
+            "model": model or "",
+            "system_prompt": system_prompt or "",
+            "input": self.normalize_input(user_input),
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.PREFIX}:entry:{key}"
+
+    @property
+    def _index_key(self) -> str:
+        # 有序集合：缓存键 -> 最近访问时间
+        return f"{self.PREFIX}:index"
+
+    @property
+    def _sizes_key(self) -> str:
+        # 哈希：缓存键 -> 占用字节数
+        return f"{self.PREFIX}:sizes"
+
+    @property
+    def _total_key(self) -> str:
+        # 所有条目占用字节数之和
+        return f"{self.PREFIX}:bytes"
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """
+        查找缓存
+
+        Returns:
+            命中时返回保存的回复片段列表，否则返回 None（Redis 不可用时同样视为未命中）
+        """
+        if not self.enabled:
+            return None
+        try:
+            value = await self.redis.get(self._entry_key(key))
+            if value is None:
+                self.misses += 1
+                return None
+            # 命中时同时顺延过期时间，与索引中的最近访问时间保持一致，
+            # 否则 Redis 中已过期的条目仍按索引计入总字节数
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(self._index_key, {key: time.time()})
+                pipe.expire(self._entry_key(key), self.ttl)
+                await pipe.execute()
+            self.hits += 1
+            return json.loads(value)["chunks"]
+        except Exception as e:
+            self.errors += 1
+            self.misses += 1
+            logger.warning(f"读取模型回复缓存失败: {e}")
+            return None
+
+    async def put(self, key: str, chunks: List[str]) -> bool:
+        """
+        保存一条完整的回复，并在超出容量时淘汰
+
+        Returns:
+            是否写入成功
+        """
+        if not self.enabled or not chunks:
+            return False
+        value = json.dumps({"chunks": chunks, "created_at": time.time()}, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return False
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for _ in range(self.WATCH_RETRIES):
+                    try:
+                        # 同一个键被并发写入或删除时重试，旧的大小不会被重复计算
+                        await pipe.watch(self._entry_key(key))
+                        old_size = int(await pipe.hget(self._sizes_key, key) or 0)
+                        pipe.multi()
+                        pipe.set(self._entry_key(key), value, ex=self.ttl)
+                        pipe.zadd(self._index_key, {key: time.time()})
+                        pipe.hset(self._sizes_key, key, size)
+                        pipe.incrby(self._total_key, size - old_size)
+                        await pipe.execute()
+                        break
+                    except WatchError:
+                        continue
+                else:
+                    return False
+            self.stores += 1
+            await self._evict()
+            return True
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"写入模型回复缓存失败: {e}")
+            return False
+
+    async def _evict(self):
+        """清理已过期条目的记录，再按最近访问时间淘汰到容量以内"""
+        expired = await self.redis.zrangebyscore(self._index_key, "-inf", time.time() - self.ttl)
+        if expired:
+            await self._remove(expired)
+
+        total = int(await self.redis.get(self._total_key) or 0)
+        while total > self.max_bytes:
+            oldest = await self.redis.zrange(self._index_key, 0, 15)
+            if not oldest:
+                break
+            removed = await self._remove(oldest, limit_bytes=total - self.max_bytes)
+            if removed <= 0:
+                break
+            total -= removed
+
+    async def _remove(self, keys: List[str], limit_bytes: Optional[int] = None) -> int:
+        """删除条目，limit_bytes 不为空时删够这么多字节就停止；返回删除的字节数"""
+        removed = 0
+        for key in keys:
+            if limit_bytes is not None and removed >= limit_bytes:
+                break
+            size = 0
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for _ in range(self.WATCH_RETRIES):
+                    try:
+                        await pipe.watch(self._entry_key(key))
+                        size = int(await pipe.hget(self._sizes_key, key) or 0)
+                        pipe.multi()
+                        pipe.delete(self._entry_key(key))
+                        pipe.zrem(self._index_key, key)
+                        pipe.hdel(self._sizes_key, key)
+                        pipe.decrby(self._total_key, size)
+                        await pipe.execute()
+                        break
+                    except WatchError:
+                        size = 0
+                        continue
+            removed += size
+            self.evictions += 1
+        return removed
+
+    async def record(self, key: Union[str, Callable[[], Optional[str]]], chunks: AsyncIterator[str],
+                     on_stored: Optional[Callable[[str], None]] = None) -> AsyncGenerator[str, None]:
+        """
+        转发模型输出，流正常结束后把完整回复写入缓存
+        中途断开或模型调用失败（抛出异常）时不缓存
+
+        Args:
+            key: 缓存键；或在流结束后返回缓存键的函数（实际回复的模型要等调用结束才确定时使用），
+                返回 None 时不缓存
+            chunks: 模型输出的文本片段
+            on_stored: 写入成功后以缓存键调用的回调
+        """
+        collected: List[str] = []
+        async for chunk in chunks:
+            collected.append(chunk)
+            yield chunk
+        if collected:
+            if callable(key):
+                key = key()
+                if key is None:
+                    return
+            if await self.put(key, collected) and on_stored is not None:
+                on_stored(key)
+
+    @staticmethod
+    async def replay(chunks: List[str]) -> AsyncGenerator[str, None]:
+        """把缓存的片段作为流依次产出"""
+        for chunk in chunks:
+            yield chunk
+
+    async def clear(self) -> int:
+        """清空全部缓存，返回删除的条目数"""
+        keys = await self.redis.zrange(self._index_key, 0, -1)
+        await self._remove(keys)
+        await self.redis.delete(self._index_key, self._sizes_key, self._total_key)
+        return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率等统计信息（当前进程）"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+# 全局缓存实例
+response_cache = LLMResponseCache(
+    enabled=LLM_CACHE_ENABLED,
+    ttl=LLM_CACHE_TTL,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+)
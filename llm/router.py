@@ -0,0 +1,400 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from config import (
+    ROUTER_ENABLED,
+    ROUTER_EWMA_ALPHA,
+    ROUTER_WEIGHT_TTFT,
+    ROUTER_WEIGHT_TPS,
+    ROUTER_WEIGHT_ERROR,
+    ROUTER_WEIGHT_COST,
+    ROUTER_EXPECTED_TOKENS,
+    ROUTER_EXPLORE_RATE,
+    ROUTER_COSTS,
+    ROUTER_MAX_COST,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_COOL_DOWN,
+    BREAKER_HALF_OPEN_MAX_CALLS,
+    LLM_STREAM_IDLE_TIMEOUT,
+    OLLAMA_MULTIMODAL,
+)
+from .base import CircuitOpenError, ProviderTimeoutError, parse_provider_values
+from .circuit_breaker import CircuitBreaker
+from .rate_limiter import RateLimiter, rate_limiter
+from .clients import get_doubao_client, get_deepseek_client, get_ollama_client
+
+logger = logging.getLogger(__name__)
+
+TEXT = "text"
+MULTIMODAL = "multimodal"
+
+# 还没有样本时使用的估计值
+DEFAULT_TTFT = 2.0
+DEFAULT_TPS = 20.0
+
+
+class ProviderStats:
+    """单个提供方的指数加权滑动平均指标"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.ttft: Optional[float] = None
+        self.tps: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.last_error_at: Optional[float] = None
+        # 最近的首个片段延迟样本，用于计算分位数
+        self.ttft_samples: deque = deque(maxlen=200)
+
+    def _ewma(self, current: Optional[float], sample: float) -> float:
+        return sample if current is None else self.alpha * sample + (1 - self.alpha) * current
+
+    def record_success(self, ttft: float, tps: Optional[float]):
+        self.requests += 1
+        self.ttft = self._ewma(self.ttft, ttft)
+        self.ttft_samples.append(ttft)
+        if tps is not None:
+            self.tps = self._ewma(self.tps, tps)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+
+    def ttft_percentile(self, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """首个片段延迟的分位数（秒），样本不足时返回 None"""
+        if len(self.ttft_samples) < min_samples:
+            return None
+        samples = sorted(self.ttft_samples)
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def record_error(self):
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+        self.last_error_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        p95 = self.ttft_percentile(95)
+        return {
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "tokens_per_second": round(self.tps, 2) if self.tps is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "last_error_at": self.last_error_at,
+        }
+
+
+class ModelRouter:
+    """
+    按延迟选择模型提供方
+    记录每个提供方的首个片段延迟、输出速度（以流式片段数近似 token 数）和错误率，
+    每次请求在具备所需能力、健康且未超出价格上限的提供方中选择得分最低（最快）的一个；
+    每个提供方有独立的熔断器，熔断中的提供方直接跳过
+    """
+
+    def __init__(self,
+                 enabled: bool = False,
+                 alpha: float = 0.3,
+                 weights: Optional[Dict[str, float]] = None,
+                 expected_tokens: int = 400,
+                 explore_rate: float = 0.05,
+                 max_cost: float = 0.0,
+                 failure_threshold: int = 5,
+                 cool_down: float = 30.0,
+                 half_open_max_calls: int = 1,
+                 idle_timeout: float = 30.0,
+                 limiter: Optional[RateLimiter] = None):
+        """
+        初始化路由器
+
+        Args:
+            enabled: 是否按指标选择；关闭时始终使用每种能力的首选提供方（仍记录指标）
+            alpha: 滑动平均的新样本权重
+            weights: 得分权重 {"ttft", "tps", "error", "cost"}
+            expected_tokens: 估算整段回复耗时时假定的回复长度
+            explore_rate: 随机选择其他健康提供方的概率，用于刷新其指标
+            max_cost: 每千 token 的价格上限，0 表示不限制
+            failure_threshold: 熔断器连续失败多少次后打开
+            cool_down: 熔断器打开后的冷却时间（秒）
+            half_open_max_calls: 熔断器半开状态下放行的探测请求数
+            idle_timeout: 多久没有新片段视为超时（秒）
+            limiter: 各提供方的并发与 token 限流器，为空时不限流
+        """
+        self.enabled = enabled
+        self.alpha = alpha
+        self.weights = {"ttft": 1.0, "tps": 1.0, "error": 30.0, "cost": 0.0, **(weights or {})}
+        self.expected_tokens = expected_tokens
+        self.explore_rate = explore_rate
+        self.max_cost = max_cost
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.half_open_max_calls = half_open_max_calls
+        self.idle_timeout = idle_timeout
+        self.limiter = limiter
+
+        # 注册顺序即各能力的首选顺序
+        self.providers: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, ProviderStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def register(self,
+                 name: str,
+                 get_client: Callable[[], Any],
+                 capabilities: Set[str],
+                 cost: float = 0.0,
+                 is_available: Optional[Callable[[], bool]] = None):
+        """
+        注册提供方
+
+        Args:
+            name: 提供方名称
+            get_client: 获取客户端实例的函数
+            capabilities: 支持的能力（text、multimodal）
+            cost: 每千 token 的价格，用于价格上限和得分
+            is_available: 额外的可用性检查（如本地服务是否已连通）
+        """
+        self.providers[name] = {
+            "get_client": get_client,
+            "capabilities": set(capabilities),
+            "cost": cost,
+            "is_available": is_available,
+        }
+        self.stats[name] = ProviderStats(self.alpha)
+        self.breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=self.failure_threshold,
+            cool_down=self.cool_down,
+            half_open_max_calls=self.half_open_max_calls
+        )
+
+    def is_healthy(self, name: str) -> bool:
+        """提供方是否可用：服务已连通且熔断器未打开"""
+        provider = self.providers[name]
+        if provider["is_available"] is not None:
+            try:
+                if not provider["is_available"]():
+                    return False
+            except Exception:
+                return False
+        return self.breakers[name].is_available()
+
+    def score(self, name: str) -> float:
+        """估算得分（秒），越低越好"""
+        stats = self.stats[name]
+        ttft = stats.ttft if stats.ttft is not None else DEFAULT_TTFT
+        tps = stats.tps if stats.tps else DEFAULT_TPS
+        return (
+            self.weights["ttft"] * ttft
+            + self.weights["tps"] * self.expected_tokens / tps
+            + self.weights["error"] * stats.error_rate
+            + self.weights["cost"] * self.providers[name]["cost"]
+        )
+
+    def candidates(self, capability: str, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        按优先顺序返回具备该能力的提供方（不可用的排在最后）
+        超出价格上限的提供方不在其中，也不会作为对冲或失败切换的备用
+        """
+        capable = [
+            name for name, provider in self.providers.items()
+            if capability in provider["capabilities"] and name not in exclude
+            and (not self.max_cost or provider["cost"] <= self.max_cost)
+        ]
+        healthy = [name for name in capable if self.is_healthy(name)]
+        if self.enabled:
+            healthy = sorted(healthy, key=self.score)
+        return healthy + [name for name in capable if name not in healthy]
+
+    def _unavailable(self, capability: str) -> CircuitOpenError:
+        if self.max_cost:
+            return CircuitOpenError(capability, f"没有可用的模型（每千 token 价格上限 {self.max_cost:g}）")
+        return CircuitOpenError(capability, "没有可用的模型")
+
+    def preferred(self, capability: str) -> Tuple[str, Any]:
+        """
+        当前排在首位的提供方，不经过熔断器（不占用半开状态的探测名额），
+        用于在真正调用模型之前确定缓存键等
+
+        Returns:
+            (提供方名称, 客户端实例)
+
+        Raises:
+            CircuitOpenError: 没有具备该能力（且在价格上限以内）的提供方
+        """
+        candidates = self.candidates(capability)
+        if not candidates:
+            raise self._unavailable(capability)
+        return candidates[0], self.providers[candidates[0]]["get_client"]()
+
+    def acquire(self, name: str) -> Any:
+        """
+        通过熔断器获取提供方的客户端
+
+        Raises:
+            CircuitOpenError: 熔断器打开或半开状态的探测名额已用完
+        """
+        if not self.breakers[name].allow_request():
+            raise CircuitOpenError(name, "熔断中，暂时跳过")
+        return self.providers[name]["get_client"]()
+
+    def select(self, capability: str, exclude: Iterable[str] = ()) -> Tuple[str, Any]:
+        """
+        选择提供方，熔断中的提供方直接跳过
+
+        Args:
+            capability: 所需能力（text、multimodal）
+            exclude: 不参与选择的提供方（如已失败的）
+
+        Returns:
+            (提供方名称, 客户端实例)
+
+        Raises:
+            CircuitOpenError: 没有可用的提供方（包括都超出价格上限）
+        """
+        candidates = [name for name in self.candidates(capability, exclude) if self.is_healthy(name)]
+        if self.enabled and len(candidates) > 1 and random.random() < self.explore_rate:
+            explored = random.choice(candidates[1:])
+            candidates.remove(explored)
+            candidates.insert(0, explored)
+
+        for name in candidates:
+            try:
+                return name, self.acquire(name)
+            except CircuitOpenError:
+                continue
+        raise self._unavailable(capability)
+
+    async def track(self, name: str, chunks: AsyncIterator[str], prompt_tokens: int = 0) -> AsyncGenerator[str, None]:
+        """
+        转发提供方的输出，记录指标并驱动熔断器
+        发出请求前先在限流器中排队（排队时间不计入首个片段延迟）；
+        超过 idle_timeout 没有新片段时抛出 ProviderTimeoutError；
+        调用方提前结束时只记录已观测到的首个片段延迟
+
+        Args:
+            name: 提供方名称
+            chunks: 提供方的流式输出（尚未开始迭代）
+            prompt_tokens: 输入的估算 token 数，加上预期回复长度作为限流预算
+
+        Raises:
+            RateLimitTimeoutError: 排队超时，请求未发出
+            ProviderError: 调用失败或超时
+        """
+        stats = self.stats[name]
+        breaker = self.breakers[name]
+        lease = None
+        if self.limiter is not None:
+            try:
+                lease = await self.limiter.acquire(name, prompt_tokens + self.expected_tokens)
+            except BaseException:
+                # 请求没有发出，归还熔断器半开状态的探测名额
+                breaker.release()
+                if hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                raise
+        start = time.perf_counter()
+        first_at: Optional[float] = None
+        count = 0
+        failed = False
+        completed = False
+        iterator = chunks.__aiter__()
+        with self._lock:
+            stats.in_flight += 1
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=self.idle_timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise ProviderTimeoutError(name, f"{self.idle_timeout:g} 秒内没有输出")
+                if first_at is None:
+                    first_at = time.perf_counter()
+                count += 1
+                yield chunk
+            completed = True
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+            end = time.perf_counter()
+            with self._lock:
+                stats.in_flight -= 1
+                if failed or (completed and first_at is None):
+                    stats.record_error()
+                elif first_at is not None:
+                    duration = end - first_at
+                    tps = count / duration if completed and count > 1 and duration > 0 else None
+                    stats.record_success(first_at - start, tps)
+            if failed or (completed and first_at is None):
+                breaker.record_failure()
+            elif first_at is not None:
+                breaker.record_success()
+            else:
+                breaker.release()
+            if self.limiter is not None:
+                await self.limiter.release(lease, prompt_tokens + count)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各提供方的指标和当前排序"""
+        return {
+            "enabled": self.enabled,
+            "weights": self.weights,
+            "max_cost": self.max_cost,
+            "providers": {
+                name: {
+                    **self.stats[name].to_dict(),
+                    "capabilities": sorted(provider["capabilities"]),
+                    "cost": provider["cost"],
+                    "healthy": self.is_healthy(name),
+                    "breaker": self.breakers[name].get_stats(),
+                    "score": round(self.score(name), 3),
+                }
+                for name, provider in self.providers.items()
+            },
+            "order": {
+                capability: self.candidates(capability)
+                for capability in (TEXT, MULTIMODAL)
+            },
+        }
+
+
+# 全局路由器：文本默认 DeepSeek，多模态默认豆包，Ollama 连通后参与选择
+_costs = parse_provider_values(ROUTER_COSTS)
+model_router = ModelRouter(
+    enabled=ROUTER_ENABLED,
+    alpha=ROUTER_EWMA_ALPHA,
+    weights={
+        "ttft": ROUTER_WEIGHT_TTFT,
+        "tps": ROUTER_WEIGHT_TPS,
+        "error": ROUTER_WEIGHT_ERROR,
+        "cost": ROUTER_WEIGHT_COST,
+    },
+    expected_tokens=ROUTER_EXPECTED_TOKENS,
+    explore_rate=ROUTER_EXPLORE_RATE,
+    max_cost=ROUTER_MAX_COST,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    cool_down=BREAKER_COOL_DOWN,
+    half_open_max_calls=BREAKER_HALF_OPEN_MAX_CALLS,
+    idle_timeout=LLM_STREAM_IDLE_TIMEOUT,
+    limiter=rate_limiter,
+)
+model_router.register("deepseek", get_deepseek_client, {TEXT}, cost=_costs.get("deepseek", 0.0))
+model_router.register("doubao", get_doubao_client, {TEXT, MULTIMODAL}, cost=_costs.get("doubao", 0.0))
+model_router.register(
+    "ollama",
+    get_ollama_client,
+    {TEXT, MULTIMODAL} if OLLAMA_MULTIMODAL else {TEXT},
+    cost=_costs.get("ollama", 0.0),
+    is_available=lambda: get_ollama_client().available is True,
+)
@@ -0,0 +1,268 @@
+import re
+import math
+import time
+import zlib
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Any, Tuple
+from config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
+
+# 请求中不影响图表内容的客套和动作词，向量化前去掉
+FILLER_PHRASES = [
+    "请你", "请帮我", "帮我", "麻烦", "请", "给我", "一下",
+    "画一个", "画一张", "画个", "画出", "画",
+    "生成一个", "生成一张", "生成", "绘制一个", "绘制", "设计一个", "设计",
+    "一个", "一张", "关于", "的",
+]
+FILLER_PATTERN = re.compile("|".join(re.escape(phrase) for phrase in sorted(FILLER_PHRASES, key=len, reverse=True)))
+NON_WORD_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+# 图表类型关键词：类型不同的请求即使文字相似也不能互相命中
+DIAGRAM_TYPE_KEYWORDS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("usecase", ("用例图", "use case", "usecase")),
+    ("sequence", ("时序图", "顺序图", "序列图", "sequence")),
+    ("activity", ("活动图", "流程图", "activity", "flowchart")),
+    ("state", ("状态图", "状态机", "state")),
+    ("component", ("组件图", "构件图", "component")),
+    ("deployment", ("部署图", "deployment")),
+    ("object", ("对象图", "object diagram")),
+    ("er", ("er图", "e-r图", "实体关系", "entity relationship")),
+    ("class", ("类图", "class")),
+]
+
+
+def make_namespace(model: str, system_prompt: str) -> str:
+    """模型与系统提示词的组合标识，不同组合的回复不能互相复用"""
+    payload = f"{model or ''}\n{system_prompt or ''}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def detect_diagram_type(text: str) -> Optional[str]:
+    """从请求文字中识别要画的图表类型，识别不出时返回 None"""
+    lowered = unicodedata.normalize("NFKC", text).lower()
+    for diagram_type, keywords in DIAGRAM_TYPE_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return diagram_type
+    return None
+
+
+class CharNgramVectorizer:
+    """
+    本地字符 n-gram 向量化
+    中文没有空格分词，直接用 1~3 字的片段做特征，经哈希映射到固定维度并做 L2 归一化
+    """
+
+    def __init__(self, dimensions: int = 1 << 18, ngram_weights: Optional[Dict[int, float]] = None):
+        self.dimensions = dimensions
+        self.ngram_weights = ngram_weights or {1: 0.5, 2: 1.0, 3: 1.0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text).lower()
+        text = FILLER_PATTERN.sub("", text)
+        return NON_WORD_PATTERN.sub("", text)
+
+    def vectorize(self, text: str) -> Dict[int, float]:
+        """返回稀疏向量 {维度: 权重}"""
+        normalized = self.normalize(text)
+        counts: Dict[int, float] = defaultdict(float)
+        for n, weight in self.ngram_weights.items():
+            for i in range(len(normalized) - n + 1):
+                bucket = zlib.crc32(normalized[i:i + n].encode("utf-8")) % self.dimensions
+                counts[bucket] += weight
+
+        # 次线性词频，重复片段不过度放大
+        vector = {bucket: 1 + math.log(value) if value >= 1 else value for bucket, value in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        if norm == 0:
+            return {}
+        return {bucket: value / norm for bucket, value in vector.items()}
+
+
+def cosine_similarity(a: Dict[int, float], b: Dict[int, float]) -> float:
+    """两个已归一化稀疏向量的余弦相似度"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(bucket, 0.0) for bucket, value in a.items())
+
+
+class SemanticCache:
+    """
+    相似请求缓存索引（进程内）
+    记录最近请求的向量及其在精确缓存中的键；新请求与相似度超过阈值且图表类型相同的
+    旧请求视为同一个请求，复用旧请求缓存的回复
+    """
+
+    def __init__(self,
+                 enabled: bool = False,
+                 threshold: float = 0.88,
+                 max_entries: int = 2000,
+                 vectorizer: Optional[CharNgramVectorizer] = None):
+        """
+        初始化索引
+
+        Args:
+            enabled: 是否启用
+            threshold: 余弦相似度阈值，达到后才算命中
+            max_entries: 索引保留的最近请求条数
+            vectorizer: 向量化方法
+        """
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.vectorizer = vectorizer or CharNgramVectorizer()
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 倒排索引：维度 -> 含该维度的条目，只与有共同片段的条目比较
+        self._postings: Dict[int, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, namespace: str, user_input: str, cache_key: str):
+        """
+        登记一条已写入精确缓存的请求
+
+        Args:
+            namespace: 模型与系统提示词的组合，只在同一组合内匹配
+            user_input: 原始输入
+            cache_key: 该请求在精确缓存中的键
+        """
+        if not self.enabled:
+            return
+        vector = self.vectorizer.vectorize(user_input)
+        if not vector:
+            return
+
+        with self._lock:
+            self._remove_locked(cache_key)
+            self._entries[cache_key] = {
+                "namespace": namespace,
+                "input": user_input,
+                "diagram_type": detect_diagram_type(user_input),
+                "vector": vector,
+                "created_at": time.time(),
+                "hits": 0,
+            }
+            for bucket in vector:
+                self._postings[bucket].add(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+
+    def _remove_locked(self, cache_key: str):
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        for bucket in entry["vector"]:
+            keys = self._postings.get(bucket)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._postings[bucket]
+
+    def remove(self, cache_key: str):
+        """精确缓存中的条目已失效时移除"""
+        with self._lock:
+            self._remove_locked(cache_key)
+
+    def search(self, namespace: str, user_input: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        查找最相似的已缓存请求（不受阈值限制，供调试查看）
+
+        Returns:
+            按相似度从高到低排列的 [{"cache_key", "input", "diagram_type", "similarity"}]
+        """
+        vector = self.vectorizer.vectorize(user_input)
+        if not vector:
+            return []
+        diagram_type = detect_diagram_type(user_input)
+
+        with self._lock:
+            candidates: Set[str] = set()
+            for bucket in vector:
+                candidates.update(self._postings.get(bucket, ()))
+
+            results = []
+            for cache_key in candidates:
+                entry = self._entries[cache_key]
+                if entry["namespace"] != namespace:
+                    continue
+                results.append({
+                    "cache_key": cache_key,
+                    "input": entry["input"],
+                    "diagram_type": entry["diagram_type"],
+                    "type_matches": entry["diagram_type"] == diagram_type,
+                    "similarity": round(cosine_similarity(vector, entry["vector"]), 4),
+                })
+        results.sort(key=lambda result: result["similarity"], reverse=True)
+        return results[:limit]
+
+    def lookup(self, namespace: str, user_input: str) -> Optional[str]:
+        """
+        查找可复用的请求
+
+        Returns:
+            相似度达到阈值且图表类型一致的请求的精确缓存键，没有则返回 None
+        """
+        if not self.enabled:
+            return None
+        for result in self.search(namespace, user_input):
+            if result["similarity"] < self.threshold:
+                break
+            if result["type_matches"]:
+                with self._lock:
+                    entry = self._entries.get(result["cache_key"])
+                    if entry is not None:
+                        entry["hits"] += 1
+                        self._entries.move_to_end(result["cache_key"])
+                self.hits += 1
+                return result["cache_key"]
+        self.misses += 1
+        return None
+
+    def list_entries(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """最近登记的请求，供管理接口查看"""
+        with self._lock:
+            entries = list(self._entries.items())[-limit:]
+        return [
+            {
+                "cache_key": cache_key,
+                "input": entry["input"],
+                "diagram_type": entry["diagram_type"],
+                "created_at": entry["created_at"],
+                "hits": entry["hits"],
+            }
+            for cache_key, entry in reversed(entries)
+        ]
+
+    def flush(self) -> int:
+        """清空索引，返回清除的条目数"""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._postings.clear()
+        return count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局索引实例
+semantic_cache = SemanticCache(
+    enabled=SEMANTIC_CACHE_ENABLED,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+)
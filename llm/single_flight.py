@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Any
+from config import SINGLE_FLIGHT_ENABLED, SINGLE_FLIGHT_REDIS_ENABLED, SINGLE_FLIGHT_WAIT_TIMEOUT
+from database.redis_client import redis_session_manager
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightError(Exception):
+    """合并的生成过程失败（发起方出错或等待超时）"""
+
+
+class _Flight:
+    """一次正在进行的生成，保存已产出的片段供所有订阅者读取"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    相同请求的并发合并
+    同一个键的第一个请求负责调用上游模型，同时到达的相同请求订阅同一份输出，
+    不再重复调用模型；开启 Redis 后多个 worker 之间同样合并
+    """
+
+    PREFIX = "llmflight"
+    # 发起方持有的 Redis 锁过期时间（毫秒），每产出一个片段续期一次
+    LOCK_TTL_MS = 30000
+    # 片段列表在生成结束后保留的时间（秒），供稍晚到达的订阅者读取
+    RESULT_TTL = 60
+
+    def __init__(self, enabled: bool = True, use_redis: bool = False, wait_timeout: float = 60.0):
+        """
+        初始化
+
+        Args:
+            enabled: 是否启用合并
+            use_redis: 是否通过 Redis 在多个 worker 之间合并
+            wait_timeout: 订阅其他 worker 的输出时，最长多久没有新片段就放弃（秒）
+        """
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.wait_timeout = wait_timeout
+        self._flights: Dict[str, _Flight] = {}
+
+        self.leaders = 0
+        self.joined = 0
+        self.remote_joined = 0
+        self.redis_errors = 0
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """
+        获取键对应的输出，已有相同请求在进行时直接订阅它
+
+        Args:
+            key: 请求键（覆盖模型、系统提示词和输入）
+            factory: 创建上游输出的函数，只有发起方会调用
+
+        Yields:
+            回复的文本片段
+        """
+        if not self.enabled:
+            async for chunk in factory():
+                yield chunk
+            return
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._drive(key, flight, factory))
+        else:
+            self.joined += 1
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            # 所有订阅者都已离开时停止上游生成
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                flight.task.cancel()
+
+    async def _drive(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[str]]):
+        """后台读取上游输出，订阅者断开不影响其他订阅者"""
+        source = self._redis_source(key, factory) if self.use_redis else self._local_source(factory)
+        try:
+            async for chunk in source:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = SingleFlightError("生成已取消")
+        except Exception as e:
+            flight.error = e
+        finally:
+            await source.aclose()
+            flight.done = True
+            flight.notify()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def _local_source(self, factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """由本进程调用上游模型"""
+        self.leaders += 1
+        chunks = factory()
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.PREFIX}:lock:{key}"
+
+    def _chunks_key(self, key: str) -> str:
+        return f"{self.PREFIX}:chunks:{key}"
+
+    def _channel(self, key: str) -> str:
+        return f"{self.PREFIX}:chan:{key}"
+
+    async def _redis_source(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """
+        跨 worker 合并：抢到 Redis 锁的 worker 调用模型并把片段写入列表、通过频道通知，
+        其他 worker 从列表读取；Redis 不可用时退回本进程调用
+        """
+        redis = redis_session_manager.async_redis_client
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis.set(self._lock_key(key), token, nx=True, px=self.LOCK_TTL_MS)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"单飞合并无法访问 Redis，改为本进程调用: {e}")
+            async for chunk in self._local_source(factory):
+                yield chunk
+            return
+
+        if acquired:
+            async for chunk in self._publish(redis, key, token, factory):
+                yield chunk
+        else:
+            self.remote_joined += 1
+            async for chunk in self._follow(redis, key, factory):
+                yield chunk
+
+    async def _append(self, redis, key: str, entry: Dict[str, Any]):
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(self._chunks_key(key), json.dumps(entry, ensure_ascii=False))
+            pipe.expire(self._chunks_key(key), self.RESULT_TTL)
+            pipe.publish(self._channel(key), "1")
+            await pipe.execute()
+
+    async def _publish(self, redis, key: str, token: str,
+                       factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """发起方：调用模型，并把每个片段发布给其他 worker"""
+        await redis.delete(self._chunks_key(key))
+        finished = False
+        try:
+            async for chunk in self._local_source(factory):
+                yield chunk
+                await self._append(redis, key, {"chunk": chunk})
+                await redis.pexpire(self._lock_key(key), self.LOCK_TTL_MS)
+            await self._append(redis, key, {"done": True})
+            finished = True
+        except Exception as e:
+            await self._append(redis, key, {"error": str(e)})
+            finished = True
+            raise
+        finally:
+            if not finished:
+                # 被取消：通知订阅方不要继续等待
+                try:
+                    await self._append(redis, key, {"error": "生成已取消"})
+                except Exception:
+                    pass
+            try:
+                if await redis.get(self._lock_key(key)) == token:
+                    await redis.delete(self._lock_key(key))
+            except Exception:
+                pass
+
+    async def _follow(self, redis, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """订阅方：先订阅频道再读取列表，保证不漏掉片段"""
+        loop = asyncio.get_running_loop()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(self._channel(key))
+        try:
+            seen = 0
+            last_progress = loop.time()
+            while True:
+                entries = await redis.lrange(self._chunks_key(key), seen, -1)
+                for raw in entries:
+                    seen += 1
+                    entry = json.loads(raw)
+                    if "chunk" in entry:
+                        yield entry["chunk"]
+                    elif "error" in entry:
+                        raise SingleFlightError(entry["error"])
+                    else:
+                        return
+                if entries:
+                    last_progress = loop.time()
+
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if loop.time() - last_progress < self.wait_timeout and await redis.exists(self._lock_key(key)):
+                    continue
+                if await redis.llen(self._chunks_key(key)) > seen:
+                    continue
+
+                # 发起方已退出或长时间没有进展
+                if seen == 0:
+                    logger.warning("其他 worker 的生成没有结果，改为本进程调用")
+                    async for chunk in self._local_source(factory):
+                        yield chunk
+                    return
+                raise SingleFlightError("等待其他 worker 的生成结果超时")
+        finally:
+            await pubsub.unsubscribe(self._channel(key))
+            await pubsub.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """统计信息（当前进程）"""
+        return {
+            "enabled": self.enabled,
+            "redis": self.use_redis,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "joined": self.joined,
+            "remote_joined": self.remote_joined,
+            "redis_errors": self.redis_errors,
+        }
+
+
+# 全局实例
+single_flight = SingleFlight(
+    enabled=SINGLE_FLIGHT_ENABLED,
+    use_redis=SINGLE_FLIGHT_REDIS_ENABLED,
+    wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT,
+)
@@ -0,0 +1,291 @@
+import re
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config import (
+    SUMMARY_ENABLED,
+    SUMMARY_PROVIDER,
+    SUMMARY_FALLBACK_ENABLED,
+    SUMMARY_TRIGGER_MESSAGES,
+    SUMMARY_TRIGGER_TOKENS,
+    SUMMARY_KEEP_MESSAGES,
+    SUMMARY_MAX_TOKENS,
+    SUMMARY_MESSAGE_MAX_CHARS,
+)
+from database.redis_client import redis_session_manager
+from .base import CircuitOpenError
+from .router import ModelRouter, model_router, TEXT
+from .system_prompts import SUMMARY
+from .tokens import count_tokens, estimate_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+PLANTUML_BLOCK_PATTERN = re.compile(r'@startuml\s*(.*?)\s*@enduml', re.DOTALL | re.IGNORECASE)
+# 回复中的代码块（含 ```plantuml 包裹的图表代码），生成摘要时省略
+CODE_FENCE_PATTERN = re.compile(r'```.*?(```|$)', re.DOTALL)
+
+
+def parse_session_messages(raw_messages: List[str]) -> List[Dict[str, str]]:
+    """
+    解析 Redis 会话列表中的消息（从新到旧），跳过无法解析和没有内容的消息
+
+    Returns:
+        [{"role", "content", "timestamp"}]，顺序与输入相同
+    """
+    messages = []
+    for raw in raw_messages:
+        try:
+            message = json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+        content = message.get("content") or ""
+        if not content:
+            continue
+        messages.append({
+            "role": "user" if message.get("type") == "user" else "assistant",
+            "content": content,
+            "timestamp": message.get("timestamp") or "",
+        })
+    return messages
+
+
+class ConversationSummarizer:
+    """
+    对话滚动摘要
+    一个对话未压缩的消息过多时，在后台把除最近几条以外的消息连同已有摘要交给低成本模型，
+    生成新的摘要，并保留其中最新的一份图表代码；之后构建上下文时只发送摘要和未压缩的消息
+    """
+
+    # 同一对话的压缩任务在多个 worker 之间互斥的最长时间（秒）
+    LOCK_TTL = 120
+
+    def __init__(self,
+                 router: ModelRouter,
+                 enabled: bool = True,
+                 provider: str = "ollama",
+                 fallback: bool = False,
+                 trigger_messages: int = 12,
+                 trigger_tokens: int = 3000,
+                 keep_messages: int = 4,
+                 max_tokens: int = 400,
+                 message_max_chars: int = 800):
+        """
+        初始化
+
+        Args:
+            router: 模型路由器，用于获取客户端并记录指标
+            enabled: 是否启用
+            provider: 生成摘要的提供方
+            fallback: 该提供方不可用时是否改用路由选择的文本模型
+            trigger_messages: 未压缩的消息超过多少条时压缩
+            trigger_tokens: 未压缩的消息估算 token 数超过多少时压缩
+            keep_messages: 压缩后保留原文的最近消息条数
+            max_tokens: 摘要的 token 上限
+            message_max_chars: 生成摘要时每条消息最多使用的字符数
+        """
+        self.router = router
+        self.enabled = enabled
+        self.provider = provider
+        self.fallback = fallback
+        self.trigger_messages = trigger_messages
+        self.trigger_tokens = trigger_tokens
+        self.keep_messages = max(1, keep_messages)
+        self.max_tokens = max_tokens
+        self.message_max_chars = message_max_chars
+
+        # 当前进程中正在检查或压缩的对话
+        self._running: Set[Tuple[str, str]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.compactions = 0
+        self.messages_folded = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration_ms: Optional[float] = None
+
+    async def get_summary(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        读取对话的摘要
+
+        Returns:
+            {"summary", "diagram", "covered_until", "summary_tokens", "diagram_tokens"}，没有摘要时返回 None
+        """
+        redis = redis_session_manager.async_redis_client
+        data = await redis.hgetall(redis_session_manager._get_session_summary_key(user_id, conversation_id))
+        if not data or not data.get("summary"):
+            return None
+        return {
+            "summary": data["summary"],
+            "diagram": data.get("diagram") or "",
+            "covered_until": data.get("covered_until") or "",
+            "summary_tokens": int(data.get("summary_tokens") or 0),
+            "diagram_tokens": int(data.get("diagram_tokens") or 0),
+        }
+
+    def schedule(self, user_id: str, conversation_id: str):
+        """一轮对话保存后调用：在后台检查是否需要压缩，不阻塞当前请求"""
+        if not self.enabled or (user_id, conversation_id) in self._running:
+            return
+        self._running.add((user_id, conversation_id))
+        task = asyncio.create_task(self._run(user_id, conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, user_id: str, conversation_id: str):
+        redis = redis_session_manager.async_redis_client
+        lock_key = f"{redis_session_manager._get_session_summary_key(user_id, conversation_id)}:lock"
+        locked = False
+        try:
+            if not await self._needs_compaction(user_id, conversation_id):
+                return
+            locked = bool(await redis.set(lock_key, "1", nx=True, ex=self.LOCK_TTL))
+            if locked:
+                await self.compact(user_id, conversation_id)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"对话摘要失败: {e}")
+        finally:
+            if locked:
+                try:
+                    await redis.delete(lock_key)
+                except Exception:
+                    pass
+            self._running.discard((user_id, conversation_id))
+
+    async def _load(self, user_id: str, conversation_id: str) -> Tuple[List[Dict[str, str]], Optional[Dict[str, Any]]]:
+        """读取未压缩的消息（从新到旧）和已有摘要"""
+        redis = redis_session_manager.async_redis_client
+        raw_messages = await redis.lrange(redis_session_manager._get_session_key(user_id, conversation_id), 0, -1)
+        summary = await self.get_summary(user_id, conversation_id)
+        messages = parse_session_messages(raw_messages)
+        if summary is not None:
+            messages = [message for message in messages if message["timestamp"] > summary["covered_until"]]
+        return messages, summary
+
+    async def _needs_compaction(self, user_id: str, conversation_id: str) -> bool:
+        messages, _ = await self._load(user_id, conversation_id)
+        if len(messages) <= self.keep_messages:
+            return False
+        return (
+            len(messages) > self.trigger_messages
+            or estimate_tokens(*[message["content"] for message in messages]) > self.trigger_tokens
+        )
+
+    def _select_client(self) -> Optional[Tuple[str, Any]]:
+        """选择生成摘要的提供方（同样受路由器价格上限限制）；都不可用时返回 None"""
+        if self.provider in self.router.candidates(TEXT) and self.router.is_healthy(self.provider):
+            try:
+                return self.provider, self.router.acquire(self.provider)
+            except CircuitOpenError:
+                pass
+        if self.fallback:
+            try:
+                return self.router.select(TEXT)
+            except CircuitOpenError:
+                pass
+        return None
+
+    def _transcript(self, messages: List[Dict[str, str]]) -> str:
+        """生成摘要用的对话文本：省略代码块，每条消息截断到 message_max_chars"""
+        lines = []
+        for message in messages:
+            content = CODE_FENCE_PATTERN.sub("[图表代码已省略]", message["content"])
+            content = PLANTUML_BLOCK_PATTERN.sub("[图表代码已省略]", content).strip()
+            if len(content) > self.message_max_chars:
+                content = content[:self.message_max_chars] + "……"
+            lines.append(f"{'用户' if message['role'] == 'user' else '助手'}：{content}")
+        return "\n".join(lines)
+
+    async def compact(self, user_id: str, conversation_id: str) -> bool:
+        """
+        把除最近 keep_messages 条以外的未压缩消息合并进摘要
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 对话ID
+
+        Returns:
+            是否生成了新的摘要
+        """
+        messages, summary = await self._load(user_id, conversation_id)
+        if len(messages) <= self.keep_messages:
+            return False
+        # 按时间正序
+        folded = list(reversed(messages[self.keep_messages:]))
+
+        selected = self._select_client()
+        if selected is None:
+            self.skipped += 1
+            logger.info(f"没有可用的摘要模型，跳过对话压缩: {conversation_id}")
+            return False
+        provider, client = selected
+
+        started = time.monotonic()
+        previous = summary["summary"] if summary else "无"
+        prompt = f"已有摘要：\n{previous}\n\n新的对话：\n{self._transcript(folded)}"
+        system_prompt = SUMMARY.format(max_words=self.max_tokens)
+        chunks = self.router.track(
+            provider,
+            client.chat_stream_async(user_input=prompt, system_prompt=system_prompt),
+            estimate_tokens(system_prompt, prompt)
+        )
+        text = truncate_tokens("".join([chunk async for chunk in chunks]).strip(), self.max_tokens)
+        if not text:
+            raise ValueError(f"{provider} 返回了空摘要")
+
+        # 保留最新的一份图表代码
+        diagram = summary["diagram"] if summary else ""
+        for message in reversed(folded):
+            blocks = PLANTUML_BLOCK_PATTERN.findall(message["content"])
+            if blocks:
+                diagram = f"@startuml\n{blocks[-1].strip()}\n@enduml"
+                break
+
+        redis = redis_session_manager.async_redis_client
+        summary_key = redis_session_manager._get_session_summary_key(user_id, conversation_id)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(summary_key, mapping={
+                "summary": text,
+                "diagram": diagram,
+                "covered_until": folded[-1]["timestamp"],
+                "summary_tokens": count_tokens(text),
+                "diagram_tokens": count_tokens(diagram),
+            })
+            pipe.expire(summary_key, redis_session_manager.session_ttl)
+            await pipe.execute()
+
+        self.compactions += 1
+        self.messages_folded += len(folded)
+        self.last_duration_ms = round((time.monotonic() - started) * 1000, 1)
+        logger.info(f"对话已压缩: {conversation_id}，合并 {len(folded)} 条消息（{provider}，{self.last_duration_ms}ms）")
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """摘要统计（当前进程）"""
+        return {
+            "enabled": self.enabled,
+            "provider": self.provider,
+            "fallback": self.fallback,
+            "running": len(self._running),
+            "compactions": self.compactions,
+            "messages_folded": self.messages_folded,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_duration_ms": self.last_duration_ms,
+        }
+
+
+# 全局对话摘要实例
+conversation_summarizer = ConversationSummarizer(
+    model_router,
+    enabled=SUMMARY_ENABLED,
+    provider=SUMMARY_PROVIDER,
+    fallback=SUMMARY_FALLBACK_ENABLED,
+    trigger_messages=SUMMARY_TRIGGER_MESSAGES,
+    trigger_tokens=SUMMARY_TRIGGER_TOKENS,
+    keep_messages=SUMMARY_KEEP_MESSAGES,
+    max_tokens=SUMMARY_MAX_TOKENS,
+    message_max_chars=SUMMARY_MESSAGE_MAX_CHARS,
+)
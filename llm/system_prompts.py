@@ -29,4 +29,14 @@ MAIN_IMG="""
 ```
 总结
 
-"""
\ No newline at end of file
+"""
+SUMMARY="""
+# 角色
+你负责压缩一段关于 UML 图设计的对话，供后续对话继续使用
+根据已有摘要和新的对话内容，输出一份更新后的摘要
+要求：
+1. 保留用户的需求、约束、已确定的设计决定和尚未解决的问题
+2. 不要输出 PlantUML 代码，最新的图表代码会单独保存
+3. 使用简洁的中文要点，不超过 {max_words} 字
+4. 只输出摘要本身
+"""
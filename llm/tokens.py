@@ -0,0 +1,86 @@
+import re
+import logging
+from functools import lru_cache
+from config import TOKENIZER_ENCODING
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字及全角标点，每个字符大约对应一个 token
+CJK_PATTERN = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+
+# 每条消息在对话格式中的固定开销（角色标记、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(*texts: str) -> int:
+    """
+    粗略估算文本的 token 数（偏保守）
+    中日韩字符按每字 1 个 token 计，其余字符按每 4 个字符 1 个 token 计
+    """
+    total = 0
+    for text in texts:
+        if not text:
+            continue
+        cjk = len(CJK_PATTERN.findall(text))
+        total += cjk + (len(text) - cjk + 3) // 4
+    return total
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    """加载 tiktoken 编码（只加载一次）；不可用时返回 None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"无法加载 tiktoken 编码 {name}，改用估算: {e}")
+        return None
+
+
+# 预热时加载好的编码；加载完成之前（或加载失败时）按 estimate_tokens 估算
+_encoding = None
+
+
+def load_tokenizer() -> str:
+    """
+    加载 tiktoken 编码（首次使用时可能需要下载 BPE 文件，属于阻塞操作，只在启动预热时调用）
+
+    Returns:
+        加载后使用的计数方式
+    """
+    global _encoding
+    _encoding = _get_encoding(TOKENIZER_ENCODING)
+    return tokenizer_name()
+
+
+def tokenizer_name() -> str:
+    """当前使用的计数方式，用于区分不同计数方式缓存的结果"""
+    return TOKENIZER_ENCODING if _encoding is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的 token 数
+    预热时加载了 tiktoken 编码则精确计数，否则按 estimate_tokens 估算（不会在请求中加载编码）
+    """
+    if not text:
+        return 0
+    encoding = _encoding
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """按比例截断文本，使 token 数不超过上限（各部分密度不同时多截几次）"""
+    tokens = count_tokens(text)
+    while text and tokens > max_tokens:
+        text = text[:max(0, len(text) * max_tokens // tokens)]
+        tokens = count_tokens(text)
+    return text
@@ -5,9 +5,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from llm.deepseekv3 import DeepSeekV3Client
-from llm.doubao_flash import DOUBAO_SEED_1_6_FLASH
 from api.routes import router
+from api.warmup import readiness
+from util.plantuml_service import plantuml_service
+from util.retention import retention_service
+from database.connection import SessionLocal
+from database.services import DatabaseService
+from config import RETENTION_ENABLED
 import dotenv
 
 # 加载环境变量
@@ -37,6 +41,35 @@ app.mount("/assets", StaticFiles(directory="aug_web/dist/assets"), name="assets"
 app.include_router(router, prefix="/api/v1", tags=["AI对话"])
 
 
+def load_referenced_image_files() -> set:
+    """读取对话消息中仍在引用的图片，图片清理时保留这些文件"""
+    db = SessionLocal()
+    try:
+        return DatabaseService(db).get_referenced_image_files()
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    """在后台并行检测和预热各项依赖，不阻塞启动"""
+    readiness.start()
+
+
+@app.on_event("startup")
+async def start_retention():
+    """启动图片目录的后台清理"""
+    retention_service.set_reference_provider(load_referenced_image_files)
+    retention_service.add_delete_hook("img", plantuml_service.forget_image)
+    if RETENTION_ENABLED:
+        retention_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_retention():
+    retention_service.stop()
+
+
 
 @app.get("/")
 async def root():
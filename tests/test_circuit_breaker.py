@@ -0,0 +1,125 @@
+import time
+import asyncio
+import fakeredis
+from llm.base import ProviderError
+from llm.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from llm.router import ModelRouter, TEXT
+from llm.hedging import HedgedStreamer
+from llm.response_cache import LLMResponseCache
+from llm.semantic_cache import SemanticCache
+from llm.single_flight import SingleFlight
+import api.routes as routes
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("p", failure_threshold=3, cool_down=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.get_stats()["rejected"] == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker("p", failure_threshold=1, cool_down=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    # 探测名额已用完
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_released_probe_can_be_retried():
+    breaker = CircuitBreaker("p", failure_threshold=1, cool_down=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_unreturned_probe_expires_after_cool_down():
+    breaker = CircuitBreaker("p", failure_threshold=1, cool_down=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.is_available()
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.is_available()
+
+
+class FakeClient:
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    async def chat_stream_async(self, user_input, system_prompt=None, history=None):
+        self.calls += 1
+        if self.fail:
+            raise ProviderError("fake", "调用失败")
+        yield "回复"
+
+
+def test_cache_hit_during_half_open_keeps_probe_slot(monkeypatch):
+    client = FakeClient()
+    router = ModelRouter(failure_threshold=1, cool_down=0.05, idle_timeout=5)
+    router.register("fake", lambda: client, {TEXT})
+    cache = LLMResponseCache(enabled=True, redis_client=fakeredis.FakeAsyncRedis(decode_responses=True))
+    monkeypatch.setattr(routes, "model_router", router)
+    monkeypatch.setattr(routes, "hedged_streamer", HedgedStreamer(router))
+    monkeypatch.setattr(routes, "response_cache", cache)
+    monkeypatch.setattr(routes, "semantic_cache", SemanticCache(enabled=False))
+    monkeypatch.setattr(routes, "single_flight", SingleFlight(enabled=True))
+
+    async def reply(user_input):
+        return "".join([chunk async for chunk in routes.stream_text_reply("系统提示词", user_input)])
+
+    async def scenario():
+        # 第一次调用写入缓存
+        assert await reply("画一个类图") == "回复"
+
+        # 提供方失败，熔断器打开
+        client.fail = True
+        try:
+            await reply("画一个时序图")
+        except ProviderError:
+            pass
+        assert router.breakers["fake"].state == OPEN
+
+        # 半开状态下命中缓存，不应占用探测名额
+        await asyncio.sleep(0.06)
+        assert router.breakers["fake"].state == HALF_OPEN
+        calls = client.calls
+        assert await reply("画一个类图") == "回复"
+        assert client.calls == calls
+        assert router.breakers["fake"].is_available()
+
+        # 探测请求成功后恢复
+        client.fail = False
+        assert await reply("画一个用例图") == "回复"
+        assert router.breakers["fake"].state == CLOSED
+
+    asyncio.run(scenario())
@@ -0,0 +1,171 @@
+import json
+import asyncio
+import fakeredis
+import pytest
+from database.redis_client import redis_session_manager
+from llm.context import ConversationContext
+from llm.router import model_router
+from llm.summarizer import ConversationSummarizer
+from llm.tokens import count_tokens, MESSAGE_OVERHEAD_TOKENS
+
+USER = "u"
+CONVERSATION = "c"
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_session_manager, "_redis_client", fakeredis.FakeRedis(server=server, decode_responses=True))
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(redis_session_manager, "_async_redis_client", client)
+    return client
+
+
+def add_messages(*messages):
+    """按时间顺序写入 (type, content)"""
+    for index, (message_type, content) in enumerate(messages):
+        redis_session_manager.redis_client.lpush(
+            redis_session_manager._get_session_key(USER, CONVERSATION),
+            json.dumps({"type": message_type, "content": content, "timestamp": f"2026-01-01T00:00:{index:02d}"})
+        )
+
+
+def build(context: ConversationContext):
+    return asyncio.run(context.build(USER, CONVERSATION))
+
+
+def run(scenario):
+    """异步 Redis 客户端绑定第一次使用它的事件循环，同一个测试只用一个事件循环"""
+    asyncio.run(scenario())
+
+
+def tokens(messages):
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def test_packs_newest_turns_within_budget(redis):
+    add_messages(("user", "第一问" * 20), ("ai", "第一答" * 20), ("user", "第二问"), ("ai", "第二答"))
+    context = ConversationContext(max_tokens=30)
+    history = build(context)
+    assert [message["content"] for message in history] == ["第二问", "第二答"]
+    assert tokens(history) <= 30
+    assert context.truncated == 1
+
+
+def test_oversized_newest_message_is_truncated_not_dropped(redis):
+    reply = "```plantuml\n@startuml\n" + "class 学生\n" * 200 + "@enduml\n```"
+    add_messages(("user", "画一个类图"), ("ai", reply))
+    history = build(ConversationContext(max_tokens=100))
+    assert len(history) == 1
+    assert history[0]["role"] == "assistant"
+    assert reply.startswith(history[0]["content"])
+    assert 0 < tokens(history) <= 100
+
+
+def test_leading_assistant_message_is_dropped(redis):
+    add_messages(("user", "问" * 30), ("ai", "答一"), ("user", "问二"), ("ai", "答二"))
+    history = build(ConversationContext(max_tokens=40))
+    assert history[0]["role"] == "user"
+    assert [message["content"] for message in history] == ["问二", "答二"]
+
+
+def test_token_counts_are_cached(redis):
+    add_messages(("user", "问一"), ("ai", "答一"))
+    context = ConversationContext(max_tokens=1000)
+
+    async def scenario():
+        await context.build(USER, CONVERSATION)
+        assert (context.messages_counted, context.messages_cached) == (2, 0)
+        await context.build(USER, CONVERSATION)
+        assert (context.messages_counted, context.messages_cached) == (2, 2)
+
+        # 缓存的计数直接使用，不再重新计数：改大后超出预算，只保留截断的最新一条
+        key = redis_session_manager._get_session_tokens_key(USER, CONVERSATION)
+        fields = await redis.hkeys(key)
+        await redis.hset(key, mapping={field: 10000 for field in fields})
+        history = await context.build(USER, CONVERSATION)
+        assert context.truncated == 1
+        assert history == [{"role": "assistant", "content": "答一"}]
+
+    run(scenario)
+
+
+def test_add_turn_caches_counts_for_both_messages(redis):
+    context = ConversationContext(max_tokens=1000)
+
+    async def scenario():
+        await context.add_turn(USER, CONVERSATION, "问一", "答一")
+        history = await context.build(USER, CONVERSATION)
+        assert [message["role"] for message in history] == ["user", "assistant"]
+        assert (context.messages_counted, context.messages_cached) == (0, 2)
+
+    run(scenario)
+
+
+def set_summary(summary, diagram="", covered_until=""):
+    redis_session_manager.redis_client.hset(
+        redis_session_manager._get_session_summary_key(USER, CONVERSATION),
+        mapping={
+            "summary": summary,
+            "diagram": diagram,
+            "covered_until": covered_until,
+            "summary_tokens": count_tokens(summary),
+            "diagram_tokens": count_tokens(diagram),
+        }
+    )
+
+
+def test_messages_covered_by_summary_are_skipped(redis):
+    add_messages(("user", "问一"), ("ai", "答一"), ("user", "问二"), ("ai", "答二"))
+    set_summary("用户在画类图", covered_until="2026-01-01T00:00:01")
+    context = ConversationContext(ConversationSummarizer(model_router), max_tokens=1000)
+    history = build(context)
+    assert history[0]["role"] == "system"
+    assert "用户在画类图" in history[0]["content"]
+    assert [message["content"] for message in history[1:]] == ["问二", "答二"]
+    assert context.with_summary == 1
+
+
+def test_diagram_is_dropped_when_summary_and_diagram_exceed_budget(redis):
+    add_messages(("user", "问一"), ("ai", "答一"), ("user", "问二"), ("ai", "答二"))
+    diagram = "@startuml\n" + "class 学生\n" * 200 + "@enduml"
+    set_summary("用户在画类图", diagram=diagram, covered_until="2026-01-01T00:00:01")
+    history = build(ConversationContext(ConversationSummarizer(model_router), max_tokens=60))
+    assert "用户在画类图" in history[0]["content"]
+    assert "@startuml" not in history[0]["content"]
+    assert [message["content"] for message in history[1:]] == ["问二", "答二"]
+    assert tokens(history) <= 60
+
+
+def test_summary_alone_when_all_messages_are_covered(redis):
+    add_messages(("user", "问一"), ("ai", "答一"))
+    set_summary("用户在画类图", diagram="@startuml\nclass 学生\n@enduml", covered_until="2026-01-01T00:00:01")
+    history = build(ConversationContext(ConversationSummarizer(model_router), max_tokens=1000))
+    assert len(history) == 1
+    assert "class 学生" in history[0]["content"]
+
+
+class BrokenSyncClient:
+    def __getattr__(self, name):
+        raise AssertionError("add_turn 不应使用同步 Redis 连接")
+
+
+def test_add_turn_uses_async_client_and_prunes_trimmed_counts(redis, monkeypatch):
+    monkeypatch.setattr(redis_session_manager, "_redis_client", BrokenSyncClient())
+    monkeypatch.setattr(redis_session_manager, "max_messages_per_session", 4)
+    context = ConversationContext(max_tokens=1000)
+    tokens_key = redis_session_manager._get_session_tokens_key(USER, CONVERSATION)
+
+    async def scenario():
+        for turn in range(3):
+            await context.add_turn(USER, CONVERSATION, f"问{turn}", f"答{turn}")
+        assert context.errors == 0
+        messages = await redis.lrange(redis_session_manager._get_session_key(USER, CONVERSATION), 0, -1)
+        assert [json.loads(message)["content"] for message in messages] == ["答2", "问2", "答1", "问1"]
+        timestamps = [json.loads(message)["timestamp"] for message in messages]
+        assert timestamps == sorted(timestamps, reverse=True) and len(set(timestamps)) == 4
+        # 被裁剪掉的第一轮的计数已删除
+        assert await redis.hlen(tokens_key) == 4
+        assert await redis.ttl(tokens_key) > 0
+
+    run(scenario)
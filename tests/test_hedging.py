@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+from llm import hedging
+from llm.hedging import HedgeBudget
+
+
+def test_budget_window_slides(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(hedging, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    budget = HedgeBudget(2)
+
+    assert budget.try_acquire()
+    clock[0] += 30
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    assert budget.remaining() == 0
+
+    # 第一次对冲满 60 秒后让出名额，第二次仍在窗口内
+    clock[0] += 30
+    assert budget.remaining() == 1
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+    clock[0] += 60
+    assert budget.remaining() == 2
+
+
+def test_zero_budget_never_hedges():
+    budget = HedgeBudget(0)
+    assert not budget.try_acquire()
+    assert budget.remaining() == 0
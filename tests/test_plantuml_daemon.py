@@ -0,0 +1,36 @@
+import sys
+from util.plantuml_daemon import PlantUMLPipeWorker
+
+# 模拟 `plantuml -pipe -pipeNoStderr`：语法错误写到 stdout 的输出段，stderr 只有无关日志
+FAKE_PLANTUML = '''
+import sys
+delimiter = sys.argv[sys.argv.index("-pipedelimitor") + 1]
+for line in sys.stdin:
+    if line.strip() == "@startuml":
+        body = []
+    elif line.strip() == "@enduml":
+        if "bad" in body:
+            sys.stdout.write("ERROR\\n2\\nSyntax Error?\\n")
+        else:
+            sys.stdout.write("IMG:" + ",".join(body))
+        sys.stderr.write("ERROR: unrelated JVM warning\\n")
+        sys.stderr.flush()
+        sys.stdout.write("\\n" + delimiter + "\\n")
+        sys.stdout.flush()
+    else:
+        body.append(line.strip())
+'''
+
+
+def test_errors_are_attributed_to_their_own_diagram(tmp_path):
+    script = tmp_path / "plantuml"
+    script.write_text(f"#!{sys.executable}\n{FAKE_PLANTUML}")
+    script.chmod(0o755)
+    worker = PlantUMLPipeWorker(command=str(script))
+    worker.start()
+    try:
+        codes = ["@startuml\nA\n@enduml", "@startuml\nbad\n@enduml", "@startuml\nC\n@enduml"]
+        assert worker.render_many(codes, timeout=10) == [b"IMG:A\n", None, b"IMG:C\n"]
+        assert worker.render_many(["@startuml\nD\n@enduml"], timeout=10) == [b"IMG:D\n"]
+    finally:
+        worker.stop()
@@ -0,0 +1,15 @@
+from util.plantuml_service import PlantUMLService
+
+
+def test_construction_does_not_touch_the_disk(tmp_path):
+    output_dir = tmp_path / "img"
+    service = PlantUMLService(output_dir=str(output_dir), backend="daemon")
+    assert not output_dir.exists()
+
+    # 首次使用时才创建索引，并补录已有图片
+    output_dir.mkdir()
+    (output_dir / "uml_existing.png").write_bytes(b"x" * 10)
+    assert not service.image_catalog.is_empty()
+    assert not (output_dir / ".render_cache.sqlite3").exists()
+    service.render_cache
+    assert (output_dir / ".render_cache.sqlite3").exists()
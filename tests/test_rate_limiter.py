@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from llm.base import RateLimitTimeoutError
+from llm.rate_limiter import ProviderLimiter
+
+
+def test_waiters_acquire_in_arrival_order():
+    limiter = ProviderLimiter("p", max_concurrency=1)
+    order = []
+
+    async def waiter(name):
+        lease = await limiter.acquire(1, timeout=5)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        await limiter.release(lease)
+
+    async def scenario():
+        lease = await limiter.acquire(1, timeout=5)
+        tasks = []
+        for name in ["a", "b", "c"]:
+            tasks.append(asyncio.create_task(waiter(name)))
+            await asyncio.sleep(0)
+        assert limiter.get_stats()["queued"] == 3
+        await limiter.release(lease)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["a", "b", "c"]
+    assert limiter.in_flight == 0
+
+
+def test_small_request_does_not_jump_a_waiting_large_one():
+    # 每秒补充 100 个 token
+    limiter = ProviderLimiter("p", tpm=6000)
+
+    async def scenario():
+        await limiter.acquire(6000, timeout=1)
+        large = asyncio.create_task(limiter.acquire(3000, timeout=0.2))
+        await asyncio.sleep(0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await limiter.acquire(1, timeout=2)
+        waited = loop.time() - started
+        with pytest.raises(RateLimitTimeoutError):
+            await large
+        return waited
+
+    # 排在后面的小请求要等前面的大请求超时离开队列
+    assert asyncio.run(scenario()) >= 0.15
+    assert limiter.timeouts == 1
+
+
+def test_release_corrects_token_estimate():
+    limiter = ProviderLimiter("p", tpm=6000)
+
+    async def scenario():
+        lease = await limiter.acquire(3000, timeout=1)
+        await limiter.release(lease, actual_tokens=1000)
+
+    asyncio.run(scenario())
+    assert limiter.get_stats()["tokens_available"] >= 5000
@@ -0,0 +1,55 @@
+import os
+import time
+from util.render_cache import RenderCache
+from util.retention import RetentionService
+
+
+def write_image(directory, name, size):
+    path = directory / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_eviction_keeps_image_files(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=250)
+    keys = [cache.make_key(f"@startuml\nA -> B{i}\n@enduml") for i in range(3)]
+    paths = [write_image(tmp_path, f"img{i}.png", 100) for i in range(3)]
+    for key, path in zip(keys, paths):
+        cache.put(key, path)
+
+    # 最早的记录被淘汰，但图片可能仍被对话引用，文件保留
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get(keys[0]) is None
+    assert all((tmp_path / f"img{i}.png").exists() for i in range(3))
+    assert cache.get(keys[2]) == paths[2]
+
+
+def test_missing_file_drops_index_row(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    key = cache.make_key("@startuml\nA -> B\n@enduml")
+    path = write_image(tmp_path, "img.png", 10)
+    cache.put(key, path)
+    (tmp_path / "img.png").unlink()
+    assert cache.get(key) is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_cache_hit_protects_old_image_from_retention(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    service = RetentionService({"img": str(tmp_path)}, max_bytes=0, max_age_days=1, grace_seconds=3600)
+    keys = [cache.make_key(f"@startuml\nA -> B{i}\n@enduml") for i in range(2)]
+    for i, key in enumerate(keys):
+        path = write_image(tmp_path, f"img{i}.png", 10)
+        past = time.time() - 2 * 86400
+        os.utime(path, (past, past))
+        cache.put(key, path)
+
+    # 命中后图片出现在新的回复中，对话保存之前不能被清理
+    mtime = os.stat(tmp_path / "img0.png").st_mtime
+    assert cache.get(keys[0]) == str(tmp_path / "img0.png")
+    assert os.stat(tmp_path / "img0.png").st_mtime == mtime
+
+    report = service.run_once(dry_run=False)
+    assert report["deleted_files"] == 1
+    assert (tmp_path / "img0.png").exists()
+    assert not (tmp_path / "img1.png").exists()
@@ -0,0 +1,113 @@
+import asyncio
+import fakeredis
+from llm.base import ProviderError
+from llm.router import ModelRouter, TEXT
+from llm.hedging import HedgedStreamer
+from llm.response_cache import LLMResponseCache
+from llm.semantic_cache import SemanticCache
+from llm.single_flight import SingleFlight
+import api.routes as routes
+
+
+class FakeClient:
+    def __init__(self, model, fail=False):
+        self.model = model
+        self.fail = fail
+        self.calls = 0
+
+    async def chat_stream_async(self, user_input, system_prompt=None, history=None):
+        self.calls += 1
+        if self.fail:
+            raise ProviderError(self.model, "调用失败")
+        yield f"{self.model} 的回复"
+
+
+def test_failover_reply_is_cached_under_serving_model(monkeypatch):
+    primary = FakeClient("model-a", fail=True)
+    backup = FakeClient("model-b")
+    primary_up = {"value": True}
+    router = ModelRouter(failure_threshold=10, idle_timeout=5)
+    router.register("a", lambda: primary, {TEXT}, is_available=lambda: primary_up["value"])
+    router.register("b", lambda: backup, {TEXT})
+    cache = LLMResponseCache(enabled=True, redis_client=fakeredis.FakeAsyncRedis(decode_responses=True))
+    monkeypatch.setattr(routes, "model_router", router)
+    monkeypatch.setattr(routes, "hedged_streamer", HedgedStreamer(router))
+    monkeypatch.setattr(routes, "response_cache", cache)
+    monkeypatch.setattr(routes, "semantic_cache", SemanticCache(enabled=False))
+    monkeypatch.setattr(routes, "single_flight", SingleFlight(enabled=True))
+
+    async def reply():
+        return "".join([chunk async for chunk in routes.stream_text_reply("系统提示词", "画一个类图")])
+
+    async def scenario():
+        # 首选的 a 失败，切换到 b 回复
+        assert await reply() == "model-b 的回复"
+        assert await cache.get(cache.make_key("model-a", "系统提示词", "画一个类图")) is None
+        assert await cache.get(cache.make_key("model-b", "系统提示词", "画一个类图")) == ["model-b 的回复"]
+
+        # a 仍是首选时不会回放 b 的回复
+        assert await reply() == "model-b 的回复"
+        assert primary.calls == 2
+
+        # b 成为首选后命中缓存
+        primary_up["value"] = False
+        calls = backup.calls
+        assert await reply() == "model-b 的回复"
+        assert backup.calls == calls
+
+    asyncio.run(scenario())
+
+
+class SlowClient(FakeClient):
+    async def chat_stream_async(self, user_input, system_prompt=None, history=None):
+        self.calls += 1
+        await asyncio.sleep(1)
+        yield f"{self.model} 的回复"
+
+
+def test_hedge_winner_is_reported_as_serving_provider():
+    router = ModelRouter(idle_timeout=5)
+    router.register("a", lambda: SlowClient("model-a"), {TEXT})
+    router.register("b", lambda: FakeClient("model-b"), {TEXT})
+    streamer = HedgedStreamer(router, enabled=True, min_delay=0.01, default_delay=0.01)
+    served = []
+
+    async def scenario():
+        chunks = streamer.select_and_stream(
+            TEXT, lambda c: c.chat_stream_async("画一个类图"),
+            on_served=lambda provider, client: served.append((provider, client.model))
+        )
+        assert [chunk async for chunk in chunks] == ["model-b 的回复"]
+
+    asyncio.run(scenario())
+    assert served == [("b", "model-b")]
+    assert streamer.hedge_wins == 1
+
+
+def make_cache(**kwargs):
+    return LLMResponseCache(enabled=True, redis_client=fakeredis.FakeAsyncRedis(decode_responses=True), **kwargs)
+
+
+def test_hit_refreshes_entry_ttl():
+    cache = make_cache(ttl=100)
+
+    async def scenario():
+        await cache.put("k", ["回复"])
+        await cache.redis.expire(cache._entry_key("k"), 5)
+        assert await cache.get("k") == ["回复"]
+        assert await cache.redis.ttl(cache._entry_key("k")) > 5
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_puts_of_same_key_count_bytes_once():
+    cache = make_cache()
+
+    async def scenario():
+        await asyncio.gather(*(cache.put("k", ["回复"]) for _ in range(3)))
+        size = int(await cache.redis.hget(cache._sizes_key, "k"))
+        assert int(await cache.redis.get(cache._total_key)) == size
+        await cache.clear()
+        assert int(await cache.redis.get(cache._total_key) or 0) == 0
+
+    asyncio.run(scenario())
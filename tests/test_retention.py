@@ -0,0 +1,92 @@
+import os
+import time
+import pytest
+from util.image_variants import ImageVariants
+from util.retention import RetentionService
+
+
+def write_file(path, size, age=0):
+    path.write_bytes(b"x" * size)
+    if age:
+        past = time.time() - age
+        os.utime(path, (past, past))
+    return path
+
+
+def test_deleting_original_removes_its_variants(tmp_path):
+    variants = ImageVariants(str(tmp_path / "img"))
+    service = RetentionService(
+        {"img": str(tmp_path / "img"), "variants": str(variants.variants_dir)},
+        max_bytes=0, max_age_days=1, grace_seconds=60,
+    )
+    service.add_delete_hook("img", variants.remove)
+
+    write_file(tmp_path / "img" / "old.png", 100, age=2 * 86400)
+    write_file(tmp_path / "img" / "new.png", 100)
+    for size in ImageVariants.VARIANT_WIDTHS:
+        write_file(variants.variant_path("old.png", size), 10)
+        write_file(variants.variant_path("new.png", size), 10)
+
+    report = service.run_once(dry_run=False)
+    assert report["deleted_files"] == 1
+    assert not (tmp_path / "img" / "old.png").exists()
+    assert not any(variants.variant_path("old.png", size).exists() for size in ImageVariants.VARIANT_WIDTHS)
+    assert all(variants.variant_path("new.png", size).exists() for size in ImageVariants.VARIANT_WIDTHS)
+
+
+def test_variants_count_toward_the_budget(tmp_path):
+    variants = ImageVariants(str(tmp_path / "img"))
+    service = RetentionService(
+        {"img": str(tmp_path / "img"), "variants": str(variants.variants_dir)},
+        max_bytes=150, max_age_days=0, grace_seconds=60,
+    )
+    write_file(tmp_path / "img" / "a.png", 100, age=600)
+    # 原图已不存在的缩略图
+    write_file(variants.variant_path("gone.png", "thumb"), 100, age=3600)
+
+    report = service.plan()
+    assert report["directories"]["variants"] == {"files": 1, "bytes": 100}
+    assert [(c["directory"], c["filename"]) for c in report["candidates"]] == [("variants", "gone_thumb.png")]
+
+
+def make_service(tmp_path, **kwargs):
+    (tmp_path / "img").mkdir(exist_ok=True)
+    return RetentionService({"img": str(tmp_path / "img")}, **kwargs)
+
+
+def test_referenced_and_recent_files_are_never_candidates(tmp_path):
+    service = make_service(tmp_path, max_bytes=1, max_age_days=1, grace_seconds=600)
+    write_file(tmp_path / "img" / "referenced.png", 100, age=10 * 86400)
+    write_file(tmp_path / "img" / "recent.png", 100, age=60)
+    write_file(tmp_path / "img" / "orphan.png", 100, age=10 * 86400)
+    service.set_reference_provider(lambda: {"referenced.png"})
+
+    report = service.plan()
+    assert [c["filename"] for c in report["candidates"]] == ["orphan.png"]
+    assert report["candidates"][0]["reason"] == "age"
+    assert (report["protected_files"], report["grace_files"]) == (1, 1)
+
+
+def test_size_budget_evicts_least_recently_accessed_first(tmp_path):
+    service = make_service(tmp_path, max_bytes=250, max_age_days=0, grace_seconds=0)
+    for name, age in [("a.png", 300), ("b.png", 100), ("c.png", 200)]:
+        write_file(tmp_path / "img" / name, 100, age=age)
+    # 访问过的 a 变为最近使用
+    os.utime(tmp_path / "img" / "a.png", (time.time(), time.time() - 300))
+
+    report = service.plan()
+    assert [(c["filename"], c["reason"]) for c in report["candidates"]] == [("c.png", "size")]
+    assert report["reclaimable_bytes"] == 100
+
+
+def test_failed_reference_lookup_aborts_the_run(tmp_path):
+    service = make_service(tmp_path, max_bytes=1, max_age_days=0, grace_seconds=0)
+    write_file(tmp_path / "img" / "a.png", 100, age=600)
+
+    def broken():
+        raise ConnectionError("数据库不可用")
+
+    service.set_reference_provider(broken)
+    with pytest.raises(ConnectionError):
+        service.run_once(dry_run=False)
+    assert (tmp_path / "img" / "a.png").exists()
@@ -0,0 +1,47 @@
+import pytest
+from llm.base import CircuitOpenError
+from llm.router import ModelRouter, TEXT
+from llm.summarizer import ConversationSummarizer
+
+
+class FakeClient:
+    def __init__(self, model):
+        self.model = model
+
+
+def make_router(enabled=True):
+    router = ModelRouter(enabled=enabled, explore_rate=0, max_cost=1.0)
+    router.register("cheap", lambda: FakeClient("cheap"), {TEXT}, cost=0.5)
+    router.register("expensive", lambda: FakeClient("expensive"), {TEXT}, cost=5.0)
+    return router
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_provider_over_cost_ceiling_is_never_a_candidate(enabled):
+    router = make_router(enabled)
+    assert router.candidates(TEXT) == ["cheap"]
+    assert router.select(TEXT)[0] == "cheap"
+    # 失败切换和对冲的备用同样不会选到超出上限的提供方
+    with pytest.raises(CircuitOpenError):
+        router.select(TEXT, exclude=["cheap"])
+
+
+def test_only_expensive_provider_healthy_raises():
+    router = make_router()
+    for _ in range(router.failure_threshold):
+        router.breakers["cheap"].record_failure()
+
+    with pytest.raises(CircuitOpenError, match="价格上限"):
+        router.select(TEXT)
+    assert router.candidates(TEXT) == ["cheap"]
+
+    only_expensive = ModelRouter(max_cost=1.0)
+    only_expensive.register("expensive", lambda: FakeClient("expensive"), {TEXT}, cost=5.0)
+    with pytest.raises(CircuitOpenError, match="价格上限"):
+        only_expensive.preferred(TEXT)
+
+
+def test_summarizer_respects_cost_ceiling():
+    router = make_router()
+    summarizer = ConversationSummarizer(router, provider="expensive", fallback=False)
+    assert summarizer._select_client() is None
@@ -0,0 +1,48 @@
+import asyncio
+import api.streaming as streaming
+from util.plantuml_service import RenderQueueFullError
+
+VALID = "@startuml\nA -> B\n@enduml"
+INVALID = "@startuml\nclass A {\n@enduml"
+
+
+async def chunks():
+    yield f"```plantuml\n{VALID}\n```\n"
+    yield f"```plantuml\n{INVALID}\n```\n"
+
+
+def collect(monkeypatch, render):
+    monkeypatch.setattr(streaming.plantuml_service, "render_plantuml_codes_async", render)
+
+    async def scenario():
+        return [event async for event in streaming.stream_with_renders(chunks(), "u")]
+
+    return asyncio.run(scenario())
+
+
+def test_failed_diagrams_are_emitted_with_error(monkeypatch):
+    async def render(blocks, userid, priority=None):
+        return [
+            {"plantuml_code": block, "success": "{" not in block, "diagram_type": "class",
+             "error": None if "{" not in block else "PlantUML 语法错误: 第 2 行: 类定义缺少 }"}
+            for block in blocks
+        ]
+
+    events = collect(monkeypatch, render)
+    results = [event["plantuml_result"] for event in events if "plantuml_result" in event]
+    assert sorted(result["index"] for result in results) == [0, 1]
+
+    final = events[-1]["plantuml_results"]
+    assert [(result["index"], result["success"]) for result in final] == [(0, True), (1, False)]
+    assert "第 2 行" in final[1]["error"]
+    assert final[1]["diagram_type"] == "class"
+
+
+def test_full_render_queue_marks_diagrams_failed(monkeypatch):
+    async def render(blocks, userid, priority=None):
+        raise RenderQueueFullError(3)
+
+    events = collect(monkeypatch, render)
+    final = events[-1]["plantuml_results"]
+    assert [result["success"] for result in final] == [False, False]
+    assert all(result["error"] and result["diagram_type"] is None for result in final)
@@ -0,0 +1,35 @@
+from llm import tokens
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+def test_counting_never_loads_the_encoding(monkeypatch):
+    calls = []
+    monkeypatch.setattr(tokens, "_encoding", None)
+    monkeypatch.setattr(tokens, "_get_encoding", lambda name: calls.append(name) or FakeEncoding())
+
+    assert tokens.count_tokens("one two three") == tokens.estimate_tokens("one two three")
+    assert tokens.tokenizer_name() == "estimate"
+    assert calls == []
+
+    assert tokens.load_tokenizer() == tokens.TOKENIZER_ENCODING
+    assert tokens.count_tokens("one two three") == 3
+    assert len(calls) == 1
+
+
+def test_failed_load_reports_estimate(monkeypatch):
+    monkeypatch.setattr(tokens, "_encoding", None)
+    monkeypatch.setattr(tokens, "_get_encoding", lambda name: None)
+
+    assert tokens.load_tokenizer() == "estimate"
+    assert tokens.count_tokens("one two three") == tokens.estimate_tokens("one two three")
+
+
+def test_truncate_tokens_fits_budget():
+    text = "图表" * 50 + "diagram " * 50
+    truncated = tokens.truncate_tokens(text, 30)
+    assert tokens.count_tokens(truncated) <= 30
+    assert text.startswith(truncated)
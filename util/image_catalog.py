@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成图片目录
+渲染时登记每张图片，列表接口直接查询索引，读取时不再扫描文件系统
+"""
+
+import json
+import time
+import base64
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+
+class ImageCatalog:
+    """基于 SQLite 的图片目录，支持游标分页和按用户、时间范围过滤"""
+
+    def __init__(self, output_dir: str = "workspace/img", index_path: Optional[str] = None):
+        """
+        初始化图片目录
+
+        Args:
+            output_dir: 图片所在目录
+            index_path: SQLite 索引文件路径，默认放在 output_dir 下
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = Path(index_path) if index_path else self.output_dir / ".catalog.sqlite3"
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                userid TEXT NOT NULL,
+                diagram_type TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (filename, userid)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_images_created ON images(created_at, id)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_images_user_created ON images(userid, created_at, id)"
+        )
+        # 图表源码，用于按需生成其他格式（如 SVG）
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_sources (
+                filename TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                diagram_type TEXT
+            )
+        """)
+        # 后台无损压缩节省的字节数
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_optimizations (
+                filename TEXT PRIMARY KEY,
+                original_size INTEGER NOT NULL,
+                optimized_size INTEGER NOT NULL,
+                optimized_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def record(self, filename: str, userid: str, size: int,
+               diagram_type: Optional[str] = None, created_at: Optional[float] = None,
+               source: Optional[str] = None):
+        """
+        登记一张图片；同一用户重复生成同一张图只保留第一次的记录
+
+        Args:
+            filename: 图片文件名
+            userid: 用户ID
+            size: 文件大小（字节）
+            diagram_type: 图表类型
+            created_at: 生成时间戳，默认当前时间
+            source: 图表源码
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR IGNORE INTO images (filename, userid, diagram_type, size, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (filename, userid, diagram_type, size, created_at or time.time())
+            )
+            if source is not None:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO image_sources (filename, source, diagram_type) VALUES (?, ?, ?)",
+                    (filename, source, diagram_type)
+                )
+            self._conn.commit()
+
+    def get_source(self, filename: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        查询图片的源码
+
+        Returns:
+            (源码, 图表类型)，没有记录时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, diagram_type FROM image_sources WHERE filename = ?", (filename,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def update_size(self, filename: str, size: int):
+        """图片文件被替换后更新记录的大小"""
+        with self._lock:
+            self._conn.execute("UPDATE images SET size = ? WHERE filename = ?", (size, filename))
+            self._conn.commit()
+
+    def record_optimization(self, filename: str, original_size: int, optimized_size: int):
+        """
+        记录一张图片压缩前后的大小，并更新图片记录中的大小
+
+        Args:
+            filename: 图片文件名
+            original_size: 压缩前大小（字节）
+            optimized_size: 压缩后大小（字节）
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO image_optimizations (filename, original_size, optimized_size, optimized_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (filename, original_size, optimized_size, time.time())
+            )
+            self._conn.execute("UPDATE images SET size = ? WHERE filename = ?", (optimized_size, filename))
+            self._conn.commit()
+
+    def get_optimization_stats(self) -> Dict[str, int]:
+        """累计的压缩效果（重启后依然保留）"""
+        with self._lock:
+            images, original, optimized = self._conn.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(original_size), 0), COALESCE(SUM(optimized_size), 0)
+                FROM image_optimizations
+                """
+            ).fetchone()
+        return {
+            "images": images,
+            "bytes_before": original,
+            "bytes_after": optimized,
+            "bytes_saved": original - optimized,
+        }
+
+    def remove_file(self, filename: str):
+        """图片文件被删除后移除所有相关记录"""
+        with self._lock:
+            self._conn.execute("DELETE FROM images WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM image_sources WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM image_optimizations WHERE filename = ?", (filename,))
+            self._conn.commit()
+
+    def is_empty(self) -> bool:
+        """目录中是否还没有任何记录"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM images LIMIT 1").fetchone() is None
+
+    def backfill_from_directory(self, pattern: str = "*.png") -> int:
+        """
+        一次性导入目录中已有的图片（升级前生成的图片不在索引中）
+
+        Returns:
+            导入的图片数
+        """
+        rows = []
+        for file_path in self.output_dir.glob(pattern):
+            stat = file_path.stat()
+            rows.append((file_path.name, "default", None, stat.st_size, stat.st_ctime))
+
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO images (filename, userid, diagram_type, size, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    @staticmethod
+    def _encode_cursor(created_at: float, row_id: int) -> str:
+        payload = json.dumps([created_at, row_id]).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[float, int]:
+        try:
+            created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return float(created_at), int(row_id)
+        except Exception:
+            raise ValueError("无效的分页游标")
+
+    def list_images(self,
+                    userid: Optional[str] = None,
+                    start_time: Optional[float] = None,
+                    end_time: Optional[float] = None,
+                    cursor: Optional[str] = None,
+                    limit: int = 50) -> Dict[str, Any]:
+        """
+        按生成时间倒序分页列出图片
+
+        Args:
+            userid: 只列出该用户的图片
+            start_time: 生成时间下限（时间戳，包含）
+            end_time: 生成时间上限（时间戳，不包含）
+            cursor: 上一页返回的 next_cursor
+            limit: 每页条数
+
+        Returns:
+            {"images": [...], "total": 满足过滤条件的总数, "next_cursor": 下一页游标或 None}
+
+        Raises:
+            ValueError: 游标无效
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+        if userid:
+            conditions.append("userid = ?")
+            params.append(userid)
+        if start_time is not None:
+            conditions.append("created_at >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("created_at < ?")
+            params.append(end_time)
+
+        filter_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if cursor:
+            cursor_created_at, cursor_id = self._decode_cursor(cursor)
+            page_conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            page_params.extend([cursor_created_at, cursor_created_at, cursor_id])
+        page_sql = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM images {filter_sql}", params
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"""
+                SELECT id, filename, userid, diagram_type, size, created_at FROM images
+                {page_sql}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+                """,
+                page_params + [limit + 1]
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(rows[-1][5], rows[-1][0])
+
+        images = [
+            {
+                "filename": filename,
+                "path": str(self.output_dir / filename),
+                "url": f"/api/v1/images/{filename}",
+                "thumbnail_url": f"/api/v1/images/{filename}?size=thumb",
+                "userid": row_userid,
+                "diagram_type": diagram_type,
+                "size": size,
+                "created_time": created_at,
+            }
+            for _, filename, row_userid, diagram_type, size, created_at in rows
+        ]
+        return {"images": images, "total": total, "next_cursor": next_cursor}
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片多分辨率版本
+列表和历史记录只需要小尺寸预览，按需从原图生成缩略图和中等尺寸版本并缓存到磁盘
+"""
+
+import io
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, Optional
+from .plantuml_converter import write_file_atomic
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class ImageVariants:
+    """按需生成并缓存 PNG 图片的缩小版本"""
+
+    # 版本名称 -> 最大宽度（像素）
+    VARIANT_WIDTHS: Dict[str, int] = {
+        "thumb": 320,
+        "medium": 960,
+    }
+
+    def __init__(self, output_dir: str = "workspace/img", variants_dir: Optional[str] = None):
+        """
+        初始化
+
+        Args:
+            output_dir: 原图所在目录
+            variants_dir: 缩小版本的存放目录，默认为 output_dir/variants
+        """
+        self.output_dir = Path(output_dir)
+        self.variants_dir = Path(variants_dir) if variants_dir else self.output_dir / "variants"
+        self.variants_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._path_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self.generated = 0
+
+    def is_available(self) -> bool:
+        """是否安装了 Pillow；未安装时所有尺寸都返回原图"""
+        return Image is not None
+
+    def variant_path(self, filename: str, size: str) -> Path:
+        """某个版本的缓存文件路径"""
+        return self.variants_dir / f"{Path(filename).stem}_{size}.png"
+
+    def _path_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._path_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._path_locks[key] = lock
+            return lock
+
+    def get_path(self, filename: str, size: str) -> Optional[Path]:
+        """
+        获取指定尺寸的图片，不存在时从原图生成
+
+        Args:
+            filename: 原图文件名（PNG）
+            size: VARIANT_WIDTHS 中的版本名称
+
+        Returns:
+            图片路径；原图已经足够小或无法缩放时返回原图路径，原图不存在时返回 None
+        """
+        original = self.output_dir / filename
+        if not original.exists():
+            return None
+        if Image is None or size not in self.VARIANT_WIDTHS or original.suffix.lower() != ".png":
+            return original
+
+        target = self.variant_path(filename, size)
+        with self._path_lock(str(target)):
+            if target.exists() and target.stat().st_mtime >= original.stat().st_mtime:
+                return target
+
+            max_width = self.VARIANT_WIDTHS[size]
+            try:
+                with Image.open(original) as image:
+                    if image.width <= max_width:
+                        return original
+                    height = max(1, round(image.height * max_width / image.width))
+                    resized = image.resize((max_width, height), Image.LANCZOS)
+                buffer = io.BytesIO()
+                resized.save(buffer, format="PNG", optimize=True)
+            except (OSError, ValueError) as e:
+                print(f"⚠ 生成缩略图失败: {filename}: {e}")
+                return original
+
+            write_file_atomic(target, buffer.getvalue())
+            self.generated += 1
+            return target
+
+    def remove(self, filename: str):
+        """原图被删除后清理其所有版本"""
+        for size in self.VARIANT_WIDTHS:
+            try:
+                self.variant_path(filename, size).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠ 删除缩略图失败: {filename}: {e}")
@@ -8,40 +8,70 @@ PlantUML 转换工具
 import os
 import sys
 import subprocess
-import tempfile
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Union, List
 import hashlib
 import time
+import threading
+
+
+# 管道模式下每张图输出结束后 PlantUML 打印的分隔行
+PIPE_DELIMITER = "___AUG_PLANTUML_DIAGRAM_END___"
+
+
+def write_file_atomic(path: Union[str, Path], data: bytes):
+    """
+    先写入同目录下的临时文件再原子替换，读取方不会看到写了一半的文件
+    
+    Args:
+        path: 目标文件路径
+        data: 文件内容
+    """
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
 
 
 class PlantUMLConverter:
     """PlantUML 转换器类"""
     
-    def __init__(self, output_dir: str = "workspace/img"):
+    def __init__(self, output_dir: str = "workspace/img", render_timeout: float = 30):
         """
         初始化转换器
         
         Args:
             output_dir: 输出图片的目录路径
+            render_timeout: 单张图的渲染超时时间（秒），批量渲染时按图的数量放大
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.render_timeout = render_timeout
         
-        # 检查是否安装了 PlantUML
-        self._check_plantuml_installation()
+        # PlantUML 是否已安装，None 表示尚未检查；检查在启动预热阶段进行，不阻塞构造
+        self.installed: Optional[bool] = None
     
-    def _check_plantuml_installation(self):
-        """检查 PlantUML 是否已安装"""
+    def _check_plantuml_installation(self) -> bool:
+        """检查 PlantUML 是否已安装（会启动一次 JVM，阻塞调用）"""
         try:
             result = subprocess.run(['plantuml', '-version'], 
                                   capture_output=True, text=True, timeout=10)
             if result.returncode == 0:
                 print("✓ PlantUML 已安装")
+                self.installed = True
                 return True
         except (subprocess.TimeoutExpired, FileNotFoundError):
             pass
         
+        self.installed = False
         print("⚠ PlantUML 未安装或不在 PATH 中")
         print("请安装 PlantUML:")
         print("  Ubuntu/Debian: sudo apt-get install plantuml")
@@ -49,6 +79,76 @@ class PlantUMLConverter:
         print("  Windows: 下载并安装 PlantUML.jar")
         return False
     
+    def render_to_bytes(self, plantuml_code: str, format: str = "png") -> Optional[bytes]:
+        """
+        通过 stdin/stdout 管道渲染，不在磁盘上创建任何临时文件
+        
+        Args:
+            plantuml_code: PlantUML 语法代码
+            format: 输出格式 (png, svg, pdf, etc.)
+            
+        Returns:
+            图片字节，如果失败返回 None
+        """
+        return self.render_many_to_bytes([plantuml_code], format)[0]
+    
+    def render_many_to_bytes(self, plantuml_codes: List[str], format: str = "png") -> List[Optional[bytes]]:
+        """
+        在一次 PlantUML 管道调用中渲染多段代码，只需启动一次 JVM
+        
+        Args:
+            plantuml_codes: PlantUML 语法代码列表
+            format: 输出格式
+            
+        Returns:
+            与输入一一对应的图片字节，失败的图对应 None
+        """
+        if not plantuml_codes:
+            return []
+        if any(not code.strip() for code in plantuml_codes):
+            if len(plantuml_codes) == 1:
+                print("错误: PlantUML 代码不能为空")
+                return [None]
+            return [self.render_to_bytes(code, format) if code.strip() else None for code in plantuml_codes]
+        
+        cmd = [
+            'plantuml',
+            '-pipe',
+            f'-t{format}',
+            '-charset', 'UTF-8',
+            '-pipedelimitor', PIPE_DELIMITER,
+        ]
+        payload = "".join(code.strip() + "\n" for code in plantuml_codes)
+        
+        try:
+            print(f"正在转换 {len(plantuml_codes)} 段 PlantUML 代码为 {format.upper()} 格式...")
+            result = subprocess.run(
+                cmd,
+                input=payload.encode('utf-8'),
+                capture_output=True,
+                timeout=self.render_timeout * len(plantuml_codes)
+            )
+        except subprocess.TimeoutExpired:
+            print("✗ 转换超时")
+            return [None] * len(plantuml_codes)
+        except Exception as e:
+            print(f"✗ 转换过程中发生错误: {e}")
+            return [None] * len(plantuml_codes)
+        
+        stderr = result.stderr.decode('utf-8', errors='replace')
+        if result.returncode == 0 and "ERROR" not in stderr.upper():
+            parts = result.stdout.split(PIPE_DELIMITER.encode('utf-8'))
+            images = [parts[0]] + [part.lstrip(b"\r\n") for part in parts[1:]]
+            if len(images) > len(plantuml_codes):
+                return images[:len(plantuml_codes)]
+        
+        if len(plantuml_codes) == 1:
+            print(f"✗ 转换失败: {stderr.strip()}")
+            return [None]
+        
+        # 无法从错误输出判断是哪一段代码出错，逐段重新渲染
+        return [self.render_to_bytes(code, format) for code in plantuml_codes]
+    
     def convert_to_image(self, 
                         plantuml_code: str, 
                         output_filename: Optional[str] = None,
@@ -75,50 +175,37 @@ class PlantUMLConverter:
             timestamp = int(time.time())
             output_filename = f"plantuml_{code_hash}_{timestamp}"
         
-        # 确保文件名不包含扩展名
-        output_filename = Path(output_filename).stem
-        
-        # 创建具有指定名称的临时文件
-        temp_puml_path = self.output_dir / f"{output_filename}.puml"
+        return self.convert_many([plantuml_code], [output_filename], format)[0]
+    
+    def convert_many(self,
+                     plantuml_codes: List[str],
+                     output_filenames: List[str],
+                     format: str = "png") -> List[Optional[str]]:
+        """
+        在一次 PlantUML 调用中转换多段代码并写入输出目录
         
-        try:
-            # 写入PlantUML代码到指定文件
-            with open(temp_puml_path, 'w', encoding='utf-8') as f:
-                f.write(plantuml_code)
-            
-            # 构建输出路径
-            output_path = self.output_dir / f"{output_filename}.{format}"
-            
-            # 执行 PlantUML 命令
-            cmd = [
-                'plantuml',
-                '-t', format,
-                '-o', str(self.output_dir.absolute()),
-                str(temp_puml_path)
-            ]
+        Args:
+            plantuml_codes: PlantUML 语法代码列表
+            output_filenames: 对应的输出文件名（不包含扩展名）
+            format: 输出格式
             
-            print(f"正在转换 PlantUML 代码为 {format.upper()} 格式...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        Returns:
+            与输入一一对应的图片文件路径，失败的图对应 None
+        """
+        images = self.render_many_to_bytes(plantuml_codes, format)
+        
+        paths = []
+        for image, output_filename in zip(images, output_filenames):
+            if image is None:
+                paths.append(None)
+                continue
             
-            if result.returncode == 0:
-                print(f"✓ 转换成功: {output_path}")
-                return str(output_path)
-            else:
-                print(f"✗ 转换失败: {result.stderr}")
-                return None
-                
-        except subprocess.TimeoutExpired:
-            print("✗ 转换超时")
-            return None
-        except Exception as e:
-            print(f"✗ 转换过程中发生错误: {e}")
-            return None
-        finally:
-            # 清理临时文件
-            try:
-                os.unlink(temp_puml_path)
-            except:
-                pass
+            # 确保文件名不包含扩展名
+            output_path = self.output_dir / f"{Path(output_filename).stem}.{format}"
+            write_file_atomic(output_path, image)
+            print(f"✓ 转换成功: {output_path}")
+            paths.append(str(output_path))
+        return paths
     
     def convert_from_file(self, 
                          input_file: Union[str, Path], 
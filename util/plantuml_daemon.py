@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PlantUML 常驻渲染进程池
+通过 `plantuml -pipe` 保持若干个预热的 JVM 进程，经 stdin/stdout 传输图表，
+避免每次渲染都重新启动 JVM
+"""
+
+import os
+import re
+import select
+import shutil
+import subprocess
+import threading
+import time
+import queue
+import atexit
+from typing import Dict, List, Optional
+from .plantuml_converter import PIPE_DELIMITER
+
+
+# 使用 -pipeNoStderr 时，出错的图在自己的输出段（分隔行之前）写入 ERROR 标记而不是写到 stderr
+PIPE_ERROR_PATTERN = re.compile(rb"\AERROR\r?\n|(?:\A|\n)ERROR\s*\Z")
+
+
+class PlantUMLDaemonError(Exception):
+    """常驻进程不可用（崩溃、超时、未安装等），调用方应回退到子进程模式"""
+
+
+class PlantUMLSyntaxError(Exception):
+    """PlantUML 报告图表语法错误，换用其他渲染方式也不会成功"""
+
+
+class PlantUMLPipeWorker:
+    """单个 `plantuml -pipe` 工作进程"""
+
+    def __init__(self, format: str = "png", command: str = "plantuml"):
+        """
+        初始化工作进程（不会立即启动）
+
+        Args:
+            format: 输出格式，一个进程只负责一种格式
+            command: PlantUML 可执行文件
+        """
+        self.format = format
+        self.command = command
+        self.process: Optional[subprocess.Popen] = None
+        self.render_count = 0
+        self.started_at = 0.0
+
+    def start(self):
+        """启动 PlantUML 进程"""
+        cmd = [
+            self.command,
+            '-pipe',
+            f'-t{self.format}',
+            '-charset', 'UTF-8',
+            '-pipedelimitor', PIPE_DELIMITER,
+            '-pipeNoStderr',
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # 错误已写入 stdout，stderr 只剩 JVM 日志，每批结束后非阻塞地读取丢弃
+        os.set_blocking(self.process.stderr.fileno(), False)
+        self.render_count = 0
+        self.started_at = time.time()
+
+    def is_alive(self) -> bool:
+        """进程是否仍在运行"""
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        """结束进程"""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        self.process = None
+
+    def render_many(self, plantuml_codes: List[str], timeout: float = 30) -> List[Optional[bytes]]:
+        """
+        在一次写入中渲染多张图
+
+        Args:
+            plantuml_codes: 完整的 PlantUML 代码列表（包含 @startuml/@enduml）
+            timeout: 整批渲染的超时时间（秒）
+
+        Returns:
+            与输入一一对应的图片字节，语法错误的图对应 None
+
+        Raises:
+            PlantUMLDaemonError: 进程崩溃或超时
+        """
+        if not self.is_alive():
+            raise PlantUMLDaemonError("PlantUML 常驻进程未运行")
+
+        deadline = time.monotonic() + timeout
+        payload = "".join(code.strip() + "\n" for code in plantuml_codes)
+        try:
+            self.process.stdin.write(payload.encode('utf-8'))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise PlantUMLDaemonError(f"写入 PlantUML 进程失败: {e}")
+
+        marker = PIPE_DELIMITER.encode('utf-8')
+        stdout_fd = self.process.stdout.fileno()
+        buffer = b""
+        images: List[Optional[bytes]] = []
+
+        while len(images) < len(plantuml_codes):
+            index = buffer.find(marker)
+            if index >= 0:
+                segment = buffer[:index]
+                images.append(None if PIPE_ERROR_PATTERN.search(segment) else segment)
+                buffer = buffer[index + len(marker):].lstrip(b"\r\n")
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PlantUMLDaemonError("PlantUML 常驻进程渲染超时")
+            readable, _, _ = select.select([stdout_fd], [], [], remaining)
+            if not readable:
+                continue
+            data = os.read(stdout_fd, 65536)
+            if not data:
+                raise PlantUMLDaemonError("PlantUML 常驻进程意外退出")
+            buffer += data
+
+        self.render_count += len(plantuml_codes)
+        self._discard_stderr()
+        return images
+
+    def _discard_stderr(self):
+        """读取并丢弃 stderr 中积累的输出，避免管道写满阻塞进程"""
+        while True:
+            try:
+                data = os.read(self.process.stderr.fileno(), 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+
+
+class PlantUMLDaemonPool:
+    """PlantUML 常驻进程池"""
+
+    def __init__(self,
+                 size: int = 2,
+                 max_renders_per_worker: int = 500,
+                 render_timeout: float = 30,
+                 command: str = "plantuml"):
+        """
+        初始化进程池
+
+        Args:
+            size: 同时运行的最大进程数
+            max_renders_per_worker: 单个进程渲染多少张图后回收，防止内存泄漏
+            render_timeout: 单次渲染超时时间（秒）
+            command: PlantUML 可执行文件
+        """
+        self.size = max(1, size)
+        self.max_renders_per_worker = max_renders_per_worker
+        self.render_timeout = render_timeout
+        self.command = command
+
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: Dict[str, "queue.LifoQueue[PlantUMLPipeWorker]"] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.restarts = 0
+
+        atexit.register(self.shutdown)
+
+    def is_available(self) -> bool:
+        """当前环境能否使用常驻进程（需要 POSIX 管道和 PlantUML 可执行文件）"""
+        return os.name == "posix" and shutil.which(self.command) is not None
+
+    def _idle_queue(self, format: str) -> "queue.LifoQueue[PlantUMLPipeWorker]":
+        with self._lock:
+            if format not in self._idle:
+                self._idle[format] = queue.LifoQueue()
+            return self._idle[format]
+
+    def _acquire(self, format: str) -> PlantUMLPipeWorker:
+        """取一个空闲进程，没有则新建"""
+        idle = self._idle_queue(format)
+        while True:
+            try:
+                worker = idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.is_alive():
+                return worker
+            worker.stop()
+
+        worker = PlantUMLPipeWorker(format, self.command)
+        try:
+            worker.start()
+        except (OSError, ValueError) as e:
+            raise PlantUMLDaemonError(f"无法启动 PlantUML 常驻进程: {e}")
+        return worker
+
+    def _release(self, worker: PlantUMLPipeWorker):
+        """归还进程；已退出或达到回收阈值的进程直接结束"""
+        if self._closed or not worker.is_alive() or worker.render_count >= self.max_renders_per_worker:
+            worker.stop()
+            return
+
+        idle = self._idle_queue(worker.format)
+        if idle.qsize() >= self.size:
+            worker.stop()
+            return
+        idle.put(worker)
+
+    def prewarm(self, format: str = "png"):
+        """
+        启动一个空闲进程并用一张最小的图完成 JVM 预热，供启动阶段调用
+
+        Raises:
+            PlantUMLDaemonError: 进程无法启动或渲染失败
+        """
+        self.render("@startuml\nA -> B\n@enduml", format)
+
+    def render_many(self, plantuml_codes: List[str], format: str = "png") -> List[Optional[bytes]]:
+        """
+        渲染多张图，进程崩溃或超时时换一个新进程重试一次
+
+        Args:
+            plantuml_codes: 完整的 PlantUML 代码列表
+            format: 输出格式
+
+        Returns:
+            图片字节列表，语法错误的图对应 None
+
+        Raises:
+            PlantUMLDaemonError: 重试后仍然失败
+        """
+        if self._closed:
+            raise PlantUMLDaemonError("PlantUML 进程池已关闭")
+
+        self._slots.acquire()
+        try:
+            last_error = None
+            for _ in range(2):
+                worker = self._acquire(format)
+                try:
+                    return worker.render_many(plantuml_codes, timeout=self.render_timeout)
+                except PlantUMLDaemonError as e:
+                    last_error = e
+                    worker.stop()
+                    self.restarts += 1
+                    print(f"⚠ PlantUML 常驻进程异常，已重启: {e}")
+                finally:
+                    self._release(worker)
+            raise last_error
+        finally:
+            self._slots.release()
+
+    def render(self, plantuml_code: str, format: str = "png") -> bytes:
+        """
+        渲染单张图
+
+        Raises:
+            PlantUMLSyntaxError: 图表语法错误
+            PlantUMLDaemonError: 常驻进程不可用
+        """
+        image = self.render_many([plantuml_code], format)[0]
+        if image is None:
+            raise PlantUMLSyntaxError("PlantUML 语法错误")
+        return image
+
+    def shutdown(self):
+        """结束所有空闲进程"""
+        self._closed = True
+        with self._lock:
+            queues = list(self._idle.values())
+        for idle in queues:
+            while True:
+                try:
+                    idle.get_nowait().stop()
+                except queue.Empty:
+                    break
+
+    def get_stats(self) -> Dict[str, int]:
+        """进程池状态"""
+        with self._lock:
+            idle = {fmt: q.qsize() for fmt, q in self._idle.items()}
+        return {
+            "size": self.size,
+            "idle_workers": idle,
+            "restarts": self.restarts,
+        }
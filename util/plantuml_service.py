@@ -7,24 +7,462 @@ PlantUML 服务类
 
 import re
 import os
+import asyncio
+import math
+import queue
+import time
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Optional, Tuple, Dict, Any
-from .plantuml_converter import PlantUMLConverter
+from typing import Optional, Tuple, Dict, Any, List, Callable
+from .plantuml_converter import PlantUMLConverter, write_file_atomic
+from .plantuml_daemon import PlantUMLDaemonPool, PlantUMLDaemonError
+from .render_cache import RenderCache
+from .image_catalog import ImageCatalog
+from .image_variants import ImageVariants
+from .png_optimizer import PNGOptimizer
+from .plantuml_validator import validate_plantuml, classify_diagram, format_validation_errors
+from config import (
+    PLANTUML_RENDER_BACKEND,
+    RENDER_CACHE_MAX_BYTES,
+    PNG_OPTIMIZE_ENABLED,
+    PNG_OPTIMIZE_WORKERS,
+    PLANTUML_DAEMON_WORKERS,
+    PLANTUML_DAEMON_MAX_RENDERS,
+    PLANTUML_RENDER_TIMEOUT,
+    PLANTUML_RENDER_CONCURRENCY,
+    PLANTUML_RENDER_QUEUE_SIZE,
+    PLANTUML_VALIDATION_ENABLED,
+)
+
+
+PLANTUML_BLOCK_PATTERN = re.compile(r'@startuml\s*(.*?)\s*@enduml', re.DOTALL | re.IGNORECASE)
+
+
+class PlantUMLStreamExtractor:
+    """
+    流式响应的增量 PlantUML 提取器
+    每收到一个片段调用一次 feed，@enduml 一到达即可拿到完整的代码块，
+    无需等待整段响应结束
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self._scan_pos = 0
+    
+    def feed(self, chunk: str) -> List[str]:
+        """
+        追加一个响应片段
+        
+        Args:
+            chunk: 新到达的文本片段
+            
+        Returns:
+            本次新出现的完整 PlantUML 代码块列表
+        """
+        self.buffer += chunk
+        
+        blocks = []
+        for match in PLANTUML_BLOCK_PATTERN.finditer(self.buffer, self._scan_pos):
+            blocks.append(f"@startuml\n{match.group(1).strip()}\n@enduml")
+            self._scan_pos = match.end()
+        return blocks
+
+
+class RenderPriority:
+    """渲染任务优先级，数值越小越先执行"""
+    INTERACTIVE = 0   # /query 对话中的渲染
+    BULK = 10         # /plantuml/convert 等批量或手动渲染
+
+
+class RenderQueueFullError(Exception):
+    """渲染队列已满，调用方应按 retry_after 秒后重试"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__(f"渲染队列已满，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class RenderScheduler:
+    """
+    有界优先级渲染调度器
+    固定数量的工作线程按优先级取任务，队列满时直接拒绝而不是无限堆积 JVM 进程
+    """
+    
+    def __init__(self, max_workers: int = 4, max_queue: int = 64, name: str = "plantuml-render"):
+        """
+        初始化调度器
+        
+        Args:
+            max_workers: 工作线程数，即同时进行的最大渲染数
+            max_queue: 排队任务上限；批量任务只能占用其中一半，保证交互请求总能排上队
+            name: 工作线程名前缀
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(1, max_queue)
+        self.bulk_queue_limit = max(1, self.max_queue // 2)
+        self.name = name
+        
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=500)
+        self._run_times = deque(maxlen=500)
+    
+    def _ensure_workers(self):
+        """按需启动工作线程（调用方持有锁）"""
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"{self.name}-{len(self._threads)}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+    
+    def submit(self, priority: int, fn: Callable, *args) -> Future:
+        """
+        提交渲染任务
+        
+        Args:
+            priority: 优先级，见 RenderPriority
+            fn: 要执行的阻塞函数
+            args: 函数参数
+            
+        Returns:
+            concurrent.futures.Future
+            
+        Raises:
+            RenderQueueFullError: 队列已满
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("渲染调度器已关闭")
+            
+            limit = self.max_queue if priority <= RenderPriority.INTERACTIVE else self.bulk_queue_limit
+            if self._queue.qsize() >= limit:
+                self.rejected += 1
+                raise RenderQueueFullError(self._estimate_retry_after())
+            
+            self._ensure_workers()
+            self.submitted += 1
+            self._queue.put((priority, next(self._sequence), time.monotonic(), future, fn, args))
+        return future
+    
+    def _worker(self):
+        while True:
+            _, _, enqueued_at, future, fn, args = self._queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            
+            started_at = time.monotonic()
+            with self._lock:
+                self.active += 1
+                self._wait_times.append(started_at - enqueued_at)
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self._run_times.append(time.monotonic() - started_at)
+    
+    def _estimate_retry_after(self) -> int:
+        """按平均渲染耗时估算排队中的任务多久能处理完（调用方持有锁）"""
+        average_run = sum(self._run_times) / len(self._run_times) if self._run_times else 1.0
+        backlog = self._queue.qsize() + self.active
+        return max(1, math.ceil(average_run * backlog / self.max_workers))
+    
+    def shutdown(self):
+        """停止接收任务并结束工作线程"""
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        for _ in threads:
+            # 退出标记的优先级高于任何任务，会被优先取出
+            self._queue.put((-1, next(self._sequence), 0.0, None, None, None))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """队列深度、等待时间等指标"""
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "bulk_queue_limit": self.bulk_queue_limit,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_time_avg_ms": round(sum(wait_times) / len(wait_times) * 1000, 2) if wait_times else 0.0,
+                "wait_time_p95_ms": round(wait_times[int((len(wait_times) - 1) * 0.95)] * 1000, 2) if wait_times else 0.0,
+                "wait_time_max_ms": round(wait_times[-1] * 1000, 2) if wait_times else 0.0,
+            }
 
 
 class PlantUMLService:
     """PlantUML 服务类"""
     
-    def __init__(self, output_dir: str = "workspace/img"):
+    def __init__(self,
+                 output_dir: str = "workspace/img",
+                 backend: str = "subprocess",
+                 max_concurrency: int = 4,
+                 max_queue: int = 64,
+                 validate: bool = True,
+                 optimize_png: bool = False,
+                 optimize_workers: int = 1):
         """
         初始化 PlantUML 服务
         
         Args:
             output_dir: 输出图片的目录路径
+            backend: 渲染方式，daemon 使用常驻进程池，subprocess 每次启动新进程
+            max_concurrency: 异步接口同时进行的最大渲染数
+            max_queue: 异步接口排队等待渲染的任务上限
+            validate: 渲染前是否进行纯 Python 预校验
+            optimize_png: 是否在后台对新生成的 PNG 做无损压缩
+            optimize_workers: 后台压缩线程数
         """
-        self.converter = PlantUMLConverter(output_dir)
         self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.backend = backend
+        self.validate = validate
+        self.png_optimizer = PNGOptimizer(optimize_workers, on_optimized=self._on_png_optimized) if optimize_png else None
+        self.diagram_stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+        
+        # 图片目录、索引和常驻进程池在第一次使用时（通常是启动预热）才创建，
+        # 导入模块时不访问磁盘，也不扫描图片目录
+        self._init_lock = threading.RLock()
+        self._converter: Optional[PlantUMLConverter] = None
+        self._image_catalog: Optional[ImageCatalog] = None
+        self._image_variants: Optional[ImageVariants] = None
+        self._render_cache: Optional[RenderCache] = None
+        self._daemon_pool: Optional[PlantUMLDaemonPool] = None
+        self._daemon_pool_checked = False
+        
+        # 渲染是阻塞操作，异步接口将其交给有界优先级调度器执行，避免阻塞事件循环
+        self.max_concurrency = max(1, max_concurrency)
+        self.scheduler = RenderScheduler(max_workers=self.max_concurrency, max_queue=max_queue)
+        # 正在渲染的代码批次，并发的相同批次共用一次渲染
+        self._inflight_renders: Dict[Tuple[str, ...], asyncio.Future] = {}
+    
+    @property
+    def converter(self) -> PlantUMLConverter:
+        """PlantUML 转换器（延迟创建）"""
+        if self._converter is None:
+            with self._init_lock:
+                if self._converter is None:
+                    self._converter = PlantUMLConverter(str(self.output_dir), render_timeout=PLANTUML_RENDER_TIMEOUT)
+        return self._converter
+    
+    @property
+    def image_catalog(self) -> ImageCatalog:
+        """图片目录索引（延迟创建），索引为空时从图片目录补录"""
+        if self._image_catalog is None:
+            with self._init_lock:
+                if self._image_catalog is None:
+                    image_catalog = ImageCatalog(str(self.output_dir))
+                    if image_catalog.is_empty():
+                        image_catalog.backfill_from_directory()
+                    self._image_catalog = image_catalog
+        return self._image_catalog
+    
+    @property
+    def image_variants(self) -> ImageVariants:
+        """缩略图（延迟创建）"""
+        if self._image_variants is None:
+            with self._init_lock:
+                if self._image_variants is None:
+                    self._image_variants = ImageVariants(str(self.output_dir))
+        return self._image_variants
+    
+    @property
+    def render_cache(self) -> RenderCache:
+        """渲染缓存（延迟创建）"""
+        if self._render_cache is None:
+            with self._init_lock:
+                if self._render_cache is None:
+                    self._render_cache = RenderCache(str(self.output_dir), max_bytes=RENDER_CACHE_MAX_BYTES)
+        return self._render_cache
+    
+    @property
+    def daemon_pool(self) -> Optional[PlantUMLDaemonPool]:
+        """常驻进程池（延迟创建），不可用时为 None，保留子进程方式作为回退"""
+        if not self._daemon_pool_checked:
+            with self._init_lock:
+                if not self._daemon_pool_checked:
+                    if self.backend == "daemon":
+                        pool = PlantUMLDaemonPool(
+                            size=PLANTUML_DAEMON_WORKERS,
+                            max_renders_per_worker=PLANTUML_DAEMON_MAX_RENDERS,
+                            render_timeout=PLANTUML_RENDER_TIMEOUT,
+                        )
+                        if pool.is_available():
+                            self._daemon_pool = pool
+                        else:
+                            print("⚠ PlantUML 常驻进程不可用，使用子进程模式渲染")
+                    self._daemon_pool_checked = True
+        return self._daemon_pool
+    
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        创建图片目录和索引（首次启动时补录已有图片），检查 PlantUML 是否可用并预热常驻进程，
+        由应用启动阶段在后台调用（阻塞）
+        
+        Returns:
+            {"installed": 是否安装, "backend": 实际使用的渲染方式}
+        """
+        self.image_catalog
+        self.image_variants
+        self.render_cache
+        installed = self.converter._check_plantuml_installation()
+        if installed and self.daemon_pool is not None:
+            try:
+                self.daemon_pool.prewarm()
+            except PlantUMLDaemonError as e:
+                print(f"⚠ PlantUML 常驻进程预热失败: {e}")
+        return {
+            "installed": installed,
+            "backend": "daemon" if self.daemon_pool is not None else "subprocess",
+        }
+    
+    def validate_plantuml_code(self, plantuml_code: str) -> Dict[str, Any]:
+        """
+        渲染前的纯 Python 预校验，关闭校验时只识别图表类型
+        
+        Args:
+            plantuml_code: 完整的 PlantUML 代码
+            
+        Returns:
+            {"valid": bool, "diagram_type": str, "errors": [{"line": 行号, "message": 说明}]}
+        """
+        if not self.validate:
+            return {"valid": True, "diagram_type": classify_diagram(plantuml_code), "errors": []}
+        return validate_plantuml(plantuml_code)
+    
+    def _cache_key(self, plantuml_code: str, format: str, diagram_type: str) -> str:
+        """渲染缓存键，图表类型作为渲染选项的一部分"""
+        return self.render_cache.make_key(plantuml_code, format, {"diagram_type": diagram_type})
+    
+    def _record_diagram(self, diagram_type: str, outcome: str):
+        """按图表类型统计渲染结果（rendered、cached、invalid、failed）"""
+        with self._stats_lock:
+            counters = self.diagram_stats.setdefault(diagram_type, {})
+            counters[outcome] = counters.get(outcome, 0) + 1
+    
+    def _render_many_bytes(self, plantuml_codes: List[str], format: str = "png") -> List[Optional[bytes]]:
+        """
+        使用当前渲染后端通过管道渲染多张图，常驻进程异常时回退到一次性管道进程
+        
+        Returns:
+            与输入一一对应的图片字节，失败的图对应 None
+        """
+        if self.daemon_pool is not None:
+            try:
+                return self.daemon_pool.render_many(plantuml_codes, format)
+            except PlantUMLDaemonError as e:
+                print(f"⚠ 常驻进程渲染失败，回退到子进程模式: {e}")
+        
+        return self.converter.render_many_to_bytes(plantuml_codes, format)
+    
+    def _convert_many(self, plantuml_codes: List[str], output_filenames: List[str], format: str = "png") -> List[Optional[str]]:
+        """
+        渲染多张图并原子写入输出目录，全程不创建临时 .puml 文件
+        
+        Returns:
+            与输入一一对应的图片文件路径，失败的图对应 None
+        """
+        images = self._render_many_bytes(plantuml_codes, format)
+        
+        paths = []
+        for image, output_filename in zip(images, output_filenames):
+            if image is None:
+                paths.append(None)
+                continue
+            output_path = self.output_dir / f"{output_filename}.{format}"
+            write_file_atomic(output_path, image)
+            paths.append(str(output_path))
+        return paths
+    
+    def render_image_bytes(self, plantuml_code: str, format: str = "png") -> Optional[bytes]:
+        """
+        渲染图片并直接返回字节，供 HTTP 响应使用；结果同样写入渲染缓存
+        
+        Args:
+            plantuml_code: 完整的 PlantUML 代码
+            format: 输出格式
+            
+        Returns:
+            图片字节，如果失败返回 None
+        """
+        validation = self.validate_plantuml_code(plantuml_code)
+        if not validation["valid"]:
+            self._record_diagram(validation["diagram_type"], "invalid")
+            return None
+        
+        image_path = self._render_to_cache(plantuml_code, format, validation["diagram_type"])
+        if image_path is None:
+            return None
+        try:
+            return Path(image_path).read_bytes()
+        except OSError:
+            return None
+    
+    def _render_to_cache(self, plantuml_code: str, format: str, diagram_type: str) -> Optional[str]:
+        """渲染单张图并登记到渲染缓存，已缓存时直接返回图片路径"""
+        cache_key = self._cache_key(plantuml_code, format, diagram_type)
+        with self.render_cache.key_lock(cache_key):
+            image_path = self.render_cache.get(cache_key)
+            if image_path:
+                return image_path
+            
+            image = self._render_many_bytes([plantuml_code], format)[0]
+            if image is None:
+                return None
+            output_path = self.output_dir / f"{self.render_cache.filename_for(cache_key)}.{format}"
+            write_file_atomic(output_path, image)
+            self.render_cache.put(cache_key, str(output_path), format)
+            self._schedule_optimization(str(output_path))
+            return str(output_path)
+    
+    def _schedule_optimization(self, image_path: str):
+        """新生成的 PNG 交给后台压缩，压缩完成前照常使用原文件"""
+        if self.png_optimizer is not None:
+            self.png_optimizer.submit(image_path)
+    
+    def _on_png_optimized(self, image_path: str, original_size: int, optimized_size: int):
+        """后台压缩替换文件后同步各索引中的大小"""
+        filename = Path(image_path).name
+        self.image_catalog.record_optimization(filename, original_size, optimized_size)
+        self.render_cache.update_size(filename, optimized_size)
+    
+    async def render_image_bytes_async(self,
+                                       plantuml_code: str,
+                                       format: str = "png",
+                                       priority: int = RenderPriority.BULK) -> Optional[bytes]:
+        """
+        render_image_bytes 的异步版本，由渲染调度器执行
+        
+        Raises:
+            RenderQueueFullError: 渲染队列已满
+        """
+        return await self._run_scheduled(priority, self.render_image_bytes, plantuml_code, format)
     
     def extract_plantuml_code(self, text: str) -> Optional[str]:
         """
@@ -34,72 +472,271 @@ class PlantUMLService:
             text: 包含 PlantUML 代码的文本
             
         Returns:
-            提取的 PlantUML 代码，如果没有找到则返回 None
+            提取的第一段 PlantUML 代码，如果没有找到则返回 None
         """
-        # 匹配 @startuml 和 @enduml 之间的内容
-        pattern = r'@startuml\s*(.*?)\s*@enduml'
-        match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-        
-        if match:
-            return f"@startuml\n{match.group(1).strip()}\n@enduml"
+        codes = self.extract_all_plantuml_codes(text)
+        return codes[0] if codes else None
+    
+    def extract_all_plantuml_codes(self, text: str) -> List[str]:
+        """
+        从文本中提取所有 PlantUML 代码块
         
-        return None
+        Args:
+            text: 包含 PlantUML 代码的文本
+            
+        Returns:
+            按出现顺序排列的 PlantUML 代码列表
+        """
+        # 匹配 @startuml 和 @enduml 之间的内容
+        return [
+            f"@startuml\n{match.group(1).strip()}\n@enduml"
+            for match in PLANTUML_BLOCK_PATTERN.finditer(text)
+        ]
     
     def process_llm_response(self, llm_response: str, userid: str = "default") -> Dict[str, Any]:
         """
-        处理大模型响应，提取 PlantUML 代码并转换为图片
+        处理大模型响应，提取第一段 PlantUML 代码并转换为图片
         
         Args:
             llm_response: 大模型的响应文本
-            userid: 用户ID，用于生成唯一文件名
+            userid: 用户ID
             
         Returns:
             包含处理结果的字典
         """
-        result = {
-            "original_response": llm_response,
+        return self.process_llm_response_all(llm_response, userid)[0]
+    
+    def process_llm_response_all(self, llm_response: str, userid: str = "default") -> List[Dict[str, Any]]:
+        """
+        处理大模型响应，提取所有 PlantUML 代码并在一次渲染调用中全部转换为图片
+        
+        Args:
+            llm_response: 大模型的响应文本
+            userid: 用户ID
+            
+        Returns:
+            每个代码块对应一个结果字典；没有找到代码时返回只含一个失败结果的列表
+        """
+        plantuml_codes = self.extract_all_plantuml_codes(llm_response)
+        
+        if not plantuml_codes:
+            result = self._empty_result()
+            result["error"] = "未在响应中找到 PlantUML 代码"
+            results = [result]
+        else:
+            results = self.render_plantuml_codes(plantuml_codes, userid)
+        
+        for result in results:
+            result["original_response"] = llm_response
+        return results
+    
+    def _empty_result(self) -> Dict[str, Any]:
+        """处理结果字典的初始值"""
+        return {
+            "original_response": None,
             "plantuml_code": None,
             "image_path": None,
             "image_url": None,
             "success": False,
+            "cached": False,
+            "diagram_type": None,
             "error": None
         }
+    
+    def render_plantuml_code(self, plantuml_code: str, userid: str = "default") -> Dict[str, Any]:
+        """
+        将已提取的 PlantUML 代码转换为图片
         
-        try:
-            # 提取 PlantUML 代码
-            plantuml_code = self.extract_plantuml_code(llm_response)
+        Args:
+            plantuml_code: 完整的 PlantUML 代码（包含 @startuml/@enduml）
+            userid: 用户ID
             
-            if not plantuml_code:
-                result["error"] = "未在响应中找到 PlantUML 代码"
-                return result
+        Returns:
+            包含处理结果的字典
+        """
+        return self.render_plantuml_codes([plantuml_code], userid)[0]
+    
+    def render_plantuml_codes(self, plantuml_codes: List[str], userid: str = "default") -> List[Dict[str, Any]]:
+        """
+        将多段 PlantUML 代码转换为图片，未命中缓存的图合并到一次渲染调用中
+        
+        Args:
+            plantuml_codes: 完整的 PlantUML 代码列表
+            userid: 用户ID
             
+        Returns:
+            与输入一一对应的结果字典列表
+        """
+        results = []
+        for index, plantuml_code in enumerate(plantuml_codes):
+            result = self._empty_result()
             result["plantuml_code"] = plantuml_code
+            result["index"] = index
+            results.append(result)
+        
+        try:
+            # 先做纯 Python 预校验，明显有错的代码不再交给 PlantUML
+            keys: List[Optional[str]] = []
+            for plantuml_code, result in zip(plantuml_codes, results):
+                validation = self.validate_plantuml_code(plantuml_code)
+                result["diagram_type"] = validation["diagram_type"]
+                if validation["valid"]:
+                    # 以图表内容作为缓存键，相同的图直接复用已生成的图片
+                    keys.append(self._cache_key(plantuml_code, "png", validation["diagram_type"]))
+                else:
+                    keys.append(None)
+                    result["error"] = f"PlantUML 语法错误: {format_validation_errors(validation['errors'])}"
+                    self._record_diagram(validation["diagram_type"], "invalid")
             
-            # 生成唯一的文件名
-            import hashlib
-            import time
-            code_hash = hashlib.md5(plantuml_code.encode()).hexdigest()[:8]
-            timestamp = int(time.time())
-            filename = f"uml_{userid}_{code_hash}_{timestamp}"
-            
-            # 转换为图片
-            image_path = self.converter.convert_to_image(
-                plantuml_code=plantuml_code,
-                output_filename=filename,
-                format="png"
-            )
+            code_by_key = {key: code for key, code in zip(keys, plantuml_codes) if key is not None}
+            image_paths: Dict[str, Optional[str]] = {}
+            cached_keys = set()
             
-            if image_path:
-                result["image_path"] = image_path
-                result["image_url"] = f"/api/v1/images/{Path(image_path).name}"
-                result["success"] = True
-            else:
-                result["error"] = "图片转换失败"
+            # 按固定顺序加锁，避免并发批次互相等待
+            with ExitStack() as stack:
+                for key in sorted(code_by_key):
+                    stack.enter_context(self.render_cache.key_lock(key))
+                
+                missing_keys = []
+                for key in code_by_key:
+                    image_paths[key] = self.render_cache.get(key)
+                    if image_paths[key]:
+                        cached_keys.add(key)
+                    else:
+                        missing_keys.append(key)
                 
+                if missing_keys:
+                    rendered = self._convert_many(
+                        [code_by_key[key] for key in missing_keys],
+                        [self.render_cache.filename_for(key) for key in missing_keys],
+                        "png"
+                    )
+                    for key, image_path in zip(missing_keys, rendered):
+                        image_paths[key] = image_path
+                        if image_path:
+                            self.render_cache.put(key, image_path, "png")
+                            self._schedule_optimization(image_path)
+            
+            for key, result in zip(keys, results):
+                if key is None:
+                    continue
+                image_path = image_paths.get(key)
+                if image_path:
+                    result["image_path"] = image_path
+                    result["image_url"] = f"/api/v1/images/{Path(image_path).name}"
+                    result["success"] = True
+                    result["cached"] = key in cached_keys
+                    self._record_diagram(result["diagram_type"], "cached" if result["cached"] else "rendered")
+                    self.image_catalog.record(
+                        Path(image_path).name,
+                        userid,
+                        os.path.getsize(image_path),
+                        result["diagram_type"],
+                        source=code_by_key[key]
+                    )
+                else:
+                    result["error"] = "图片转换失败"
+                    self._record_diagram(result["diagram_type"], "failed")
+                    
         except Exception as e:
-            result["error"] = f"处理过程中发生错误: {str(e)}"
+            for result in results:
+                result["error"] = f"处理过程中发生错误: {str(e)}"
         
-        return result
+        return results
+    
+    async def _run_scheduled(self, priority: int, fn: Callable, *args):
+        """将阻塞的渲染函数交给调度器执行并等待结果"""
+        return await asyncio.wrap_future(self.scheduler.submit(priority, fn, *args))
+    
+    async def process_llm_response_async(self,
+                                         llm_response: str,
+                                         userid: str = "default",
+                                         priority: int = RenderPriority.INTERACTIVE) -> Dict[str, Any]:
+        """
+        process_llm_response 的异步版本，由渲染调度器执行，不阻塞事件循环
+        
+        Args:
+            llm_response: 大模型的响应文本
+            userid: 用户ID
+            priority: 渲染优先级
+            
+        Returns:
+            包含处理结果的字典
+            
+        Raises:
+            RenderQueueFullError: 渲染队列已满
+        """
+        return await self._run_scheduled(priority, self.process_llm_response, llm_response, userid)
+    
+    async def process_llm_response_all_async(self,
+                                             llm_response: str,
+                                             userid: str = "default",
+                                             priority: int = RenderPriority.INTERACTIVE) -> List[Dict[str, Any]]:
+        """
+        process_llm_response_all 的异步版本，由渲染调度器执行
+        
+        Args:
+            llm_response: 大模型的响应文本
+            userid: 用户ID
+            priority: 渲染优先级
+            
+        Returns:
+            每个代码块对应一个结果字典
+            
+        Raises:
+            RenderQueueFullError: 渲染队列已满
+        """
+        return await self._run_scheduled(priority, self.process_llm_response_all, llm_response, userid)
+    
+    async def render_plantuml_codes_async(self,
+                                          plantuml_codes: List[str],
+                                          userid: str = "default",
+                                          priority: int = RenderPriority.INTERACTIVE) -> List[Dict[str, Any]]:
+        """
+        render_plantuml_codes 的异步版本，由渲染调度器执行
+        
+        Args:
+            plantuml_codes: 完整的 PlantUML 代码列表
+            userid: 用户ID
+            priority: 渲染优先级
+            
+        Returns:
+            与输入一一对应的结果字典列表
+            
+        Raises:
+            RenderQueueFullError: 渲染队列已满
+        """
+        batch = tuple(plantuml_codes)
+        leader = self._inflight_renders.get(batch)
+        if leader is not None:
+            # 相同的代码批次正在渲染（如多个用户同时提交同一请求），等待它的结果
+            results = await asyncio.shield(leader)
+            return await asyncio.to_thread(self._share_results, results, userid)
+        
+        leader = asyncio.ensure_future(
+            self._run_scheduled(priority, self.render_plantuml_codes, plantuml_codes, userid)
+        )
+        self._inflight_renders[batch] = leader
+        leader.add_done_callback(lambda _: self._inflight_renders.pop(batch, None))
+        return await asyncio.shield(leader)
+    
+    def _share_results(self, results: List[Dict[str, Any]], userid: str) -> List[Dict[str, Any]]:
+        """复用其他请求的渲染结果，并为当前用户登记图片"""
+        shared = []
+        for result in results:
+            result = dict(result)
+            if result["success"]:
+                result["cached"] = True
+                self._record_diagram(result["diagram_type"], "cached")
+                self.image_catalog.record(
+                    Path(result["image_path"]).name,
+                    userid,
+                    os.path.getsize(result["image_path"]),
+                    result["diagram_type"],
+                    source=result["plantuml_code"]
+                )
+            shared.append(result)
+        return shared
     
     def get_image_url(self, image_path: str) -> str:
         """
@@ -117,28 +754,108 @@ class PlantUMLService:
         filename = Path(image_path).name
         return f"/api/v1/images/{filename}"
     
-    def list_generated_images(self) -> list:
+    def get_image_variant(self, filename: str, size: str) -> Optional[str]:
         """
-        列出所有生成的图片
+        获取图片的其他尺寸或格式
         
+        Args:
+            filename: 原图文件名
+            size: thumb / medium 为缩小的 PNG，svg 为矢量版本，其他值返回原图
+            
         Returns:
-            图片文件列表
+            图片路径，不存在或无法生成时返回 None
+        """
+        if size == "svg":
+            source = self.image_catalog.get_source(filename)
+            if source is None:
+                return None
+            plantuml_code, diagram_type = source
+            return self._render_to_cache(plantuml_code, "svg", diagram_type or classify_diagram(plantuml_code))
+        
+        image_path = self.image_variants.get_path(filename, size)
+        return str(image_path) if image_path else None
+    
+    async def get_image_variant_async(self,
+                                      filename: str,
+                                      size: str,
+                                      priority: int = RenderPriority.BULK) -> Optional[str]:
         """
-        if not self.output_dir.exists():
-            return []
+        get_image_variant 的异步版本，缩放和 SVG 渲染都交给渲染调度器执行
         
-        image_files = []
-        for file_path in self.output_dir.glob("*.png"):
-            image_files.append({
-                "filename": file_path.name,
-                "path": str(file_path),
-                "url": self.get_image_url(str(file_path)),
-                "size": file_path.stat().st_size,
-                "created_time": file_path.stat().st_ctime
-            })
+        Raises:
+            RenderQueueFullError: 渲染队列已满
+        """
+        return await self._run_scheduled(priority, self.get_image_variant, filename, size)
+    
+    def forget_image(self, filename: str):
+        """
+        图片文件被清理后移除图片目录、缩略图和渲染缓存中的记录
         
-        return sorted(image_files, key=lambda x: x["created_time"], reverse=True)
+        Args:
+            filename: 图片文件名
+        """
+        self.image_catalog.remove_file(filename)
+        self.image_variants.remove(filename)
+        self.render_cache.discard(filename)
+    
+    def list_generated_images(self,
+                              userid: Optional[str] = None,
+                              start_time: Optional[float] = None,
+                              end_time: Optional[float] = None,
+                              cursor: Optional[str] = None,
+                              limit: int = 50) -> Dict[str, Any]:
+        """
+        分页列出生成的图片，只查询图片目录索引，不扫描文件系统
+        
+        Args:
+            userid: 只列出该用户的图片
+            start_time: 生成时间下限（时间戳）
+            end_time: 生成时间上限（时间戳）
+            cursor: 上一页返回的 next_cursor
+            limit: 每页条数
+            
+        Returns:
+            {"images": 图片列表, "total": 总数, "next_cursor": 下一页游标}
+        """
+        return self.image_catalog.list_images(
+            userid=userid,
+            start_time=start_time,
+            end_time=end_time,
+            cursor=cursor,
+            limit=limit
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取渲染相关的统计信息
+        
+        Returns:
+            缓存与渲染后端的统计字典
+        """
+        return {
+            "backend": "daemon" if self.daemon_pool is not None else "subprocess",
+            "scheduler": self.scheduler.get_stats(),
+            "diagram_types": self.diagram_stats,
+            "render_cache": self.render_cache.get_stats(),
+            "png_optimizer": {
+                "enabled": self.png_optimizer is not None,
+                **(self.png_optimizer.get_stats() if self.png_optimizer is not None else {}),
+                "total": self.image_catalog.get_optimization_stats(),
+            },
+            "variants": {
+                "available": self.image_variants.is_available(),
+                "generated": self.image_variants.generated,
+            },
+            "daemon": self.daemon_pool.get_stats() if self.daemon_pool is not None else None,
+        }
 
 
 # 全局服务实例
-plantuml_service = PlantUMLService() 
\ No newline at end of file
+plantuml_service = PlantUMLService(
+    backend=PLANTUML_RENDER_BACKEND,
+    max_concurrency=PLANTUML_RENDER_CONCURRENCY,
+    max_queue=PLANTUML_RENDER_QUEUE_SIZE,
+    validate=PLANTUML_VALIDATION_ENABLED,
+    optimize_png=PNG_OPTIMIZE_ENABLED,
+    optimize_workers=PNG_OPTIMIZE_WORKERS
+) 
\ No newline at end of file
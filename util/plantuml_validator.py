@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PlantUML 预校验
+在启动 PlantUML 之前用纯 Python 检查明显的语法问题（块不配对、未知指令、
+未闭合的大括号/引号），并识别图表类型，避免把注定失败的代码交给 JVM
+只检查可以确定是错误的情况，拿不准的写法一律放行交给 PlantUML 判断
+"""
+
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# 已知的 @ 指令
+KNOWN_AT_DIRECTIVES = {"@startuml", "@enduml"}
+
+# 已知的预处理指令
+KNOWN_PREPROCESSOR_DIRECTIVES = {
+    "!include", "!include_many", "!include_once", "!includeurl", "!includesub", "!includedef",
+    "!import", "!define", "!definelong", "!enddefinelong", "!undef",
+    "!if", "!ifdef", "!ifndef", "!elseif", "!else", "!endif",
+    "!while", "!endwhile", "!foreach", "!endfor",
+    "!procedure", "!endprocedure", "!function", "!endfunction", "!unquoted", "!final", "!return",
+    "!startsub", "!endsub", "!local", "!global",
+    "!theme", "!pragma", "!log", "!dump_memory", "!assert", "!exit", "!option",
+}
+
+# 大括号块中不再识别关键字的声明（类成员可能以 loop、group 等词开头）
+BODY_DECLARATION_PATTERN = re.compile(
+    r'^(abstract\s+class|abstract|class|interface|enum|annotation|entity|struct|object|map|json|protocol|exception|metaclass|stereotype|dataclass|record)\b',
+    re.IGNORECASE
+)
+
+# (开始块的正则, 块名称, 结束块的正则)
+BLOCK_RULES: List[Tuple["re.Pattern", str, "re.Pattern"]] = [
+    (re.compile(r'^(alt|opt|loop|par|par2|break|critical|group)\b(?!\s*\()', re.IGNORECASE), "分组", re.compile(r'^end$', re.IGNORECASE)),
+    (re.compile(r'^box\b', re.IGNORECASE), "box", re.compile(r'^end\s*box$', re.IGNORECASE)),
+    (re.compile(r'^if\s*[("]', re.IGNORECASE), "if", re.compile(r'^end\s*if\b', re.IGNORECASE)),
+    (re.compile(r'^while\s*\(', re.IGNORECASE), "while", re.compile(r'^end\s*while\b', re.IGNORECASE)),
+    (re.compile(r'^repeat\b(?!\s*while)', re.IGNORECASE), "repeat", re.compile(r'^repeat\s*while\b', re.IGNORECASE)),
+    (re.compile(r'^switch\s*\(', re.IGNORECASE), "switch", re.compile(r'^end\s*switch\b', re.IGNORECASE)),
+    (re.compile(r'^fork$', re.IGNORECASE), "fork", re.compile(r'^end\s*(fork|merge)\b', re.IGNORECASE)),
+    (re.compile(r'^split$', re.IGNORECASE), "split", re.compile(r'^end\s*split\b', re.IGNORECASE)),
+    (re.compile(r'^!(if|ifdef|ifndef)\b', re.IGNORECASE), "!if", re.compile(r'^!endif\b', re.IGNORECASE)),
+    (re.compile(r'^!while\b', re.IGNORECASE), "!while", re.compile(r'^!endwhile\b', re.IGNORECASE)),
+    (re.compile(r'^!foreach\b', re.IGNORECASE), "!foreach", re.compile(r'^!endfor\b', re.IGNORECASE)),
+    (re.compile(r'^!(unquoted\s+|final\s+)*procedure\b', re.IGNORECASE), "!procedure", re.compile(r'^!endprocedure\b', re.IGNORECASE)),
+    (re.compile(r'^!(unquoted\s+|final\s+)*function\b', re.IGNORECASE), "!function", re.compile(r'^!endfunction\b', re.IGNORECASE)),
+    (re.compile(r'^!definelong\b', re.IGNORECASE), "!definelong", re.compile(r'^!enddefinelong\b', re.IGNORECASE)),
+    (re.compile(r'^!startsub\b', re.IGNORECASE), "!startsub", re.compile(r'^!endsub\b', re.IGNORECASE)),
+]
+
+# 多行文本块：块内内容是自由文本，不做任何检查
+TEXT_BLOCK_RULES: List[Tuple["re.Pattern", "re.Pattern"]] = [
+    (re.compile(r'^[hr]?note\b[^:"]*$', re.IGNORECASE), re.compile(r'^end\s*[hr]?note$', re.IGNORECASE)),
+    (re.compile(r'^ref\s+over\b[^:]*$', re.IGNORECASE), re.compile(r'^end\s*ref$', re.IGNORECASE)),
+    (re.compile(r'^legend\b[^:]*$', re.IGNORECASE), re.compile(r'^end\s*legend$', re.IGNORECASE)),
+    (re.compile(r'^(header|center\s+header|left\s+header|right\s+header)$', re.IGNORECASE), re.compile(r'^end\s*header$', re.IGNORECASE)),
+    (re.compile(r'^(footer|center\s+footer|left\s+footer|right\s+footer)$', re.IGNORECASE), re.compile(r'^end\s*footer$', re.IGNORECASE)),
+    (re.compile(r'^title$', re.IGNORECASE), re.compile(r'^end\s*title$', re.IGNORECASE)),
+    # 跨多行的活动动作 :第一行 ... 最后一行;
+    (re.compile(r'^:(?!.*[;|<>/\]}]$)'), re.compile(r'.*[;|<>/\]}]$')),
+]
+
+# 图表类型识别特征：(类型, 特征正则, 权重)
+DIAGRAM_TYPE_SIGNALS: List[Tuple[str, "re.Pattern", int]] = [
+    ("class", re.compile(r'^(abstract\s+class|class|interface|enum|annotation)\b', re.IGNORECASE), 3),
+    ("class", re.compile(r'<\|--|--\|>|<\|\.\.|\.\.\|>|\*--|--\*|o--|--o'), 2),
+    ("sequence", re.compile(r'^(participant|boundary|control|collections|queue)\b', re.IGNORECASE), 3),
+    ("sequence", re.compile(r'^(activate|deactivate|autonumber|alt|opt|loop|par|ref\s+over|return)\b', re.IGNORECASE), 3),
+    ("sequence", re.compile(r'^[\w"]+\s*<?-{1,2}>{1,2}\s*[\w"]+\s*:'), 1),
+    ("usecase", re.compile(r'^usecase\b', re.IGNORECASE), 3),
+    ("usecase", re.compile(r'^\([^)]+\)|--\s*\([^)]+\)|-->\s*\([^)]+\)'), 2),
+    ("usecase", re.compile(r'^actor\b', re.IGNORECASE), 1),
+    ("activity", re.compile(r'^(start|stop|end|kill|detach)$', re.IGNORECASE), 3),
+    ("activity", re.compile(r'^:.*[;|<>/\]}]$'), 2),
+    ("activity", re.compile(r'^(if\s*\(|while\s*\(|repeat\b|fork$|partition\b|switch\s*\()', re.IGNORECASE), 2),
+    ("activity", re.compile(r'^\|[^|]+\|'), 1),
+    ("state", re.compile(r'^state\b', re.IGNORECASE), 3),
+    ("state", re.compile(r'\[\*\]'), 3),
+    ("component", re.compile(r'^(component|port|portin|portout)\b', re.IGNORECASE), 3),
+    ("component", re.compile(r'^\[[^\]]+\]'), 2),
+    ("deployment", re.compile(r'^(node|artifact|cloud|frame|storage|folder|file|database|card|stack)\b', re.IGNORECASE), 2),
+    ("object", re.compile(r'^(object|map)\b', re.IGNORECASE), 3),
+    ("timing", re.compile(r'^(robust|concise|clock|binary)\b', re.IGNORECASE), 3),
+]
+
+DIAGRAM_TYPES = ["class", "sequence", "usecase", "activity", "state", "component", "deployment", "object", "timing"]
+
+
+def _strip_comment(line: str) -> str:
+    """去掉单引号开头的整行注释"""
+    return "" if line.startswith("'") else line
+
+
+def _unclosed_quote(line: str) -> bool:
+    """
+    检查声明部分是否有未闭合的双引号
+    冒号之后是标签文本（消息、描述），其中的引号不做要求
+    """
+    in_quote = False
+    for char in line:
+        if char == '"':
+            in_quote = not in_quote
+        elif char == ':' and not in_quote:
+            break
+    return in_quote
+
+
+def classify_diagram(plantuml_code: str) -> str:
+    """
+    识别图表类型
+
+    Args:
+        plantuml_code: PlantUML 代码
+
+    Returns:
+        class、sequence、usecase 等，无法识别时返回 unknown
+    """
+    scores = {diagram_type: 0 for diagram_type in DIAGRAM_TYPES}
+    for raw_line in plantuml_code.splitlines():
+        line = _strip_comment(raw_line.strip())
+        if not line or line.startswith("@") or line.startswith("!"):
+            continue
+        for diagram_type, pattern, weight in DIAGRAM_TYPE_SIGNALS:
+            if pattern.search(line):
+                scores[diagram_type] += weight
+
+    best = max(DIAGRAM_TYPES, key=lambda diagram_type: scores[diagram_type])
+    return best if scores[best] > 0 else "unknown"
+
+
+def validate_plantuml(plantuml_code: str) -> Dict[str, Any]:
+    """
+    预校验 PlantUML 代码
+
+    Args:
+        plantuml_code: 完整的 PlantUML 代码（包含 @startuml/@enduml）
+
+    Returns:
+        {"valid": bool, "diagram_type": str, "errors": [{"line": 行号, "message": 说明}]}
+        行号从 1 开始，以 @startuml 所在行为第 1 行
+    """
+    errors: List[Dict[str, Any]] = []
+    lines = plantuml_code.splitlines()
+
+    def error(line_no: int, message: str):
+        errors.append({"line": line_no, "message": message})
+
+    # (块名称, 结束正则, 开始行号)
+    block_stack: List[Tuple[str, Optional["re.Pattern"], int]] = []
+    # (开始行号, 是否为类成员体)
+    brace_stack: List[Tuple[int, bool]] = []
+    text_block_end: Optional["re.Pattern"] = None
+    text_block_start = 0
+    in_block_comment = False
+    started = ended = False
+
+    for line_no, raw_line in enumerate(lines, start=1):
+        line = raw_line.strip()
+
+        # 多行注释 /' ... '/
+        if in_block_comment:
+            if "'/" in line:
+                in_block_comment = False
+            continue
+        if line.startswith("/'"):
+            in_block_comment = "'/" not in line[2:]
+            continue
+
+        line = _strip_comment(line)
+        if not line:
+            continue
+
+        # 多行注释、图例等文本块内部是自由文本
+        if text_block_end is not None:
+            if text_block_end.match(line):
+                text_block_end = None
+            continue
+
+        lowered = line.lower()
+
+        if line.startswith("@"):
+            directive = lowered.split()[0]
+            if directive not in KNOWN_AT_DIRECTIVES:
+                error(line_no, f"未知的指令 {line.split()[0]}")
+            elif directive == "@startuml":
+                if started:
+                    error(line_no, "@startuml 重复出现，缺少对应的 @enduml")
+                started = True
+            elif directive == "@enduml":
+                if not started:
+                    error(line_no, "@enduml 之前缺少 @startuml")
+                ended = True
+            continue
+
+        if ended:
+            error(line_no, "@enduml 之后还有内容")
+            break
+
+        if line.startswith("!") and not line.startswith("!$"):
+            directive = re.match(r'!\w+', lowered)
+            if directive is None or directive.group(0) not in KNOWN_PREPROCESSOR_DIRECTIVES:
+                error(line_no, f"未知的预处理指令 {line.split()[0]}")
+                continue
+
+        in_body = bool(brace_stack) and brace_stack[-1][1]
+
+        if not in_body:
+            for start_pattern, end_pattern in TEXT_BLOCK_RULES:
+                if start_pattern.match(line):
+                    text_block_end = end_pattern
+                    text_block_start = line_no
+                    break
+            if text_block_end is not None:
+                continue
+
+            # 块结束
+            closed = False
+            for _, name, end_pattern in BLOCK_RULES:
+                if end_pattern.match(line):
+                    if block_stack and block_stack[-1][0] == name:
+                        block_stack.pop()
+                    elif any(entry[0] == name for entry in block_stack):
+                        open_name, _, open_line = block_stack[-1]
+                        error(open_line, f"{open_name} 块没有结束（第{line_no}行先结束了外层的 {name} 块）")
+                        while block_stack and block_stack[-1][0] != name:
+                            block_stack.pop()
+                        block_stack.pop()
+                    elif name != "分组":
+                        # 单独的 end 在活动图中是结束节点，不算错误
+                        error(line_no, f"“{line}” 没有对应的 {name} 开始语句")
+                    closed = True
+                    break
+            if closed:
+                continue
+
+            # 块开始
+            for start_pattern, name, end_pattern in BLOCK_RULES:
+                if start_pattern.match(line):
+                    block_stack.append((name, end_pattern, line_no))
+                    break
+
+            # 活动图中的动作文本和消息标签可能包含任意字符，不检查引号
+            if not line.startswith(":") and _unclosed_quote(line):
+                error(line_no, "双引号没有闭合")
+
+        # 大括号块：只识别行尾的 { 和行首的 }，行内的 {static} 等修饰不计入
+        if line.startswith("}"):
+            if brace_stack:
+                brace_stack.pop()
+            else:
+                error(line_no, "多余的 }")
+        if line.endswith("{") and not line.startswith("}"):
+            brace_stack.append((line_no, bool(BODY_DECLARATION_PATTERN.match(line))))
+        elif line.endswith("{") and line.startswith("}") and len(line) > 1:
+            # 形如 "} else {" 的写法
+            brace_stack.append((line_no, False))
+
+    if text_block_end is not None:
+        error(text_block_start, "多行文本块没有结束")
+    for name, _, open_line in block_stack:
+        error(open_line, f"{name} 块没有结束")
+    for open_line, _ in brace_stack:
+        error(open_line, "{ 没有对应的 }")
+    if not started:
+        error(1, "缺少 @startuml")
+    elif not ended:
+        error(len(lines), "缺少 @enduml")
+
+    errors.sort(key=lambda item: item["line"])
+    return {
+        "valid": not errors,
+        "diagram_type": classify_diagram(plantuml_code),
+        "errors": errors,
+    }
+
+
+def format_validation_errors(errors: List[Dict[str, Any]]) -> str:
+    """将错误列表格式化为带行号的提示文本"""
+    return "；".join(f"第{item['line']}行: {item['message']}" for item in errors)
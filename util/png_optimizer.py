@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PNG 无损压缩
+PlantUML 输出的 PNG 压缩率不高，渲染完成后在后台重新压缩并原子替换文件，
+替换前一直使用未压缩的原文件，不会拖慢首次响应
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, List, Tuple
+from .plantuml_converter import write_file_atomic
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 优先使用的外部工具及参数（都只做无损优化，保留文本块）
+EXTERNAL_TOOLS: List[Tuple[str, List[str]]] = [
+    ("oxipng", ["-o", "2", "--strip", "none", "-q"]),
+    ("optipng", ["-o2", "-quiet"]),
+]
+
+
+def _iter_chunks(data: bytes):
+    """逐个解析 PNG 数据块，返回 (类型, 数据)"""
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        chunk_data = data[offset + 8:offset + 8 + length]
+        if len(chunk_data) != length:
+            raise ValueError("PNG 数据块被截断")
+        yield chunk_type, chunk_data
+        offset += 12 + length
+        if chunk_type == b"IEND":
+            return
+    raise ValueError("PNG 缺少 IEND")
+
+
+def _make_chunk(chunk_type: bytes, chunk_data: bytes) -> bytes:
+    crc = zlib.crc32(chunk_type + chunk_data) & 0xffffffff
+    return struct.pack(">I", len(chunk_data)) + chunk_type + chunk_data + struct.pack(">I", crc)
+
+
+def recompress_png(data: bytes) -> bytes:
+    """
+    用最高压缩级别重新压缩 IDAT 数据，像素与其他数据块保持不变
+
+    Args:
+        data: 原 PNG 字节
+
+    Returns:
+        重新压缩后的 PNG 字节；没有变小时返回原数据
+
+    Raises:
+        ValueError: 不是有效的 PNG
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("不是 PNG 文件")
+
+    chunks = list(_iter_chunks(data))
+    raw = zlib.decompress(b"".join(chunk_data for chunk_type, chunk_data in chunks if chunk_type == b"IDAT"))
+
+    best: Optional[bytes] = None
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidate = compressor.compress(raw) + compressor.flush()
+        if best is None or len(candidate) < len(best):
+            best = candidate
+
+    output = [PNG_SIGNATURE]
+    idat_written = False
+    for chunk_type, chunk_data in chunks:
+        if chunk_type == b"IDAT":
+            # 多个 IDAT 合并为一个
+            if not idat_written:
+                output.append(_make_chunk(b"IDAT", best))
+                idat_written = True
+            continue
+        output.append(_make_chunk(chunk_type, chunk_data))
+
+    optimized = b"".join(output)
+    return optimized if len(optimized) < len(data) else data
+
+
+class PNGOptimizer:
+    """后台 PNG 无损压缩工作池"""
+
+    def __init__(self,
+                 max_workers: int = 1,
+                 on_optimized: Optional[Callable[[str, int, int], None]] = None):
+        """
+        初始化
+
+        Args:
+            max_workers: 后台压缩线程数
+            on_optimized: 文件被替换后的回调，参数为 (路径, 原大小, 新大小)
+        """
+        self.max_workers = max(1, max_workers)
+        self.on_optimized = on_optimized
+        self.tool = next(((name, args) for name, args in EXTERNAL_TOOLS if shutil.which(name)), None)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="png-optimize")
+        self._lock = threading.Lock()
+        self._pending = set()
+
+        self.optimized = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def submit(self, image_path: str):
+        """加入后台压缩队列，立即返回；同一文件排队中时不重复提交"""
+        if not image_path.lower().endswith(".png"):
+            return
+        with self._lock:
+            if image_path in self._pending:
+                return
+            self._pending.add(image_path)
+        self._executor.submit(self._optimize, image_path)
+
+    def _optimize_bytes(self, data: bytes) -> bytes:
+        if self.tool is None:
+            return recompress_png(data)
+
+        name, args = self.tool
+        with tempfile.TemporaryDirectory(prefix="png-optimize-") as temp_dir:
+            temp_path = Path(temp_dir) / "image.png"
+            temp_path.write_bytes(data)
+            subprocess.run([name, *args, str(temp_path)], check=True, capture_output=True, timeout=60)
+            optimized = temp_path.read_bytes()
+        return optimized if len(optimized) < len(data) else data
+
+    def _optimize(self, image_path: str):
+        try:
+            path = Path(image_path)
+            before_stat = path.stat()
+            data = path.read_bytes()
+            optimized = self._optimize_bytes(data)
+
+            if len(optimized) >= len(data):
+                with self._lock:
+                    self.skipped += 1
+                return
+
+            # 压缩期间文件被替换过（例如重新渲染）则放弃本次结果
+            current_stat = path.stat()
+            if (current_stat.st_mtime_ns, current_stat.st_size) != (before_stat.st_mtime_ns, before_stat.st_size):
+                with self._lock:
+                    self.skipped += 1
+                return
+
+            write_file_atomic(path, optimized)
+            # 保留原来的时间戳，生成时间和访问顺序不受影响
+            os.utime(path, ns=(before_stat.st_atime_ns, before_stat.st_mtime_ns))
+
+            with self._lock:
+                self.optimized += 1
+                self.bytes_before += len(data)
+                self.bytes_after += len(optimized)
+            if self.on_optimized is not None:
+                self.on_optimized(image_path, len(data), len(optimized))
+        except FileNotFoundError:
+            with self._lock:
+                self.skipped += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"⚠ PNG 压缩失败: {image_path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(image_path)
+
+    def shutdown(self):
+        """停止接收新任务"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """压缩统计信息"""
+        with self._lock:
+            return {
+                "tool": self.tool[0] if self.tool else "zlib",
+                "pending": len(self._pending),
+                "optimized": self.optimized,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after,
+                "bytes_saved": self.bytes_before - self.bytes_after,
+            }
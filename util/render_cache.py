@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PlantUML 渲染结果缓存
+以规范化后的图表源码 + 输出格式 + 渲染选项的哈希作为键，
+相同的图表直接复用已生成的图片，不再启动 PlantUML。
+缓存只管理索引，不删除图片文件：图片可能仍被已保存的对话引用，统一由图片清理服务删除
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import weakref
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+
+class RenderCache:
+    """基于磁盘索引的内容寻址渲染缓存，索引的图片超出容量时按最近访问时间淘汰索引记录"""
+
+    def __init__(self,
+                 output_dir: str = "workspace/img",
+                 max_bytes: int = 1024 * 1024 * 1024,
+                 index_path: Optional[str] = None):
+        """
+        初始化缓存
+
+        Args:
+            output_dir: 图片所在目录
+            max_bytes: 索引中图片的总大小上限（字节），超出后淘汰的记录不再命中，图片文件保留
+            index_path: SQLite 索引文件路径，默认放在 output_dir 下
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = Path(index_path) if index_path else self.output_dir / ".render_cache.sqlite3"
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._key_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS render_cache (
+                key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                format TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_render_cache_last_access ON render_cache(last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_source(plantuml_code: str) -> str:
+        """
+        规范化图表源码：统一换行符、去掉行尾空白和首尾空行
+        只做不影响渲染结果的变换
+        """
+        text = plantuml_code.replace("\r\n", "\n").replace("\r", "\n")
+        lines = [line.rstrip() for line in text.split("\n")]
+        return "\n".join(lines).strip("\n")
+
+    def make_key(self, plantuml_code: str, format: str = "png", options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        计算缓存键
+
+        Args:
+            plantuml_code: PlantUML 代码
+            format: 输出格式
+            options: 其他影响渲染结果的选项
+
+        Returns:
+            sha256 十六进制字符串
+        """
+        payload = json.dumps({
+            "source": self.normalize_source(plantuml_code),
+            "format": format,
+            "options": options or {},
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def filename_for(key: str) -> str:
+        """缓存键对应的输出文件名（不包含扩展名）"""
+        return f"uml_{key[:32]}"
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """同一个键的渲染互斥锁，避免并发请求重复渲染同一张图"""
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._key_locks[key] = lock
+            return lock
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查找缓存
+
+        Returns:
+            命中时返回图片路径，否则返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM render_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None:
+                image_path = self.output_dir / row[0]
+                if self._touch(image_path):
+                    self._conn.execute(
+                        "UPDATE render_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                        (time.time(), key)
+                    )
+                    self._conn.commit()
+                    self.hits += 1
+                    return str(image_path)
+
+                # 文件已被外部删除，索引失效
+                self._conn.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+                self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    @staticmethod
+    def _touch(image_path: Path) -> bool:
+        """
+        把命中的图片的访问时间更新为现在，图片清理服务按访问时间判断保护期和淘汰顺序，
+        不会删除刚出现在新回复中的图片；修改时间保持不变（缩略图和 Last-Modified 依赖它）
+
+        Returns:
+            图片文件是否存在
+        """
+        try:
+            stat = image_path.stat()
+            os.utime(image_path, (time.time(), stat.st_mtime))
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return True
+
+    def put(self, key: str, image_path: str, format: str = "png"):
+        """
+        登记新生成的图片，并在超出容量时淘汰最久未访问的索引记录
+
+        Args:
+            key: 缓存键
+            image_path: 图片路径
+            format: 输出格式
+        """
+        path = Path(image_path)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO render_cache (key, filename, format, size, created_at, last_access, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                """,
+                (key, path.name, format, size, now, now)
+            )
+            self._conn.commit()
+            self._evict(keep_key=key)
+
+    def _evict(self, keep_key: Optional[str] = None):
+        """
+        按最近访问时间淘汰索引记录，直到总大小回到上限以内（调用方持有锁）
+        只删除记录不删除文件，图片是否可以删除由图片清理服务根据对话引用判断
+        """
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM render_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM render_cache ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            if key == keep_key:
+                continue
+            self._conn.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._conn.commit()
+
+    def update_size(self, filename: str, size: int):
+        """图片文件被原地替换（如无损压缩）后更新记录的大小"""
+        with self._lock:
+            self._conn.execute("UPDATE render_cache SET size = ? WHERE filename = ?", (size, filename))
+            self._conn.commit()
+
+    def discard(self, filename: str):
+        """图片文件已被外部删除时移除对应的索引"""
+        with self._lock:
+            self._conn.execute("DELETE FROM render_cache WHERE filename = ?", (filename,))
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM render_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片保留策略与垃圾回收
+按总大小和闲置时长两个预算清理 workspace/img 与 workspace/upload_img，
+超出预算时按最近访问时间淘汰；仍被对话消息引用的图片不会被删除
+"""
+
+import os
+import time
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set, Callable
+
+from config import (
+    RETENTION_DRY_RUN,
+    RETENTION_MAX_BYTES,
+    RETENTION_MAX_AGE_DAYS,
+    RETENTION_GRACE_SECONDS,
+    RETENTION_INTERVAL_SECONDS,
+    RETENTION_BATCH_SIZE,
+)
+
+
+class RetentionService:
+    """后台增量清理图片目录"""
+
+    # 访问时间的最小更新间隔，避免每次读取图片都写一次文件元数据
+    TOUCH_INTERVAL = 60
+
+    def __init__(self,
+                 directories: Dict[str, str],
+                 max_bytes: int = 5 * 1024 * 1024 * 1024,
+                 max_age_days: float = 30,
+                 grace_seconds: float = 3600,
+                 interval: float = 600,
+                 batch_size: int = 100,
+                 dry_run: bool = False):
+        """
+        初始化清理服务
+
+        Args:
+            directories: 名称 -> 目录路径，例如 {"img": "workspace/img"}
+            max_bytes: 所有目录的图片总大小上限（字节），0 表示不限制
+            max_age_days: 超过多少天未被访问的图片会被清理，0 表示不限制
+            grace_seconds: 新生成或最近被访问的文件的保护期，期间内不会被清理
+                （图片可能刚出现在新的回复中，对话还没保存）
+            interval: 两次清理之间的间隔（秒）
+            batch_size: 每批删除的文件数，批与批之间会让出 CPU 和磁盘
+            dry_run: 只生成报告，不删除文件
+        """
+        self.directories = {name: Path(path) for name, path in directories.items()}
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.grace_seconds = grace_seconds
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+
+        self._reference_provider: Optional[Callable[[], Set[str]]] = None
+        self._delete_hooks: Dict[str, List[Callable[[str], None]]] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._run_lock = threading.Lock()
+
+        self.runs = 0
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    def set_reference_provider(self, provider: Callable[[], Set[str]]):
+        """设置返回“仍被引用的文件名集合”的函数"""
+        self._reference_provider = provider
+
+    def add_delete_hook(self, directory: str, hook: Callable[[str], None]):
+        """文件被删除后调用 hook(filename)，用于同步清理索引"""
+        self._delete_hooks.setdefault(directory, []).append(hook)
+
+    def touch(self, path: str):
+        """
+        记录一次访问，把访问时间写入文件的 atime
+        不依赖文件系统的 atime 挂载选项，重启后访问顺序依然有效
+        """
+        try:
+            stat = os.stat(path)
+            now = time.time()
+            if now - stat.st_atime >= self.TOUCH_INTERVAL:
+                os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _last_access(stat: os.stat_result) -> float:
+        return max(stat.st_atime, stat.st_mtime)
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        """列出所有目录中的图片文件（跳过索引和临时文件）"""
+        files = []
+        for name, directory in self.directories.items():
+            if not directory.exists():
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    files.append({
+                        "directory": name,
+                        "filename": entry.name,
+                        "path": entry.path,
+                        "size": stat.st_size,
+                        "last_access": self._last_access(stat),
+                    })
+        return files
+
+    def _load_references(self) -> Set[str]:
+        if self._reference_provider is None:
+            return set()
+        return self._reference_provider()
+
+    def plan(self) -> Dict[str, Any]:
+        """
+        计算本轮需要清理的文件，不做任何删除
+
+        Returns:
+            清理报告：总大小、预算、候选文件及原因、受保护的文件数等
+
+        Raises:
+            Exception: 读取引用失败时向上抛出，调用方应放弃本轮清理
+        """
+        now = time.time()
+        files = self._scan()
+        references = self._load_references()
+
+        total_bytes = sum(f["size"] for f in files)
+        directories = {
+            name: {"files": 0, "bytes": 0} for name in self.directories
+        }
+        for f in files:
+            directories[f["directory"]]["files"] += 1
+            directories[f["directory"]]["bytes"] += f["size"]
+
+        protected = 0
+        in_grace = 0
+        evictable = []
+        for f in files:
+            if f["filename"] in references:
+                protected += 1
+            elif now - f["last_access"] < self.grace_seconds:
+                in_grace += 1
+            else:
+                evictable.append(f)
+        # 最久未访问的排在前面
+        evictable.sort(key=lambda f: f["last_access"])
+
+        candidates = []
+        remaining_bytes = total_bytes
+        for f in evictable:
+            if self.max_age and now - f["last_access"] > self.max_age:
+                reason = "age"
+            elif self.max_bytes and remaining_bytes > self.max_bytes:
+                reason = "size"
+            else:
+                continue
+            candidates.append({
+                "directory": f["directory"],
+                "filename": f["filename"],
+                "size": f["size"],
+                "last_access": f["last_access"],
+                "reason": reason,
+            })
+            remaining_bytes -= f["size"]
+
+        return {
+            "generated_at": now,
+            "dry_run": self.dry_run,
+            "total_files": len(files),
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age / 86400,
+            "directories": directories,
+            "protected_files": protected,
+            "grace_files": in_grace,
+            "candidates": candidates,
+            "reclaimable_bytes": total_bytes - remaining_bytes,
+        }
+
+    def run_once(self, dry_run: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        执行一轮清理，分批删除并在批次之间暂停，避免长时间占用磁盘
+
+        Args:
+            dry_run: 覆盖实例上的 dry_run 设置
+
+        Returns:
+            本轮的清理报告，附带实际删除的文件数和字节数
+        """
+        dry_run = self.dry_run if dry_run is None else dry_run
+        with self._run_lock:
+            report = self.plan()
+            report["dry_run"] = dry_run
+            report["deleted_files"] = 0
+            report["deleted_bytes"] = 0
+
+            if not dry_run:
+                for start in range(0, len(report["candidates"]), self.batch_size):
+                    if self._stop_event.is_set():
+                        break
+                    for candidate in report["candidates"][start:start + self.batch_size]:
+                        if self._delete(candidate):
+                            report["deleted_files"] += 1
+                            report["deleted_bytes"] += candidate["size"]
+                    # 让出给请求处理
+                    self._stop_event.wait(0.05)
+
+            self.runs += 1
+            self.deleted_files += report["deleted_files"]
+            self.deleted_bytes += report["deleted_bytes"]
+            self.last_report = report
+        return report
+
+    def _delete(self, candidate: Dict[str, Any]) -> bool:
+        """删除单个文件；删除前再次确认期间没有被访问"""
+        path = self.directories[candidate["directory"]] / candidate["filename"]
+        try:
+            stat = path.stat()
+            if self._last_access(stat) > candidate["last_access"]:
+                return False
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            print(f"⚠ 清理图片失败: {path}: {e}")
+            return False
+
+        for hook in self._delete_hooks.get(candidate["directory"], []):
+            try:
+                hook(candidate["filename"])
+            except Exception as e:
+                print(f"⚠ 清理图片索引失败: {candidate['filename']}: {e}")
+        return True
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                report = self.run_once()
+                if report["dry_run"] and report["candidates"]:
+                    print(f"✓ 图片清理（演练）: 可清理 {len(report['candidates'])} 个文件, {report['reclaimable_bytes']} 字节")
+                elif report["deleted_files"]:
+                    print(f"✓ 图片清理: 已删除 {report['deleted_files']} 个文件, {report['deleted_bytes']} 字节")
+            except Exception as e:
+                # 无法确认引用关系时宁可不删
+                print(f"⚠ 图片清理跳过本轮: {e}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="image-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """清理统计信息"""
+        return {
+            "enabled": self._thread is not None and self._thread.is_alive(),
+            "dry_run": self.dry_run,
+            "runs": self.runs,
+            "deleted_files": self.deleted_files,
+            "deleted_bytes": self.deleted_bytes,
+            "last_run": self.last_report["generated_at"] if self.last_report else None,
+        }
+
+
+# 全局清理服务实例
+retention_service = RetentionService(
+    # 缩略图随原图删除；同时计入预算，原图在清理服务之外被删除时留下的缩略图也会按访问时间清理
+    {"img": "workspace/img", "upload_img": "workspace/upload_img", "variants": "workspace/img/variants"},
+    max_bytes=RETENTION_MAX_BYTES,
+    max_age_days=RETENTION_MAX_AGE_DAYS,
+    grace_seconds=RETENTION_GRACE_SECONDS,
+    interval=RETENTION_INTERVAL_SECONDS,
+    batch_size=RETENTION_BATCH_SIZE,
+    dry_run=RETENTION_DRY_RUN,
+)